@@ -1,15 +1,51 @@
 import duckdb
 from pathlib import Path
 import os
+import threading
+from app.database.rollups import (
+    create_rollup_tables, backfill_session_rollups,
+    create_period_rollup_tables, backfill_period_rollups
+)
 
 # 数据库文件路径（相对于项目根目录）
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 DB_PATH = os.getenv("DUCKDB_PATH", str(PROJECT_ROOT / "data" / "procurement.duckdb"))
 
+class ThreadLocalConnection:
+    """
+    线程安全的 DuckDB 连接代理
+
+    DuckDB 连接对象不能被多个线程同时使用，而服务在启动时持有连接、查询在线程池中并发执行。
+    代理为每个线程通过 cursor() 创建独立连接（共享同一数据库实例），
+    事务与 register() 注册的 DataFrame 均只在当前线程内生效。
+    """
+
+    def __init__(self, path: str):
+        self._base = duckdb.connect(path)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._lock:
+                conn = self._local.conn = self._base.cursor()
+        return conn
+
+    def __getattr__(self, name):
+        return getattr(self._connection(), name)
+
+    def close(self):
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
 def get_connection():
-    """获取 DuckDB 连接"""
+    """获取 DuckDB 连接 (线程安全代理)"""
     Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
-    return duckdb.connect(DB_PATH)
+    return ThreadLocalConnection(DB_PATH)
 
 def init_database():
     """初始化数据库表结构"""
@@ -30,14 +66,42 @@ def init_database():
         )
     """)
     
-    # 创建 procurement_records 表
+    # 创建维度表（字典编码：供应商 / 品类 / 零件），代理键跨 Session 稳定
+    conn.execute("CREATE SEQUENCE IF NOT EXISTS dim_supplier_seq START 1")
     conn.execute("""
-        CREATE TABLE IF NOT EXISTS procurement_records (
-            session_id VARCHAR,
-            pns VARCHAR,
+        CREATE TABLE IF NOT EXISTS dim_supplier (
+            supplier_id INTEGER PRIMARY KEY DEFAULT nextval('dim_supplier_seq'),
+            supplier_name VARCHAR NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    conn.execute("CREATE SEQUENCE IF NOT EXISTS dim_commodity_seq START 1")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dim_commodity (
+            commodity_id INTEGER PRIMARY KEY DEFAULT nextval('dim_commodity_seq'),
+            commodity_name VARCHAR NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    conn.execute("CREATE SEQUENCE IF NOT EXISTS dim_part_seq START 1")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dim_part (
+            part_id INTEGER PRIMARY KEY DEFAULT nextval('dim_part_seq'),
+            pns VARCHAR NOT NULL UNIQUE,
             part_desc VARCHAR,
-            commodity VARCHAR,
-            supplier VARCHAR,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # 创建 procurement_facts 事实表（以维度代理键存储）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS procurement_facts (
+            session_id VARCHAR,
+            part_id INTEGER,
+            supplier_id INTEGER,
+            commodity_id INTEGER,
             currency VARCHAR,
             quantity DECIMAL(15,2),
             price DECIMAL(15,2),
@@ -49,9 +113,89 @@ def init_database():
             opportunity DECIMAL(15,2),
             gap_percent DECIMAL(5,2),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (session_id, pns, supplier)
+            part_desc VARCHAR,  -- 本 Session 上传的零件描述 (dim_part 只保留首次出现的描述)
+            PRIMARY KEY (session_id, part_id, supplier_id)
         )
     """)
+    _add_fact_part_desc(conn)
+    
+    # 旧版 procurement_records 为实体表，迁移到星型模型
+    _migrate_legacy_records(conn)
+    
+    # procurement_records 视图：还原原有宽表结构，兼容按名称查询的场景
+    conn.execute("""
+        CREATE OR REPLACE VIEW procurement_records AS
+        SELECT
+            f.session_id,
+            p.pns,
+            f.part_desc,
+            c.commodity_name AS commodity,
+            s.supplier_name AS supplier,
+            f.currency,
+            f.quantity,
+            f.price,
+            f.apv,
+            f.covered_apv,
+            f.target_cost,
+            f.target_spend,
+            f.gap_to_target,
+            f.opportunity,
+            f.gap_percent,
+            f.created_at
+        FROM procurement_facts f
+        JOIN dim_part p ON p.part_id = f.part_id
+        JOIN dim_supplier s ON s.supplier_id = f.supplier_id
+        JOIN dim_commodity c ON c.commodity_id = f.commodity_id
+    """)
+    
+    # 创建 Session 级物化汇总表，并为旧 Session 补建
+    create_rollup_tables(conn)
+    backfill_session_rollups(conn)
+    
+    # 创建 Period 级汇总表（跨期趋势），并为已有期间补建
+    create_period_rollup_tables(conn)
+    backfill_period_rollups(conn)
+    
+    # 创建 session_diffs / session_diff_rows 表（两次 Session 的行级差异，按 Session 对缓存）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_diffs (
+            base_session_id VARCHAR,
+            compare_session_id VARCHAR,
+            added_count INTEGER,
+            removed_count INTEGER,
+            changed_count INTEGER,
+            unchanged_count INTEGER,
+            opportunity_delta DECIMAL(18,2),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (base_session_id, compare_session_id)
+        )
+    """)
+    
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_diff_rows (
+            base_session_id VARCHAR,
+            compare_session_id VARCHAR,
+            part_id INTEGER,
+            supplier_id INTEGER,
+            commodity_id INTEGER,
+            change_type VARCHAR,
+            changed_fields VARCHAR[],
+            base_price DECIMAL(15,2),
+            compare_price DECIMAL(15,2),
+            base_apv DECIMAL(15,2),
+            compare_apv DECIMAL(15,2),
+            base_target_cost DECIMAL(15,2),
+            compare_target_cost DECIMAL(15,2),
+            base_gap_percent DECIMAL(5,2),
+            compare_gap_percent DECIMAL(5,2),
+            base_opportunity DECIMAL(15,2),
+            compare_opportunity DECIMAL(15,2),
+            opportunity_delta DECIMAL(15,2),
+            base_part_desc VARCHAR,  -- 两次 Session 各自上传的零件描述
+            compare_part_desc VARCHAR
+        )
+    """)
+    _add_diff_part_desc(conn)
     
     # 创建 part_cost_sessions 表（零部件成本分析会话）
     conn.execute("""
@@ -108,8 +252,191 @@ def init_database():
         )
     """)
     
+    # 创建 llm_report_cache 表（LLM 报告缓存，键为 Prompt + 模型参数的哈希）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_report_cache (
+            cache_key VARCHAR PRIMARY KEY,
+            session_id VARCHAR,
+            context_type VARCHAR,
+            context_value VARCHAR,
+            model VARCHAR,
+            temperature DOUBLE,
+            content VARCHAR,
+            hit_count INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_hit_at TIMESTAMP
+        )
+    """)
+    
+    # 创建 llm_report_jobs / llm_report_job_items 表（批量报告任务，api_key 不落库）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_report_jobs (
+            job_id VARCHAR PRIMARY KEY,
+            session_id VARCHAR,
+            scope VARCHAR,
+            status VARCHAR,
+            model VARCHAR,
+            concurrency INTEGER,
+            requests_per_minute INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_report_job_items (
+            job_id VARCHAR,
+            context_value VARCHAR,
+            sort_order INTEGER,
+            status VARCHAR,
+            cached BOOLEAN DEFAULT FALSE,
+            content VARCHAR,
+            error VARCHAR,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            PRIMARY KEY (job_id, context_value)
+        )
+    """)
+    
+    # 创建 llm_call_metrics 表（每次 LLM 调用 / 缓存回放的耗时与 Token 用量）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_call_metrics (
+            call_id VARCHAR PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            session_id VARCHAR,
+            context_type VARCHAR,
+            context_value VARCHAR,
+            source VARCHAR,
+            model VARCHAR,
+            status VARCHAR,
+            context_ms DOUBLE,
+            ttft_ms DOUBLE,
+            duration_ms DOUBLE,
+            tokens_per_second DOUBLE,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            usage_reported BOOLEAN DEFAULT FALSE,
+            error VARCHAR
+        )
+    """)
+    
+    conn.execute("""
+        DELETE FROM llm_call_metrics
+        WHERE created_at < CURRENT_TIMESTAMP - to_days(?)
+    """, [int(os.getenv("LLM_METRICS_RETENTION_DAYS", "30"))])
+    
+    # 进程重启后，未完成的任务无法继续 (api_key 只在内存中)
+    conn.execute("""
+        UPDATE llm_report_jobs SET status = 'interrupted', finished_at = CURRENT_TIMESTAMP
+        WHERE status IN ('pending', 'running')
+    """)
+    
     conn.close()
     print("Database initialized successfully.")
 
+def _migrate_legacy_records(conn):
+    """
+    将旧版 procurement_records 实体表迁移为 维度表 + procurement_facts
+    
+    迁移完成后删除旧表，由同名视图替代
+    """
+    result = conn.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_name = 'procurement_records'"
+    ).fetchone()
+    if not result or result[0] != 'BASE TABLE':
+        return
+    
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        populate_dimensions(conn, "procurement_records")
+        conn.execute("""
+            INSERT INTO procurement_facts (
+                session_id, part_id, supplier_id, commodity_id, currency,
+                quantity, price, apv, covered_apv,
+                target_cost, target_spend, gap_to_target, opportunity, gap_percent,
+                created_at, part_desc
+            )
+            SELECT
+                r.session_id, p.part_id, s.supplier_id, c.commodity_id, r.currency,
+                r.quantity, r.price, r.apv, r.covered_apv,
+                r.target_cost, r.target_spend, r.gap_to_target, r.opportunity, r.gap_percent,
+                r.created_at, r.part_desc
+            FROM procurement_records r
+            JOIN dim_part p ON p.pns = r.pns
+            JOIN dim_supplier s ON s.supplier_name = r.supplier
+            JOIN dim_commodity c ON c.commodity_name = r.commodity
+        """)
+        conn.execute("DROP TABLE procurement_records")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    print("Migrated legacy procurement_records to star schema.")
+
+def _add_diff_part_desc(conn):
+    """
+    早期版本的差异缓存没有按 Session 记录零件描述：补列并清空缓存 (下次对比时重新物化)
+    """
+    exists = conn.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'session_diff_rows' AND column_name = 'base_part_desc'
+    """).fetchone()
+    if exists:
+        return
+    conn.execute("ALTER TABLE session_diff_rows ADD COLUMN base_part_desc VARCHAR")
+    conn.execute("ALTER TABLE session_diff_rows ADD COLUMN compare_part_desc VARCHAR")
+    conn.execute("DELETE FROM session_diff_rows")
+    conn.execute("DELETE FROM session_diffs")
+
+
+def _add_fact_part_desc(conn):
+    """
+    早期版本的事实表没有 part_desc 列 (描述只存 dim_part)：补列并以 dim_part 的描述回填
+    """
+    exists = conn.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'procurement_facts' AND column_name = 'part_desc'
+    """).fetchone()
+    if exists:
+        return
+    conn.execute("ALTER TABLE procurement_facts ADD COLUMN part_desc VARCHAR")
+    conn.execute("""
+        UPDATE procurement_facts f SET part_desc = p.part_desc
+        FROM dim_part p
+        WHERE p.part_id = f.part_id
+    """)
+
+def populate_dimensions(conn, source: str):
+    """
+    将来源表/视图中新出现的供应商、品类、零件写入维度表
+    
+    Args:
+        conn: DuckDB 连接（调用方负责事务）
+        source: 含 pns / part_desc / commodity / supplier 列的表名或已注册的 DataFrame 名
+    """
+    conn.execute(f"""
+        INSERT INTO dim_supplier (supplier_name)
+        SELECT DISTINCT src.supplier
+        FROM {source} src
+        WHERE src.supplier IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM dim_supplier d WHERE d.supplier_name = src.supplier)
+    """)
+    conn.execute(f"""
+        INSERT INTO dim_commodity (commodity_name)
+        SELECT DISTINCT src.commodity
+        FROM {source} src
+        WHERE src.commodity IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM dim_commodity d WHERE d.commodity_name = src.commodity)
+    """)
+    # 维度表中同一 PN 的描述以首次出现为准 (用于检索)；各 Session 自己的描述保存在事实表
+    conn.execute(f"""
+        INSERT INTO dim_part (pns, part_desc)
+        SELECT src.pns, first(src.part_desc)
+        FROM {source} src
+        WHERE src.pns IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM dim_part d WHERE d.pns = src.pns)
+        GROUP BY src.pns
+    """)
+
 if __name__ == "__main__":
     init_database()
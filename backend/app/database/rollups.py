@@ -0,0 +1,264 @@
+"""
+物化汇总表 (Rollups)
+
+Session 在 confirm_mapping 完成后不再变化，因此在入库事务中一次性写入
+Session / Session×Commodity / Session×Supplier / Session×Commodity×Supplier 四级汇总，
+Dashboard 类接口直接读取汇总表，耗时不再随明细行数增长。
+Period 级汇总由各期最新 Session 的汇总复制而来，新增一期只刷新该期。
+"""
+
+# 各级汇总共用的度量列
+_MEASURE_COLUMNS = """
+            total_apv DECIMAL(18,2),
+            covered_apv DECIMAL(18,2),
+            total_opportunity DECIMAL(18,2),
+            pns_count INTEGER,
+            pns_covered INTEGER,
+"""
+
+_MEASURE_SELECT = """
+            SUM(apv),
+            SUM(covered_apv),
+            SUM(opportunity),
+            COUNT(DISTINCT part_id),
+            COUNT(DISTINCT CASE WHEN covered_apv > 0 THEN part_id END),
+"""
+
+
+def create_rollup_tables(conn):
+    """创建汇总表结构"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS agg_session (
+            session_id VARCHAR PRIMARY KEY,
+            {_MEASURE_COLUMNS}
+            supplier_count INTEGER,
+            suppliers_covered INTEGER,
+            record_count INTEGER
+        )
+    """)
+
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS agg_session_commodity (
+            session_id VARCHAR,
+            commodity_id INTEGER,
+            {_MEASURE_COLUMNS}
+            supplier_count INTEGER,
+            suppliers_covered INTEGER,
+            PRIMARY KEY (session_id, commodity_id)
+        )
+    """)
+
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS agg_session_supplier (
+            session_id VARCHAR,
+            supplier_id INTEGER,
+            {_MEASURE_COLUMNS}
+            commodity_count INTEGER,
+            main_commodity_id INTEGER,
+            PRIMARY KEY (session_id, supplier_id)
+        )
+    """)
+
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS agg_session_commodity_supplier (
+            session_id VARCHAR,
+            commodity_id INTEGER,
+            supplier_id INTEGER,
+            {_MEASURE_COLUMNS}
+            PRIMARY KEY (session_id, commodity_id, supplier_id)
+        )
+    """)
+
+
+def delete_session_rollups(conn, session_id: str):
+    """删除指定 Session 的全部汇总行"""
+    for table in ("agg_session", "agg_session_commodity",
+                  "agg_session_supplier", "agg_session_commodity_supplier"):
+        conn.execute(f"DELETE FROM {table} WHERE session_id = ?", [session_id])
+
+
+def build_session_rollups(conn, session_id: str):
+    """
+    根据 procurement_facts 重建指定 Session 的汇总表
+
+    调用方负责事务，保证汇总与明细同时可见
+    """
+    delete_session_rollups(conn, session_id)
+
+    conn.execute(f"""
+        INSERT INTO agg_session
+        SELECT
+            session_id,
+            {_MEASURE_SELECT}
+            COUNT(DISTINCT supplier_id),
+            COUNT(DISTINCT CASE WHEN covered_apv > 0 THEN supplier_id END),
+            COUNT(*)
+        FROM procurement_facts
+        WHERE session_id = ?
+        GROUP BY session_id
+    """, [session_id])
+
+    conn.execute(f"""
+        INSERT INTO agg_session_commodity
+        SELECT
+            session_id,
+            commodity_id,
+            {_MEASURE_SELECT}
+            COUNT(DISTINCT supplier_id),
+            COUNT(DISTINCT CASE WHEN covered_apv > 0 THEN supplier_id END)
+        FROM procurement_facts
+        WHERE session_id = ?
+        GROUP BY session_id, commodity_id
+    """, [session_id])
+
+    conn.execute(f"""
+        INSERT INTO agg_session_supplier
+        SELECT
+            session_id,
+            supplier_id,
+            {_MEASURE_SELECT}
+            COUNT(DISTINCT commodity_id),
+            -- 主营 Commodity (取 APV 最大的那个)
+            arg_max(commodity_id, apv)
+        FROM procurement_facts
+        WHERE session_id = ?
+        GROUP BY session_id, supplier_id
+    """, [session_id])
+
+    conn.execute(f"""
+        INSERT INTO agg_session_commodity_supplier
+        SELECT
+            session_id,
+            commodity_id,
+            supplier_id,
+            {_MEASURE_SELECT.rstrip().rstrip(',')}
+        FROM procurement_facts
+        WHERE session_id = ?
+        GROUP BY session_id, commodity_id, supplier_id
+    """, [session_id])
+
+
+def backfill_session_rollups(conn):
+    """为已有明细但缺少汇总的 Session 补建汇总（旧库升级）"""
+    missing = conn.execute("""
+        SELECT DISTINCT f.session_id
+        FROM procurement_facts f
+        WHERE NOT EXISTS (SELECT 1 FROM agg_session a WHERE a.session_id = f.session_id)
+    """).fetchall()
+
+    for (session_id,) in missing:
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            build_session_rollups(conn, session_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    if missing:
+        print(f"Backfilled rollups for {len(missing)} session(s).")
+
+
+# ============ Period 级汇总 (跨期趋势) ============
+
+def create_period_rollup_tables(conn):
+    """
+    创建 Period 级汇总表
+
+    每个 Period 取最新一次完成入库的 Session 作为该期数据，
+    行结构与对应的 agg_session* 表一致，另记录来源 session_id
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS agg_period (
+            period VARCHAR PRIMARY KEY,
+            session_id VARCHAR,
+            {_MEASURE_COLUMNS}
+            supplier_count INTEGER,
+            suppliers_covered INTEGER,
+            record_count INTEGER,
+            refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS agg_period_commodity (
+            period VARCHAR,
+            session_id VARCHAR,
+            commodity_id INTEGER,
+            {_MEASURE_COLUMNS}
+            supplier_count INTEGER,
+            suppliers_covered INTEGER,
+            PRIMARY KEY (period, commodity_id)
+        )
+    """)
+
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS agg_period_supplier (
+            period VARCHAR,
+            session_id VARCHAR,
+            supplier_id INTEGER,
+            {_MEASURE_COLUMNS}
+            commodity_count INTEGER,
+            main_commodity_id INTEGER,
+            PRIMARY KEY (period, supplier_id)
+        )
+    """)
+
+
+def refresh_period_rollups(conn, period: str):
+    """
+    增量刷新单个 Period 的汇总：只重写该 Period 的行，其余历史期间不受影响
+
+    调用方负责事务
+    """
+    for table in ("agg_period", "agg_period_commodity", "agg_period_supplier"):
+        conn.execute(f"DELETE FROM {table} WHERE period = ?", [period])
+
+    latest = conn.execute("""
+        SELECT session_id
+        FROM sessions
+        WHERE period = ? AND status = 'completed'
+        ORDER BY upload_time DESC, created_at DESC
+        LIMIT 1
+    """, [period]).fetchone()
+    if not latest:
+        return
+
+    session_id = latest[0]
+    conn.execute("""
+        INSERT INTO agg_period
+        SELECT ?, a.*, CURRENT_TIMESTAMP
+        FROM agg_session a
+        WHERE a.session_id = ?
+    """, [period, session_id])
+    conn.execute("""
+        INSERT INTO agg_period_commodity
+        SELECT ?, a.*
+        FROM agg_session_commodity a
+        WHERE a.session_id = ?
+    """, [period, session_id])
+    conn.execute("""
+        INSERT INTO agg_period_supplier
+        SELECT ?, a.*
+        FROM agg_session_supplier a
+        WHERE a.session_id = ?
+    """, [period, session_id])
+
+
+def backfill_period_rollups(conn):
+    """为已有完成 Session 但缺少 Period 汇总的期间补建（旧库升级）"""
+    missing = conn.execute("""
+        SELECT DISTINCT s.period
+        FROM sessions s
+        WHERE s.status = 'completed'
+          AND NOT EXISTS (SELECT 1 FROM agg_period p WHERE p.period = s.period)
+    """).fetchall()
+
+    for (period,) in missing:
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            refresh_period_rollups(conn, period)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
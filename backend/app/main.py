@@ -1,6 +1,12 @@
-from fastapi import FastAPI
-from app.routers import upload, data, analytics, llm, cost_variance
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.routers import upload, data, analytics, llm, cost_variance, search
 from app.database.init import init_database
+from app.services.executor import executor_stats, shutdown_executors
+from app.services.admission import AdmissionRejected, upload_admission
+from app.services.llm_clients import llm_clients
+from app.services.report_job_service import cancel_running_jobs
+from app.services.report_streams import report_streams
 
 app = FastAPI(title="Nexteer Procurement BI API", version="1.0.0")
 
@@ -12,6 +18,13 @@ app.include_router(data.router)
 app.include_router(analytics.router)
 app.include_router(llm.router)
 app.include_router(cost_variance.router)
+app.include_router(search.router)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """上传准入被拒绝：429 (附 Retry-After) 或 413"""
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=headers)
 
 @app.get("/")
 def read_root():
@@ -20,3 +33,20 @@ def read_root():
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@app.get("/metrics")
+async def metrics():
+    """线程池队列深度与耗时统计、上传准入状态、LLM 客户端池、报告流"""
+    return {
+        "executors": executor_stats(),
+        "admission": upload_admission.stats(),
+        "llm_clients": llm_clients.stats(),
+        "report_streams": report_streams.stats()
+    }
+
+@app.on_event("shutdown")
+async def shutdown():
+    await cancel_running_jobs()
+    await report_streams.close_all()
+    await llm_clients.close_all()
+    shutdown_executors(wait=False)
@@ -1,15 +1,19 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import List, Dict, Any
 from app.services.analytics_service import AnalyticsService
+from app.services.result_cache import analytics_cache
+from app.services.session_diff_service import SessionDiffService
+from app.services.executor import run_analytics
 
 router = APIRouter(prefix="/api/analytics", tags=["Analytics"])
 service = AnalyticsService()
+diff_service = SessionDiffService()
 
 @router.get("/summary/{session_id}")
 async def get_kpi_summary(session_id: str):
     """获取 Session 的 6 大核心 KPI"""
     try:
-        return service.get_kpi_summary(session_id)
+        return await run_analytics(service.get_kpi_summary, session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -17,7 +21,7 @@ async def get_kpi_summary(session_id: str):
 async def get_commodity_overview(session_id: str):
     """获取按 Commodity 分组的概览数据"""
     try:
-        return service.get_commodity_overview(session_id)
+        return await run_analytics(service.get_commodity_overview, session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -25,7 +29,7 @@ async def get_commodity_overview(session_id: str):
 async def get_top_suppliers(session_id: str, limit: int = 20):
     """获取 Top Suppliers 列表"""
     try:
-        return service.get_top_suppliers(session_id, limit)
+        return await run_analytics(service.get_top_suppliers, session_id, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -33,7 +37,7 @@ async def get_top_suppliers(session_id: str, limit: int = 20):
 async def get_top_projects(session_id: str, limit: int = 20):
     """获取 Top Projects (PNs) 列表"""
     try:
-        return service.get_top_projects(session_id, limit)
+        return await run_analytics(service.get_top_projects, session_id, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -41,7 +45,7 @@ async def get_top_projects(session_id: str, limit: int = 20):
 async def get_commodity_kpi(session_id: str, commodity: str):
     """获取指定 Commodity 的 KPI 汇总"""
     try:
-        return service.get_commodity_kpi(session_id, commodity)
+        return await run_analytics(service.get_commodity_kpi, session_id, commodity)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -49,7 +53,7 @@ async def get_commodity_kpi(session_id: str, commodity: str):
 async def get_commodity_top_suppliers(session_id: str, commodity: str, limit: int = 5):
     """获取指定 Commodity 的 Top Suppliers"""
     try:
-        return service.get_commodity_top_suppliers(session_id, commodity, limit)
+        return await run_analytics(service.get_commodity_top_suppliers, session_id, commodity, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -57,23 +61,151 @@ async def get_commodity_top_suppliers(session_id: str, commodity: str, limit: in
 async def get_supplier_top_pns(session_id: str, supplier: str, limit: int = 10):
     """获取指定 Supplier 的 Top PNs"""
     try:
-        return service.get_supplier_top_pns(session_id, supplier, limit)
+        return await run_analytics(service.get_supplier_top_pns, session_id, supplier, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/supplier/{session_id}/{supplier:path}/profile")
+async def get_supplier_profile(session_id: str, supplier: str, top_n: int = Query(10, ge=1, le=100)):
+    """获取指定 Supplier 的画像 (KPI / 品类构成 / Top PNs / 独家供应)"""
+    try:
+        return await run_analytics(service.get_supplier_profile, session_id, supplier, top_n)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/opportunity-matrix/{session_id}")
-async def get_opportunity_matrix(session_id: str, commodity: str = Query(None)):
-    """获取象限分析数据 (Opportunity Matrix)"""
+async def get_opportunity_matrix(
+    session_id: str,
+    commodity: str = Query(None),
+    mode: str = Query("full", pattern="^(full|binned)$"),
+    top_n: int = Query(500, ge=0, le=10000),
+    bins: int = Query(40, ge=1, le=200),
+    apv_scale: str = Query("log", pattern="^(log|linear)$")
+):
+    """
+    获取象限分析数据 (Opportunity Matrix)
+    
+    - mode=full: 返回全部 PN
+    - mode=binned: 返回 Top-N 点 + 其余 PN 的 APV × Gap% 密度网格，返回体大小有界
+    """
+    try:
+        if mode == "binned":
+            return await run_analytics(
+                service.get_opportunity_matrix_binned, session_id, commodity, top_n, bins, apv_scale
+            )
+        return await run_analytics(service.get_opportunity_matrix, session_id, commodity)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/matrix-stats/{session_id}")
+async def get_matrix_stats(
+    session_id: str,
+    commodity: str = Query(None),
+    apv_threshold: str = Query("median"),
+    gap_threshold: str = Query("median"),
+    approx: bool = Query(False)
+):
+    """获取象限分布统计 (阈值支持 median / p<N> / 绝对值，approx=true 时使用近似分位数)"""
     try:
-        return service.get_opportunity_matrix(session_id, commodity)
+        return await run_analytics(
+            service.get_matrix_stats, session_id, commodity, apv_threshold, gap_threshold, approx
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/concentration/{session_id}")
-async def get_supplier_concentration(session_id: str, commodity: str = Query(None)):
-    """获取供应商集中度 (CR3, CR5)"""
+async def get_supplier_concentration(
+    session_id: str,
+    commodity: str = Query(None),
+    top_k: int = Query(10, ge=0, le=1000),
+    cr: List[int] = Query([3, 5])
+):
+    """获取供应商集中度 (CRn, HHI)"""
+    if any(n < 1 for n in cr):
+        raise HTTPException(status_code=400, detail="cr levels must be positive integers")
+    try:
+        return await run_analytics(service.get_supplier_concentration, session_id, commodity, top_k, cr)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/bundle/{session_id}")
+async def get_dashboard_bundle(session_id: str, supplier_limit: int = 20, project_limit: int = 20,
+                               approx: bool = False):
+    """获取 Dashboard 整页数据 (KPI / 品类概览 / Top Suppliers / Top Projects / 集中度，单次扫描)"""
+    try:
+        return await run_analytics(
+            service.get_dashboard_bundle, session_id, None, supplier_limit, project_limit, approx
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/commodity/{session_id}/{commodity:path}/bundle")
+async def get_commodity_bundle(session_id: str, commodity: str, supplier_limit: int = 5, project_limit: int = 20,
+                               approx: bool = False):
+    """获取 Commodity 详情页整页数据 (KPI / Top Suppliers / Top Projects / 集中度，单次扫描)"""
+    try:
+        return await run_analytics(
+            service.get_dashboard_bundle, session_id, commodity, supplier_limit, project_limit, approx
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/trends/kpi")
+async def get_kpi_trend(periods: List[str] = Query(None), session_ids: List[str] = Query(None)):
+    """获取跨期 KPI 趋势 (按 periods 或 session_ids，均不指定时返回全部期间)"""
+    try:
+        return await run_analytics(service.get_kpi_trend, periods, session_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/trends/commodity")
+async def get_commodity_trend(
+    periods: List[str] = Query(None),
+    session_ids: List[str] = Query(None),
+    commodity: List[str] = Query(None),
+    limit: int = Query(10, ge=1, le=100)
+):
+    """获取跨期 Commodity 序列 (未指定 commodity 时取 APV 前 limit 个)"""
+    try:
+        return await run_analytics(service.get_commodity_trend, periods, session_ids, commodity, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/trends/supplier")
+async def get_supplier_trend(
+    periods: List[str] = Query(None),
+    session_ids: List[str] = Query(None),
+    supplier: List[str] = Query(None),
+    limit: int = Query(10, ge=1, le=100)
+):
+    """获取跨期 Supplier 序列 (未指定 supplier 时取 APV 前 limit 个)"""
+    try:
+        return await run_analytics(service.get_supplier_trend, periods, session_ids, supplier, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/diff/{base_session_id}/{compare_session_id}")
+async def get_session_diff(
+    base_session_id: str,
+    compare_session_id: str,
+    change_type: List[str] = Query(None),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500)
+):
+    """获取两次 Session 的行级差异 (按 PN + Supplier 匹配，按 Opportunity 变化排序)"""
     try:
-        return service.get_supplier_concentration(session_id, commodity)
+        return await run_analytics(
+            diff_service.get_diff, base_session_id, compare_session_id, change_type, page, page_size
+        )
+    except ValueError as e:
+        status = 404 if "not found" in str(e) else 400
+        raise HTTPException(status_code=status, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """获取分析结果缓存的命中统计"""
+    return analytics_cache.stats()
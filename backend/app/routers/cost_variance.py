@@ -1,11 +1,14 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Query
 from fastapi.responses import StreamingResponse
-from typing import Optional
+from typing import Optional, List
 from app.services.cost_variance_service import CostVarianceService
 from app.schemas.cost_variance import (
     UploadCostSheetResponse, GetCostTreeResponse, GetSessionsResponse, SessionInfo
 )
 import io
+import os
+from app.services.executor import run_ingest, run_analytics, iterate_in_ingest
+from app.services.admission import upload_admission
 
 router = APIRouter(prefix="/api/cost-variance", tags=["Cost Variance Analysis"])
 service = CostVarianceService()
@@ -19,36 +22,38 @@ async def upload_cost_sheet(file: UploadFile = File(...)):
     - 基于固定行号解析
     - 返回会话ID和基本信息
     """
-    try:
-        # 读取文件内容
-        content = await file.read()
-        
-        # 验证文件格式
-        if not file.filename.endswith(('.xlsx', '.xls', '.xlsm')):
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid file format. Only .xlsx, .xls, and .xlsm files are supported."
-            )
-        
-        # 处理上传
-        response = service.process_upload(content, file.filename)
-        
-        return response
-    
-    except ValueError as e:
-        import traceback
-        traceback.print_exc()  # 打印完整堆栈
-        raise HTTPException(status_code=400, detail=f"Parsing error: {str(e)}")
-    except Exception as e:
-        import traceback
-        traceback.print_exc()  # 打印完整堆栈
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    # 验证文件格式
+    if not file.filename.endswith(('.xlsx', '.xls', '.xlsm')):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid file format. Only .xlsx, .xls, and .xlsm files are supported."
+        )
+
+    # 先申请解析名额再读取文件 (准入拒绝由全局处理器返回 429 / 413)
+    async with upload_admission.admit(file.size or 0):
+        try:
+            # 读取文件内容
+            content = await file.read()
+
+            # 处理上传
+            response = await run_ingest(service.process_upload, content, file.filename)
+
+            return response
+
+        except ValueError as e:
+            import traceback
+            traceback.print_exc()  # 打印完整堆栈
+            raise HTTPException(status_code=400, detail=f"Parsing error: {str(e)}")
+        except Exception as e:
+            import traceback
+            traceback.print_exc()  # 打印完整堆栈
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
 @router.get("/tree/{session_id}", response_model=GetCostTreeResponse)
 async def get_cost_tree(
     session_id: str,
-    view: str = Query('by_process', regex='^(by_process|by_type)$')
+    view: str = Query('by_process', pattern='^(by_process|by_type)$')
 ):
     """
     获取成本树
@@ -59,7 +64,7 @@ async def get_cost_tree(
       - by_type: 按成本类型分组
     """
     try:
-        response = service.get_cost_tree(session_id, view)
+        response = await run_analytics(service.get_cost_tree, session_id, view)
         return response
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -75,7 +80,7 @@ async def get_sessions(limit: int = Query(10, ge=1, le=100)):
     - limit: 返回数量 (1-100)
     """
     try:
-        response = service.get_sessions(limit)
+        response = await run_analytics(service.get_sessions, limit)
         return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -89,7 +94,7 @@ async def get_session_info(session_id: str):
     - session_id: 会话ID
     """
     try:
-        session_info = service.get_session_info(session_id)
+        session_info = await run_analytics(service.get_session_info, session_id)
         if not session_info:
             raise HTTPException(status_code=404, detail="Session not found")
         return session_info
@@ -107,7 +112,7 @@ async def delete_session(session_id: str):
     - session_id: 会话ID
     """
     try:
-        success = service.delete_session(session_id)
+        success = await run_ingest(service.delete_session, session_id)
         if not success:
             raise HTTPException(status_code=404, detail="Session not found or deletion failed")
         return {"message": "Session deleted successfully", "session_id": session_id}
@@ -117,14 +122,54 @@ async def delete_session(session_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _stream_file(path: str, chunk_size: int = 1024 * 1024):
+    """分块读取导出文件，读完后删除"""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+async def _excel_response(session_ids: List[str], view: str, filename: str) -> StreamingResponse:
+    try:
+        path = await run_ingest(service.export_excel, session_ids, view)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        iterate_in_ingest(_stream_file(path)),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/export/excel")
+async def export_excel_batch(
+    session_ids: List[str] = Query(...),
+    view: str = Query('by_process', pattern='^(by_process|by_type)$')
+):
+    """
+    批量导出Excel (多个会话写入同一工作簿)
+    
+    - session_ids: 会话ID，可重复
+    - view: 视角 (by_process | by_type)
+    """
+    return await _excel_response(session_ids, view, f"cost_variance_{view}.xlsx")
+
+
 @router.get("/export/excel/{session_id}")
-async def export_excel(session_id: str, view: str = Query('by_process')):
+async def export_excel(session_id: str, view: str = Query('by_process', pattern='^(by_process|by_type)$')):
     """
     导出Excel
     
     - session_id: 会话ID
     - view: 视角 (by_process | by_type)
-    
-    TODO: 实现Excel导出逻辑（Phase 4）
+    - 成本树按层级分级显示，另附加工成本分解工作表
     """
-    raise HTTPException(status_code=501, detail="Excel export not implemented yet")
+    return await _excel_response([session_id], view, f"cost_variance_{session_id}_{view}.xlsx")
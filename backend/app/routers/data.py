@@ -1,20 +1,39 @@
-from fastapi import APIRouter, HTTPException
-from app.schemas.data import ConfirmMappingRequest, ConfirmMappingResponse
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from app.schemas.data import (
+    ConfirmMappingRequest, ConfirmMappingResponse, RecordQueryRequest, RecordQueryResponse
+)
 from app.services.session_manager import SessionManager
 from app.services.etl_service import ETLService
 from app.services.excel_parser import ExcelParser
+from app.services.session_diff_service import SessionDiffService
+from app.services.record_service import RecordService, EXPORT_FORMATS
+from app.services.executor import run_ingest, run_analytics, iterate_in_ingest
+from app.services.admission import upload_admission
+from app.services.report_job_service import cancel_session_jobs
 import base64
 import io
 import pandas as pd
+from pydantic import ValidationError
 
 router = APIRouter(prefix="/api/data", tags=["Data"])
 
 session_mgr = SessionManager()
 etl_service = ETLService()
 parser = ExcelParser()
+diff_service = SessionDiffService()
+record_service = RecordService()
 
-@router.post("/confirm", response_model=ConfirmMappingResponse)
-async def confirm_mapping(request: ConfirmMappingRequest):
+@router.post(
+    "/confirm",
+    response_model=ConfirmMappingResponse,
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": ConfirmMappingRequest.model_json_schema()}}
+    }}
+)
+async def confirm_mapping(http_request: Request):
     """
     确认字段映射并将数据入库
     
@@ -25,7 +44,22 @@ async def confirm_mapping(request: ConfirmMappingRequest):
     4. 清洗数据并转换为标准格式
     5. 批量插入数据库
     6. 更新 Session 状态
+    7. 刷新 Period 跨期汇总
     """
+    # 按 Content-Length 先申请名额再读取请求体，饱和或超预算时不占用内存；
+    # 请求体几乎全部是 base64 文件内容，解码后约为编码长度的 3/4
+    content_length = http_request.headers.get("content-length", "")
+    if not content_length.isdigit():
+        raise HTTPException(status_code=411, detail="Content-Length header is required")
+    async with upload_admission.admit(int(content_length) * 3 // 4):
+        try:
+            request = ConfirmMappingRequest.model_validate_json(await http_request.body())
+        except ValidationError as e:
+            raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+        return await run_ingest(_confirm_mapping, request)
+
+def _confirm_mapping(request: ConfirmMappingRequest) -> ConfirmMappingResponse:
+    """入库流程 (在入库线程池中执行)"""
     try:
         # 1. 检查去重 (已移除，允许重复上传)
         # existing_session_id = session_mgr.check_duplicate(request.file_hash)
@@ -67,6 +101,9 @@ async def confirm_mapping(request: ConfirmMappingRequest):
         # 7. 更新状态
         session_mgr.update_status(session_id, "completed")
         
+        # 8. 刷新该 Period 的跨期汇总
+        etl_service.refresh_period(period)
+        
         return ConfirmMappingResponse(
             session_id=session_id,
             period=period,
@@ -83,13 +120,92 @@ async def confirm_mapping(request: ConfirmMappingRequest):
 @router.get("/sessions/{session_id}")
 async def get_session_info(session_id: str):
     """获取 Session 详细信息"""
-    session = session_mgr.get_session(session_id)
+    session = await run_analytics(session_mgr.get_session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     return session
 
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """删除 Session 及其采购明细、汇总表、差异缓存、分析缓存与 LLM 报告 / 批量任务"""
+    try:
+        # 先停止该 Session 的批量报告任务，否则任务会继续调用 LLM 并把报告写回已删除的 Session
+        await cancel_session_jobs(session_id)
+        return await run_ingest(_delete_session, session_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _delete_session(session_id: str):
+    session = session_mgr.get_session(session_id)
+    deleted_rows = etl_service.delete_session_records(session_id)
+    if not session_mgr.delete_session(session_id) and deleted_rows == 0:
+        raise HTTPException(status_code=404, detail="Session not found")
+    diff_service.invalidate_session(session_id)
+    if session:
+        etl_service.refresh_period(session["period"])
+    return {"message": "Session deleted successfully", "session_id": session_id, "deleted_rows": deleted_rows}
+
 @router.get("/records/{session_id}")
 async def get_records(session_id: str):
     """获取指定 Session 的所有采购记录"""
-    records = etl_service.get_records_by_session(session_id)
+    records = await run_analytics(etl_service.get_records_by_session, session_id)
     return {"session_id": session_id, "records": records, "total": len(records)}
+
+@router.post("/records/{session_id}/query", response_model=RecordQueryResponse)
+async def query_records(session_id: str, request: RecordQueryRequest):
+    """
+    分页查询采购记录（服务端过滤与多列排序）
+
+    返回 next_cursor，下一页原样带回 cursor 即可；翻页深度不影响单页耗时
+    """
+    try:
+        result = await run_analytics(
+            record_service.query_records,
+            session_id,
+            filters=request.model_dump(include={"commodities", "suppliers", "apv_min", "apv_max", "gap_min", "gap_max"}),
+            sort=[(item.field, item.direction) for item in request.sort],
+            limit=request.limit,
+            cursor=request.cursor
+        )
+        return RecordQueryResponse(session_id=session_id, **result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _negotiate_export_format(format: str, accept: str) -> str:
+    """导出格式协商：显式 format 参数优先，其次 Accept 头，默认 NDJSON"""
+    if format:
+        return format.lower()
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        for fmt, content_type in EXPORT_FORMATS.items():
+            if media_type == content_type:
+                return fmt
+        if media_type in ("application/x-parquet", "application/parquet"):
+            return "parquet"
+    return "ndjson"
+
+@router.get("/export/{session_id}")
+async def export_records(
+    session_id: str,
+    format: str = Query(None, pattern="^(ndjson|csv|parquet)$"),
+    accept: str = Header(None)
+):
+    """
+    流式导出指定 Session 的采购明细
+
+    - format: ndjson | csv | parquet，未指定时按 Accept 头协商
+    - 按批从 DuckDB 游标写出，内存占用不随行数增长
+    """
+    if not await run_analytics(session_mgr.get_session, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    fmt = _negotiate_export_format(format, accept)
+    return StreamingResponse(
+        iterate_in_ingest(record_service.export_records(session_id, fmt)),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{session_id}.{fmt}"'}
+    )
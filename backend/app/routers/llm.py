@@ -1,26 +1,114 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query
 from fastapi.responses import StreamingResponse
-from app.schemas.llm import ReportRequest
+from typing import List, Optional
+from app.schemas.llm import ReportRequest, BatchReportRequest, BatchReportJob
 from app.services.llm_service import LLMService
+from app.services.report_job_service import ReportJobService
+from app.services.report_streams import ReportStream, report_streams
+from app.services.executor import run_analytics
 
 router = APIRouter(prefix="/api/llm", tags=["LLM"])
 service = LLMService()
+job_service = ReportJobService()
+
+def _sse_response(stream: ReportStream, last_event_id: int = 0) -> StreamingResponse:
+    return StreamingResponse(
+        stream.subscribe(last_event_id),
+        media_type="text/event-stream",
+        headers={
+            "X-Report-Stream-Id": stream.stream_id,
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁止 Nginx 缓冲，片段即时送达
+        }
+    )
 
 @router.post("/generate-report")
 async def generate_report(request: ReportRequest):
     """
-    生成智能分析报告 (流式响应)
+    生成智能分析报告 (SSE 流式响应)
+
+    生成在后台进行，与本次连接解耦；响应头 X-Report-Stream-Id 为流 ID，
+    断线后可通过 GET /api/llm/streams/{stream_id} 携带 Last-Event-ID 续传
     """
-    try:
-        return StreamingResponse(
-            service.generate_report_stream(
-                request.session_id,
-                request.context_type,
-                request.context_value,
-                request.config,
-                request.prompt_template
-            ),
-            media_type="text/event-stream"
+    stream = report_streams.create(
+        service.generate_report_stream(
+            request.session_id,
+            request.context_type,
+            request.context_value,
+            request.config,
+            request.prompt_template,
+            request.force_refresh,
+            request.mode
         )
+    )
+    return _sse_response(stream)
+
+@router.get("/streams/{stream_id}")
+async def resume_report_stream(
+    stream_id: str,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    from_id: Optional[int] = Query(None, description="续传起点 (无法设置请求头时使用)")
+):
+    """
+    续传报告流：从缓冲中补发 Last-Event-ID 之后的片段，生成未结束时继续推送，不会再次调用 LLM
+    """
+    stream = report_streams.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Report stream not found or expired")
+    try:
+        resume_from = int(last_event_id) if last_event_id else (from_id or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    return _sse_response(stream, resume_from)
+
+@router.post("/jobs", response_model=BatchReportJob)
+async def create_report_job(request: BatchReportRequest):
+    """
+    创建批量报告任务 (Session 内全部品类，或 APV 前 N 的供应商)，后台执行，立即返回任务
+    """
+    try:
+        return await job_service.create_job(request)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs", response_model=List[BatchReportJob])
+async def list_report_jobs(session_id: Optional[str] = Query(None)):
+    """批量报告任务列表 (含进度，不含条目)"""
+    try:
+        return await run_analytics(job_service.list_jobs, session_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}", response_model=BatchReportJob)
+async def get_report_job(job_id: str, include_content: bool = Query(False)):
+    """批量报告任务进度；include_content=true 时返回各份报告全文"""
+    try:
+        job = await run_analytics(job_service.get_job, job_id, include_content)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_report_job(job_id: str):
+    """取消运行中的批量报告任务 (已完成的报告保留)"""
+    if not job_service.cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found or not running")
+    return {"job_id": job_id, "status": "cancelling"}
+
+@router.get("/metrics")
+async def get_llm_metrics(
+    hours: Optional[float] = Query(24, gt=0, description="统计最近 N 小时"),
+    session_id: Optional[str] = Query(None)
+):
+    """
+    LLM 调用计量：按 (模型, 上下文类型) 汇总上下文组装耗时、TTFT、总耗时分位数、输出速率、
+    Token 用量与估算费用 (单价由 LLM_PRICING_JSON 配置)
+    """
+    try:
+        return await run_analytics(service.metrics.summary, hours, session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
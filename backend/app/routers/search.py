@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import List
+from app.services.search_service import SearchService, SEARCH_KINDS
+from app.services.executor import run_analytics
+
+router = APIRouter(prefix="/api/search", tags=["Search"])
+service = SearchService()
+
+@router.get("")
+async def search(
+    q: str = Query(..., min_length=1),
+    kind: List[str] = Query(None),
+    session_id: str = Query(None),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """
+    检索零件号 / 零件描述 / 供应商 / 成本表零件
+
+    - 支持前缀、子串与模糊 (错字) 匹配
+    - kind: part | supplier | cost_part，可重复，默认全部
+    - session_id: 仅返回该采购 Session 中出现的零件与供应商
+    """
+    if kind and any(k not in SEARCH_KINDS for k in kind):
+        raise HTTPException(status_code=400, detail=f"Invalid kind. Use one of: {', '.join(SEARCH_KINDS)}")
+    try:
+        results = await run_analytics(service.search, q, kind, limit, session_id)
+        return {"query": q, "results": results, "total": len(results)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
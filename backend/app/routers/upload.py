@@ -1,6 +1,8 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from app.services.excel_parser import ExcelParser
 from app.schemas.upload import UploadResponse
+from app.services.executor import run_ingest
+from app.services.admission import upload_admission
 
 router = APIRouter(prefix="/api/upload", tags=["Upload"])
 parser = ExcelParser()
@@ -10,9 +12,11 @@ async def upload_file(file: UploadFile = File(...)):
     if not file.filename.endswith(('.xlsx', '.csv')):
         raise HTTPException(status_code=400, detail="Only .xlsx or .csv files are supported")
     
-    content = await file.read()
-    try:
-        result = parser.parse_file(content, file.filename)
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to parse file: {str(e)}")
+    # 先申请解析名额再读取文件，饱和时直接返回 429，不占用内存
+    async with upload_admission.admit(file.size or 0):
+        content = await file.read()
+        try:
+            result = await run_ingest(parser.parse_file, content, file.filename)
+            return result
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to parse file: {str(e)}")
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional, Literal
 
 class ConfirmMappingRequest(BaseModel):
     file_hash: str
@@ -12,3 +12,26 @@ class ConfirmMappingResponse(BaseModel):
     period: str
     inserted_rows: int
     status: str
+
+class RecordSort(BaseModel):
+    field: Literal["apv", "gap_percent", "opportunity", "price", "quantity", "covered_apv",
+                   "target_cost", "pns", "supplier", "commodity"]
+    direction: Literal["asc", "desc"] = "desc"
+
+class RecordQueryRequest(BaseModel):
+    """采购记录分页查询（服务端过滤、排序，keyset 游标翻页）"""
+    commodities: Optional[List[str]] = None
+    suppliers: Optional[List[str]] = None
+    apv_min: Optional[float] = None
+    apv_max: Optional[float] = None
+    gap_min: Optional[float] = None
+    gap_max: Optional[float] = None
+    sort: List[RecordSort] = [RecordSort(field="apv", direction="desc")]
+    limit: int = Field(100, ge=1, le=1000)
+    cursor: Optional[str] = None  # 上一页返回的 next_cursor
+
+class RecordQueryResponse(BaseModel):
+    session_id: str
+    records: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    has_more: bool
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, Literal
+from pydantic import BaseModel, Field
+from typing import List, Optional, Literal
 
 class LLMConfig(BaseModel):
     provider: str = "openai"  # openai, gemini, anthropic, etc.
@@ -7,6 +7,7 @@ class LLMConfig(BaseModel):
     base_url: Optional[str] = None
     model: str
     temperature: float = 0.7
+    context_token_budget: Optional[int] = None  # 数据上下文 Token 上限，默认 LLM_CONTEXT_TOKEN_BUDGET
 
 class ReportRequest(BaseModel):
     session_id: str
@@ -14,3 +15,41 @@ class ReportRequest(BaseModel):
     context_value: Optional[str] = None  # e.g. commodity name or supplier name
     prompt_template: Optional[str] = None
     config: LLMConfig
+    force_refresh: bool = False  # 跳过报告缓存，重新调用 LLM
+    # 仅 dashboard：hierarchical 先分组摘要全部品类再汇总；auto 在品类数超过一个分组时启用
+    mode: Literal["standard", "hierarchical", "auto"] = "standard"
+
+class BatchReportRequest(BaseModel):
+    """批量生成报告：Session 内全部品类，或 APV 最大的 top_n 个供应商"""
+    session_id: str
+    scope: Literal["commodity", "supplier"] = "commodity"
+    top_n: Optional[int] = Field(None, ge=1, le=500)  # 品类默认全部，供应商默认 10
+    prompt_template: Optional[str] = None
+    config: LLMConfig
+    concurrency: int = Field(3, ge=1, le=16)  # 同时进行的 LLM 调用数
+    requests_per_minute: Optional[int] = Field(60, ge=1, le=6000)  # 调用发起速率上限，None 为不限
+    force_refresh: bool = False
+
+class BatchReportItem(BaseModel):
+    context_value: str
+    status: str  # pending / running / completed / failed / cancelled
+    cached: bool = False
+    error: Optional[str] = None
+    content: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+class BatchReportJob(BaseModel):
+    job_id: str
+    session_id: str
+    scope: str
+    status: str  # pending / running / completed / failed / cancelled / interrupted
+    model: str
+    concurrency: int
+    requests_per_minute: Optional[int] = None
+    total: int
+    completed: int
+    failed: int
+    created_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    items: List[BatchReportItem] = []
@@ -0,0 +1,119 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+
+class AdmissionRejected(Exception):
+    """准入被拒绝 (由 main.py 统一转换为 429 / 413 响应)"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    大文件解析任务的准入控制
+
+    - 内存预算：按 文件大小 × 膨胀系数 预占内存 (openpyxl / pandas 解析后的峰值远大于文件本身)
+    - 并发上限：同时解析的任务数
+    - 排队上限：超过并发或预算时最多排队 max_waiting 个，最长等待 max_wait 秒，
+      队列已满或等待超时返回 429 并给出 Retry-After；单个任务超过总预算直接返回 413
+    """
+
+    def __init__(self, memory_budget: int, max_concurrent: int, max_waiting: int,
+                 max_wait: float, memory_factor: float):
+        self.memory_budget = memory_budget
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.memory_factor = memory_factor
+        self._condition = asyncio.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.reserved = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.rejected_too_large = 0
+        self.avg_duration = 0.0
+
+    def _fits(self, cost: int) -> bool:
+        return self.active < self.max_concurrent and self.reserved + cost <= self.memory_budget
+
+    def _retry_after(self) -> int:
+        """按平均任务耗时估算排队清空所需时间"""
+        rounds = (self.active + self.waiting) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(rounds * (self.avg_duration or 1.0)))
+
+    @asynccontextmanager
+    async def admit(self, size_bytes: int):
+        """
+        申请一个解析名额，退出上下文时释放
+
+        Args:
+            size_bytes: 上传文件大小
+        """
+        cost = int(size_bytes * self.memory_factor)
+        if cost > self.memory_budget:
+            self.rejected_too_large += 1
+            raise AdmissionRejected(413, "File too large for the configured parse memory budget")
+
+        async with self._condition:
+            if not self._fits(cost):
+                if self.waiting >= self.max_waiting:
+                    self.rejected_queue_full += 1
+                    raise AdmissionRejected(429, "Too many uploads in progress", self._retry_after())
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(self._condition.wait_for(lambda: self._fits(cost)), self.max_wait)
+                except asyncio.TimeoutError:
+                    self.rejected_timeout += 1
+                    raise AdmissionRejected(429, "Timed out waiting for an upload slot", self._retry_after())
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.reserved += cost
+            self.admitted += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - started
+            async with self._condition:
+                self.active -= 1
+                self.reserved -= cost
+                # 指数滑动平均，用于估算 Retry-After
+                self.avg_duration = duration if not self.avg_duration else 0.8 * self.avg_duration + 0.2 * duration
+                self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "reserved_bytes": self.reserved,
+            "memory_budget": self.memory_budget,
+            "max_concurrent": self.max_concurrent,
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "rejected_too_large": self.rejected_too_large,
+            "avg_duration_ms": self.avg_duration * 1000
+        }
+
+
+# 全局上传准入 (采购明细预览 / 确认入库 / 成本表上传共用)
+upload_admission = AdmissionController(
+    memory_budget=int(os.getenv("UPLOAD_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024,
+    max_concurrent=int(os.getenv("UPLOAD_MAX_CONCURRENT", "2")),
+    max_waiting=int(os.getenv("UPLOAD_MAX_WAITING", "8")),
+    max_wait=float(os.getenv("UPLOAD_MAX_WAIT_SECONDS", "30")),
+    memory_factor=float(os.getenv("UPLOAD_MEMORY_FACTOR", "10"))
+)
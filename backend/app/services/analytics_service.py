@@ -1,30 +1,85 @@
+import math
 from typing import Dict, List, Any
 from app.database.init import get_connection
 import duckdb
+from app.services.result_cache import cached_query
+
+# 按品类名称过滤事实表（名称先解析为代理键）
+COMMODITY_FILTER = "AND commodity_id = (SELECT commodity_id FROM dim_commodity WHERE commodity_name = ?)"
+
+# 近似模式误差口径 (approx=true)
+# DuckDB 的 approx_count_distinct 为寄存器较少的 HyperLogLog，实测相对标准误差约 15%；
+# approx_quantile 为 T-Digest，实测排名误差 < 0.2%，按 1% 保守报告
+APPROX_DISTINCT_RELATIVE_ERROR = 0.15
+APPROX_QUANTILE_RANK_ERROR = 0.01
+
+
+def _distinct_expression(expr: str, approx: bool = False) -> str:
+    """精确 / 近似去重计数表达式"""
+    return f"approx_count_distinct({expr})" if approx else f"COUNT(DISTINCT {expr})"
+
+
+def _distinct_bounds(value: int) -> List[int]:
+    """近似去重计数的 95% 区间 (±2σ)"""
+    margin = 2 * APPROX_DISTINCT_RELATIVE_ERROR * value
+    return [max(int(value - margin), 0), int(round(value + margin))]
+
+
+def _threshold_expression(column: str, spec: Any, approx: bool = False):
+    """
+    将象限阈值口径解析为 SQL 表达式
+
+    - "median" → 中位数
+    - "p75" / "p90" 等 → 对应分位数
+    - 数值 (或数值字符串) → 绝对阈值 (须为有限数)
+
+    approx=True 时分位数改用 approx_quantile。
+    返回的表达式均为聚合表达式 (绝对阈值用 ANY_VALUE 包装)，在 FROM base 上恰好得到一行
+
+    Returns:
+        (SQL 表达式, 绑定参数)
+    """
+    function = f"approx_quantile({column}, CAST(? AS FLOAT))" if approx else f"quantile_cont({column}, ?)"
+    text = str(spec).strip().lower()
+    if text == "median":
+        return function, 0.5
+    if text.startswith("p") and text[1:].replace(".", "", 1).isdigit():
+        quantile = float(text[1:]) / 100
+        if not 0 <= quantile <= 1:
+            raise ValueError(f"Percentile out of range: {spec}")
+        return function, quantile
+    try:
+        value = float(text)
+    except ValueError:
+        value = None
+    if value is None or not math.isfinite(value):
+        raise ValueError(f"Invalid threshold: {spec}. Use 'median', 'p<N>' or a number")
+    return "ANY_VALUE(CAST(? AS DOUBLE))", value
 
 class AnalyticsService:
     def __init__(self):
         self.conn = get_connection()
 
+    @cached_query
     def get_kpi_summary(self, session_id: str) -> Dict[str, Any]:
         """
-        计算 6 大核心 KPI
+        计算 6 大核心 KPI (读取 agg_session 汇总表)
         """
         query = """
         SELECT 
-            SUM(apv) as total_spending,
-            SUM(covered_apv) as spending_covered,
-            COUNT(DISTINCT CASE WHEN covered_apv > 0 THEN pns END) as pns_covered,
-            COUNT(DISTINCT CASE WHEN covered_apv > 0 THEN supplier END) as suppliers_covered,
-            SUM(opportunity) as total_opportunity,
+            total_apv as total_spending,
+            covered_apv as spending_covered,
+            pns_covered,
+            suppliers_covered,
+            total_opportunity,
             CASE 
-                WHEN SUM(apv) > 0 THEN (SUM(opportunity) / SUM(apv)) * 100 
+                WHEN total_apv > 0 THEN (total_opportunity / total_apv) * 100 
                 ELSE 0 
             END as gap_percent
-        FROM procurement_records
+        FROM agg_session
         WHERE session_id = ?
         """
-        result = self.conn.execute(query, [session_id]).fetchone()
+        result = self.conn.execute(query, [session_id]).fetchone() or (None,) * 6
         
         return {
             "total_spending": float(result[0] or 0),
@@ -35,26 +90,27 @@ class AnalyticsService:
             "gap_percent": float(result[5] or 0)
         }
 
+    @cached_query
     def get_commodity_overview(self, session_id: str) -> List[Dict[str, Any]]:
         """
-        按 Commodity 分组的概览数据 (图表 + 表格)
+        按 Commodity 分组的概览数据 (图表 + 表格，读取 agg_session_commodity 汇总表)
         """
         query = """
         SELECT 
-            commodity,
-            SUM(apv) as total_apv,
-            SUM(covered_apv) as covered_apv,
-            SUM(opportunity) as total_opportunity,
-            COUNT(DISTINCT pns) as covered_pns,
-            COUNT(DISTINCT supplier) as supplier_count,
+            c.commodity_name,
+            a.total_apv,
+            a.covered_apv,
+            a.total_opportunity,
+            a.pns_count as covered_pns,
+            a.supplier_count,
             CASE 
-                WHEN SUM(apv) > 0 THEN (SUM(opportunity) / SUM(apv)) * 100 
+                WHEN a.total_apv > 0 THEN (a.total_opportunity / a.total_apv) * 100 
                 ELSE 0 
             END as gap_percent
-        FROM procurement_records
-        WHERE session_id = ?
-        GROUP BY commodity
-        ORDER BY total_apv DESC
+        FROM agg_session_commodity a
+        JOIN dim_commodity c ON c.commodity_id = a.commodity_id
+        WHERE a.session_id = ?
+        ORDER BY a.total_apv DESC
         """
         results = self.conn.execute(query, [session_id]).fetchall()
         
@@ -71,25 +127,26 @@ class AnalyticsService:
             for row in results
         ]
 
+    @cached_query
     def get_top_suppliers(self, session_id: str, limit: int = 20) -> List[Dict[str, Any]]:
         """
-        Top Suppliers 列表 (按 Opportunity 排序)
+        Top Suppliers 列表 (按 Opportunity 排序，读取 agg_session_supplier 汇总表)
         """
         query = """
         SELECT 
-            supplier,
-            SUM(apv) as total_apv,
-            SUM(opportunity) as total_opportunity,
+            s.supplier_name,
+            a.total_apv,
+            a.total_opportunity,
             CASE 
-                WHEN SUM(apv) > 0 THEN (SUM(opportunity) / SUM(apv)) * 100 
+                WHEN a.total_apv > 0 THEN (a.total_opportunity / a.total_apv) * 100 
                 ELSE 0 
             END as gap_percent,
-            -- 主营 Commodity (取 APV 最大的那个)
-            arg_max(commodity, apv) as main_commodity
-        FROM procurement_records
-        WHERE session_id = ?
-        GROUP BY supplier
-        ORDER BY total_opportunity DESC
+            c.commodity_name as main_commodity
+        FROM agg_session_supplier a
+        JOIN dim_supplier s ON s.supplier_id = a.supplier_id
+        LEFT JOIN dim_commodity c ON c.commodity_id = a.main_commodity_id
+        WHERE a.session_id = ?
+        ORDER BY a.total_opportunity DESC
         LIMIT ?
         """
         results = self.conn.execute(query, [session_id, limit]).fetchall()
@@ -105,24 +162,28 @@ class AnalyticsService:
             for row in results
         ]
 
-    def get_top_projects(self, session_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+    @cached_query
+    def get_top_projects(self, session_id: str, limit: int = 20, commodity: str = None) -> List[Dict[str, Any]]:
         """
-        Top Projects (PNs) 列表 (按 Opportunity 排序)
+        Top Projects (PNs) 列表 (按 Opportunity 排序)，指定 commodity 时限定在该品类内
         """
-        query = """
+        query = f"""
         SELECT 
-            pns,
-            part_desc,
-            supplier,
-            apv,
-            opportunity,
-            gap_percent
-        FROM procurement_records
-        WHERE session_id = ?
-        ORDER BY opportunity DESC
+            p.pns,
+            f.part_desc,
+            s.supplier_name,
+            f.apv,
+            f.opportunity,
+            f.gap_percent
+        FROM procurement_facts f
+        JOIN dim_part p ON p.part_id = f.part_id
+        JOIN dim_supplier s ON s.supplier_id = f.supplier_id
+        WHERE f.session_id = ? {COMMODITY_FILTER if commodity else ""}
+        ORDER BY f.opportunity DESC
         LIMIT ?
         """
-        results = self.conn.execute(query, [session_id, limit]).fetchall()
+        params = [session_id, commodity] if commodity else [session_id]
+        results = self.conn.execute(query, params + [limit]).fetchall()
         
         return [
             {
@@ -136,25 +197,27 @@ class AnalyticsService:
             for row in results
         ]
 
+    @cached_query
     def get_commodity_kpi(self, session_id: str, commodity: str) -> Dict[str, Any]:
         """
-        获取指定 Commodity 的 KPI 汇总
+        获取指定 Commodity 的 KPI 汇总 (读取 agg_session_commodity 汇总表)
         """
         query = """
         SELECT 
-            SUM(apv) as total_spending,
-            SUM(covered_apv) as spending_covered,
-            COUNT(DISTINCT CASE WHEN covered_apv > 0 THEN pns END) as pns_covered,
-            COUNT(DISTINCT CASE WHEN covered_apv > 0 THEN supplier END) as suppliers_covered,
-            SUM(opportunity) as total_opportunity,
+            a.total_apv as total_spending,
+            a.covered_apv as spending_covered,
+            a.pns_covered,
+            a.suppliers_covered,
+            a.total_opportunity,
             CASE 
-                WHEN SUM(apv) > 0 THEN (SUM(opportunity) / SUM(apv)) * 100 
+                WHEN a.total_apv > 0 THEN (a.total_opportunity / a.total_apv) * 100 
                 ELSE 0 
             END as gap_percent
-        FROM procurement_records
-        WHERE session_id = ? AND commodity = ?
+        FROM agg_session_commodity a
+        JOIN dim_commodity c ON c.commodity_id = a.commodity_id
+        WHERE a.session_id = ? AND c.commodity_name = ?
         """
-        result = self.conn.execute(query, [session_id, commodity]).fetchone()
+        result = self.conn.execute(query, [session_id, commodity]).fetchone() or (None,) * 6
         
         return {
             "total_spending": float(result[0] or 0),
@@ -165,23 +228,25 @@ class AnalyticsService:
             "gap_percent": float(result[5] or 0)
         }
 
+    @cached_query
     def get_commodity_top_suppliers(self, session_id: str, commodity: str, limit: int = 5) -> List[Dict[str, Any]]:
         """
-        获取指定 Commodity 的 Top Suppliers (按 Opportunity 排序)
+        获取指定 Commodity 的 Top Suppliers (按 Opportunity 排序，读取 agg_session_commodity_supplier 汇总表)
         """
         query = """
         SELECT 
-            supplier,
-            SUM(apv) as total_apv,
-            SUM(opportunity) as total_opportunity,
+            s.supplier_name,
+            a.total_apv,
+            a.total_opportunity,
             CASE 
-                WHEN SUM(apv) > 0 THEN (SUM(opportunity) / SUM(apv)) * 100 
+                WHEN a.total_apv > 0 THEN (a.total_opportunity / a.total_apv) * 100 
                 ELSE 0 
             END as gap_percent
-        FROM procurement_records
-        WHERE session_id = ? AND commodity = ?
-        GROUP BY supplier
-        ORDER BY total_opportunity DESC
+        FROM agg_session_commodity_supplier a
+        JOIN dim_supplier s ON s.supplier_id = a.supplier_id
+        JOIN dim_commodity c ON c.commodity_id = a.commodity_id
+        WHERE a.session_id = ? AND c.commodity_name = ?
+        ORDER BY a.total_opportunity DESC
         LIMIT ?
         """
         results = self.conn.execute(query, [session_id, commodity, limit]).fetchall()
@@ -196,19 +261,60 @@ class AnalyticsService:
             for row in results
         ]
 
+    @cached_query
+    def get_commodity_supplier_leaders(self, session_id: str, per_commodity: int = 3) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        各 Commodity 内 APV 最大的 per_commodity 个供应商 (单条窗口查询，读取 agg_session_commodity_supplier)
+
+        Returns:
+            {commodity_name: [{supplier, total_apv, share, gap_percent}]}，share 为占该品类 APV 的百分比
+        """
+        query = """
+        SELECT
+            c.commodity_name,
+            s.supplier_name,
+            a.total_apv,
+            a.total_apv * 100.0 / NULLIF(SUM(a.total_apv) OVER (PARTITION BY a.commodity_id), 0) as share,
+            CASE
+                WHEN a.total_apv > 0 THEN (a.total_opportunity / a.total_apv) * 100
+                ELSE 0
+            END as gap_percent
+        FROM agg_session_commodity_supplier a
+        JOIN dim_supplier s ON s.supplier_id = a.supplier_id
+        JOIN dim_commodity c ON c.commodity_id = a.commodity_id
+        WHERE a.session_id = ?
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY a.commodity_id ORDER BY a.total_apv DESC, a.supplier_id) <= ?
+        ORDER BY c.commodity_name, a.total_apv DESC
+        """
+        results = self.conn.execute(query, [session_id, per_commodity]).fetchall()
+
+        leaders: Dict[str, List[Dict[str, Any]]] = {}
+        for row in results:
+            leaders.setdefault(row[0], []).append({
+                "supplier": row[1],
+                "total_apv": float(row[2] or 0),
+                "share": float(row[3] or 0),
+                "gap_percent": float(row[4] or 0)
+            })
+        return leaders
+
+    @cached_query
     def get_supplier_top_pns(self, session_id: str, supplier: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
         获取指定 Supplier 的 Top PNs (按 Opportunity 排序)
         """
         query = """
         SELECT 
-            pns,
-            part_desc,
-            opportunity,
-            gap_percent
-        FROM procurement_records
-        WHERE session_id = ? AND supplier = ?
-        ORDER BY opportunity DESC
+            p.pns,
+            f.part_desc,
+            f.opportunity,
+            f.gap_percent
+        FROM procurement_facts f
+        JOIN dim_part p ON p.part_id = f.part_id
+        WHERE f.session_id = ? AND f.supplier_id = (
+            SELECT supplier_id FROM dim_supplier WHERE supplier_name = ?
+        )
+        ORDER BY f.opportunity DESC
         LIMIT ?
         """
         results = self.conn.execute(query, [session_id, supplier, limit]).fetchall()
@@ -223,6 +329,170 @@ class AnalyticsService:
             for row in results
         ]
 
+    @cached_query
+    def get_supplier_profile(self, session_id: str, supplier: str, top_n: int = 10) -> Dict[str, Any]:
+        """
+        供应商画像 (用于 LLM 供应商报告)，单条查询返回:
+
+        - kpi: 供应商 APV / 覆盖 / Opportunity / PN 数 / 主营品类
+        - ranking: 按 APV 的排名与占 Session 总 APV 的份额
+        - commodity_mix: 各品类的 APV、占该供应商与占该品类总 APV 的份额、在该品类中的排名
+        - top_pns: Opportunity 最大的 top_n 个 PN
+        - single_source: 该供应商独家供应 (Session 内只有这一家) 的 PN 数与 APV
+
+        KPI、排名与品类构成读取汇总表，只有 Top PNs 与独家供应需要扫描该供应商的明细
+        """
+        query = """
+        WITH sup AS (
+            SELECT supplier_id FROM dim_supplier WHERE supplier_name = ?
+        ),
+        ranked AS (
+            SELECT 
+                supplier_id,
+                ROW_NUMBER() OVER (ORDER BY total_apv DESC, supplier_id) as apv_rank,
+                COUNT(*) OVER () as total_suppliers
+            FROM agg_session_supplier
+            WHERE session_id = ?
+        ),
+        commodity_ranked AS (
+            SELECT 
+                commodity_id,
+                supplier_id,
+                total_apv,
+                total_opportunity,
+                ROW_NUMBER() OVER (PARTITION BY commodity_id ORDER BY total_apv DESC, supplier_id) as rank_in_commodity
+            FROM agg_session_commodity_supplier
+            WHERE session_id = ?
+        ),
+        facts AS (
+            SELECT f.*
+            FROM procurement_facts f, sup
+            WHERE f.session_id = ? AND f.supplier_id = sup.supplier_id
+        ),
+        part_sources AS (
+            SELECT part_id, COUNT(*) as source_count
+            FROM procurement_facts
+            WHERE session_id = ? AND part_id IN (SELECT part_id FROM facts)
+            GROUP BY part_id
+        )
+        SELECT 
+            a.total_apv,
+            a.covered_apv,
+            a.total_opportunity,
+            a.pns_count,
+            a.pns_covered,
+            a.commodity_count,
+            mc.commodity_name,
+            r.apv_rank,
+            r.total_suppliers,
+            t.total_apv,
+            (
+                SELECT list(struct_pack(
+                    commodity := c.commodity_name,
+                    apv := CAST(cr.total_apv AS DOUBLE),
+                    opportunity := CAST(cr.total_opportunity AS DOUBLE),
+                    commodity_apv := CAST(ac.total_apv AS DOUBLE),
+                    rank_in_commodity := cr.rank_in_commodity,
+                    commodity_suppliers := ac.supplier_count
+                ) ORDER BY cr.total_apv DESC)
+                FROM commodity_ranked cr
+                JOIN agg_session_commodity ac ON ac.session_id = ? AND ac.commodity_id = cr.commodity_id
+                JOIN dim_commodity c ON c.commodity_id = cr.commodity_id
+                WHERE cr.supplier_id = sup.supplier_id
+            ) as commodity_mix,
+            (
+                SELECT list(struct_pack(
+                    pns := p.pns,
+                    part_desc := top.part_desc,
+                    commodity := c.commodity_name,
+                    apv := CAST(top.apv AS DOUBLE),
+                    opportunity := CAST(top.opportunity AS DOUBLE),
+                    gap_percent := CAST(top.gap_percent AS DOUBLE)
+                ) ORDER BY top.opportunity DESC, top.part_id)
+                FROM (SELECT * FROM facts ORDER BY opportunity DESC, part_id LIMIT ?) top
+                JOIN dim_part p ON p.part_id = top.part_id
+                JOIN dim_commodity c ON c.commodity_id = top.commodity_id
+            ) as top_pns,
+            (
+                SELECT struct_pack(
+                    pns_count := COUNT(*),
+                    apv := COALESCE(SUM(CAST(f.apv AS DOUBLE)), 0),
+                    opportunity := COALESCE(SUM(CAST(f.opportunity AS DOUBLE)), 0)
+                )
+                FROM facts f
+                JOIN part_sources ps ON ps.part_id = f.part_id
+                WHERE ps.source_count = 1
+            ) as single_source
+        FROM sup
+        JOIN agg_session_supplier a ON a.session_id = ? AND a.supplier_id = sup.supplier_id
+        JOIN ranked r ON r.supplier_id = sup.supplier_id
+        JOIN agg_session t ON t.session_id = a.session_id
+        LEFT JOIN dim_commodity mc ON mc.commodity_id = a.main_commodity_id
+        """
+        row = self.conn.execute(query, [
+            supplier, session_id, session_id, session_id, session_id, session_id, top_n, session_id
+        ]).fetchone()
+
+        if not row:
+            return {
+                "supplier": supplier,
+                "kpi": {"total_spending": 0.0, "spending_covered": 0.0, "pns_count": 0, "pns_covered": 0,
+                        "total_opportunity": 0.0, "gap_percent": 0.0, "commodity_count": 0, "main_commodity": None},
+                "ranking": {"apv_rank": None, "total_suppliers": 0, "session_share": 0.0},
+                "commodity_mix": [],
+                "top_pns": [],
+                "single_source": {"pns_count": 0, "apv": 0.0, "opportunity": 0.0, "apv_share": 0.0}
+            }
+
+        total_apv = float(row[0] or 0)
+        total_opportunity = float(row[2] or 0)
+        session_apv = float(row[9] or 0)
+        single = row[12] or {"pns_count": 0, "apv": 0.0, "opportunity": 0.0}
+
+        return {
+            "supplier": supplier,
+            "kpi": {
+                "total_spending": total_apv,
+                "spending_covered": float(row[1] or 0),
+                "pns_count": int(row[3] or 0),
+                "pns_covered": int(row[4] or 0),
+                "total_opportunity": total_opportunity,
+                "gap_percent": (total_opportunity / total_apv) * 100 if total_apv > 0 else 0.0,
+                "commodity_count": int(row[5] or 0),
+                "main_commodity": row[6]
+            },
+            "ranking": {
+                "apv_rank": int(row[7]),
+                "total_suppliers": int(row[8]),
+                "session_share": total_apv / session_apv * 100 if session_apv > 0 else 0.0
+            },
+            "commodity_mix": [
+                {
+                    "commodity": item["commodity"],
+                    "apv": item["apv"] or 0.0,
+                    "opportunity": item["opportunity"] or 0.0,
+                    "gap_percent": (item["opportunity"] or 0) / item["apv"] * 100 if item["apv"] else 0.0,
+                    "share_of_supplier": (item["apv"] or 0) / total_apv * 100 if total_apv > 0 else 0.0,
+                    "share_of_commodity": (item["apv"] or 0) / item["commodity_apv"] * 100 if item["commodity_apv"] else 0.0,
+                    "rank_in_commodity": item["rank_in_commodity"],
+                    "commodity_suppliers": item["commodity_suppliers"]
+                }
+                for item in (row[10] or [])
+            ],
+            "top_pns": [
+                {**item, "apv": item["apv"] or 0.0, "opportunity": item["opportunity"] or 0.0,
+                 "gap_percent": item["gap_percent"] or 0.0}
+                for item in (row[11] or [])
+            ],
+            "single_source": {
+                "pns_count": int(single["pns_count"]),
+                "apv": float(single["apv"]),
+                "opportunity": float(single["opportunity"]),
+                "apv_share": float(single["apv"]) / total_apv * 100 if total_apv > 0 else 0.0
+            }
+        }
+
+    @cached_query
     def get_opportunity_matrix(self, session_id: str, commodity: str = None) -> List[Dict[str, Any]]:
         """
         获取象限分析数据 (Opportunity Matrix)
@@ -230,19 +500,22 @@ class AnalyticsService:
         """
         base_query = """
         SELECT 
-            pns,
-            part_desc,
-            supplier,
-            commodity,
-            apv,
-            gap_percent,
-            opportunity
-        FROM procurement_records
-        WHERE session_id = ?
+            p.pns,
+            f.part_desc,
+            s.supplier_name,
+            c.commodity_name,
+            f.apv,
+            f.gap_percent,
+            f.opportunity
+        FROM procurement_facts f
+        JOIN dim_part p ON p.part_id = f.part_id
+        JOIN dim_supplier s ON s.supplier_id = f.supplier_id
+        JOIN dim_commodity c ON c.commodity_id = f.commodity_id
+        WHERE f.session_id = ?
         """
         
         if commodity:
-            query = base_query + " AND commodity = ?"
+            query = base_query + " AND c.commodity_name = ?"
             results = self.conn.execute(query, [session_id, commodity]).fetchall()
         else:
             results = self.conn.execute(base_query, [session_id]).fetchall()
@@ -260,80 +533,274 @@ class AnalyticsService:
             for row in results
         ]
 
-    def get_supplier_concentration(self, session_id: str, commodity: str = None) -> Dict[str, Any]:
+    @cached_query
+    def get_opportunity_matrix_binned(self, session_id: str, commodity: str = None,
+                                      top_n: int = 500, bins: int = 40, apv_scale: str = "log") -> Dict[str, Any]:
+        """
+        象限分析数据的降采样版本 (用于大 Session 的气泡图)
+
+        - points: Opportunity 最大的前 top_n 个 PN，结构与 get_opportunity_matrix 一致
+        - grid: 其余 PN 按 APV × Gap% 做 bins × bins 二维分箱后的密度网格
+        返回体大小只取决于 top_n 与 bins，与 Session 行数无关。
+
+        Args:
+            apv_scale: APV 轴分箱方式，'log' (按 log10，与气泡图对数轴一致) 或 'linear'
         """
-        计算供应商集中度 (CR3, CR5)
+        x_expr = "LOG10(GREATEST(apv, 1))" if apv_scale == "log" else "apv"
+        filter_sql = COMMODITY_FILTER if commodity else ""
+        params = [session_id, commodity] if commodity else [session_id]
+
+        ranked_cte = f"""
+        WITH base AS (
+            SELECT 
+                part_id,
+                supplier_id,
+                commodity_id,
+                part_desc,
+                CAST(apv AS DOUBLE) as apv,
+                CAST(gap_percent AS DOUBLE) as gap_percent,
+                CAST(opportunity AS DOUBLE) as opportunity,
+                ROW_NUMBER() OVER (ORDER BY opportunity DESC, part_id, supplier_id) as opportunity_rank
+            FROM procurement_facts
+            WHERE session_id = ? {filter_sql}
+        )
         """
-        base_query = """
+
+        points = self.conn.execute(ranked_cte + """
         SELECT 
-            supplier,
-            SUM(apv) as total_apv
-        FROM procurement_records
-        WHERE session_id = ?
+            p.pns,
+            b.part_desc,
+            s.supplier_name,
+            c.commodity_name,
+            b.apv,
+            b.gap_percent,
+            b.opportunity
+        FROM base b
+        JOIN dim_part p ON p.part_id = b.part_id
+        JOIN dim_supplier s ON s.supplier_id = b.supplier_id
+        JOIN dim_commodity c ON c.commodity_id = b.commodity_id
+        WHERE b.opportunity_rank <= ?
+        ORDER BY b.opportunity_rank
+        """, params + [top_n]).fetchall()
+
+        cells = self.conn.execute(ranked_cte + f""",
+        bounds AS (
+            SELECT 
+                MIN({x_expr}) as x_min,
+                MAX({x_expr}) as x_max,
+                MIN(gap_percent) as y_min,
+                MAX(gap_percent) as y_max,
+                COUNT(*) as total_points
+            FROM base
+        ),
+        binned AS (
+            SELECT 
+                LEAST(?, CAST(FLOOR(COALESCE(({x_expr} - t.x_min) / NULLIF(t.x_max - t.x_min, 0), 0) * ?) AS INTEGER)) as x,
+                LEAST(?, CAST(FLOOR(COALESCE((b.gap_percent - t.y_min) / NULLIF(t.y_max - t.y_min, 0), 0) * ?) AS INTEGER)) as y,
+                b.apv,
+                b.opportunity
+            FROM base b, bounds t
+            WHERE b.opportunity_rank > ?
+        )
+        SELECT 
+            t.x_min, t.x_max, t.y_min, t.y_max, t.total_points,
+            g.x, g.y, g.count, g.total_apv, g.total_opportunity
+        FROM bounds t
+        LEFT JOIN (
+            SELECT x, y, COUNT(*) as count, SUM(apv) as total_apv, SUM(opportunity) as total_opportunity
+            FROM binned
+            GROUP BY x, y
+        ) g ON TRUE
+        ORDER BY g.x, g.y
+        """, params + [bins - 1, bins, bins - 1, bins, top_n]).fetchall()
+
+        x_min, x_max, y_min, y_max, total_points = cells[0][:5] if cells else (None, None, None, None, 0)
+        x_min, x_max = float(x_min or 0), float(x_max or 0)
+        y_min, y_max = float(y_min or 0), float(y_max or 0)
+
+        def edges(low, high):
+            return [low + (high - low) * i / bins for i in range(bins + 1)]
+
+        apv_edges = edges(x_min, x_max)
+        if apv_scale == "log":
+            apv_edges = [10 ** e for e in apv_edges]
+
+        return {
+            "mode": "binned",
+            "total_points": int(total_points or 0),
+            "points": [
+                {
+                    "pns": row[0],
+                    "part_desc": row[1],
+                    "supplier": row[2],
+                    "commodity": row[3],
+                    "apv": float(row[4] or 0),
+                    "gap_percent": float(row[5] or 0),
+                    "opportunity": float(row[6] or 0)
+                }
+                for row in points
+            ],
+            "grid": {
+                "bins": bins,
+                "apv_scale": apv_scale,
+                "apv_edges": apv_edges,
+                "gap_edges": edges(y_min, y_max),
+                "cells": [
+                    {
+                        "x": int(row[5]),
+                        "y": int(row[6]),
+                        "count": int(row[7]),
+                        "total_apv": float(row[8] or 0),
+                        "total_opportunity": float(row[9] or 0)
+                    }
+                    for row in cells
+                    if row[5] is not None
+                ]
+            }
+        }
+
+    @cached_query
+    def get_supplier_concentration(self, session_id: str, commodity: str = None,
+                                   top_k: int = 10, cr_levels: List[int] = None) -> Dict[str, Any]:
+        """
+        计算供应商集中度 (CRn, HHI)
+
+        基于供应商汇总表，在 DuckDB 内用窗口函数完成排名、累计份额与 HHI 计算，
+        只返回 Top-K 供应商及计算 CRn 所需的累计行。
+
+        Args:
+            top_k: 返回的 Top 供应商数量
+            cr_levels: 需要计算的 CRn 列表，默认 [3, 5]，结果以 cr3 / cr5 / ... 返回
         """
-        
         if commodity:
-            query = base_query + " AND commodity = ? GROUP BY supplier ORDER BY total_apv DESC"
-            results = self.conn.execute(query, [session_id, commodity]).fetchall()
+            source = """
+            SELECT a.supplier_id, a.total_apv
+            FROM agg_session_commodity_supplier a
+            JOIN dim_commodity c ON c.commodity_id = a.commodity_id
+            WHERE a.session_id = ? AND c.commodity_name = ?
+            """
+            params = [session_id, commodity]
         else:
-            query = base_query + " GROUP BY supplier ORDER BY total_apv DESC"
-            results = self.conn.execute(query, [session_id]).fetchall()
-        
-        # 计算总 APV
-        total_apv = sum(float(row[1] or 0) for row in results)
-        
+            source = """
+            SELECT supplier_id, total_apv
+            FROM agg_session_supplier
+            WHERE session_id = ?
+            """
+            params = [session_id]
+
+        cr_levels = sorted(set(int(n) for n in (cr_levels or [3, 5])))
+        query = f"""
+        WITH ranked AS (
+            SELECT 
+                supplier_id,
+                CAST(total_apv AS DOUBLE) as apv,
+                ROW_NUMBER() OVER (ORDER BY total_apv DESC, supplier_id) as apv_rank,
+                COUNT(*) OVER () as total_suppliers,
+                SUM(CAST(total_apv AS DOUBLE)) OVER () as total_apv,
+                SUM(CAST(total_apv AS DOUBLE)) OVER (
+                    ORDER BY total_apv DESC, supplier_id ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                ) as cumulative_apv,
+                SUM(POWER(CAST(total_apv AS DOUBLE), 2)) OVER () as apv_square_sum
+            FROM ({source}) src
+        )
+        SELECT 
+            s.supplier_name,
+            r.apv,
+            r.apv_rank,
+            r.total_suppliers,
+            r.total_apv,
+            r.cumulative_apv,
+            r.apv_square_sum
+        FROM ranked r
+        JOIN dim_supplier s ON s.supplier_id = r.supplier_id
+        WHERE r.apv_rank <= ?
+           OR list_contains(?, r.apv_rank)
+           OR r.apv_rank = r.total_suppliers
+        ORDER BY r.apv_rank
+        """
+        results = self.conn.execute(query, params + [top_k, cr_levels]).fetchall()
+
+        total_apv = float(results[0][4] or 0) if results else 0.0
+
         if total_apv == 0:
-            return {
-                "cr3": 0.0,
-                "cr5": 0.0,
-                "total_suppliers": 0,
-                "top_suppliers": []
-            }
-        
-        # 计算 CR3 和 CR5
-        cr3_apv = sum(float(row[1] or 0) for row in results[:3])
-        cr5_apv = sum(float(row[1] or 0) for row in results[:5])
-        
-        cr3 = (cr3_apv / total_apv) * 100
-        cr5 = (cr5_apv / total_apv) * 100
-        
-        # 返回详细数据
-        top_suppliers = [
-            {
-                "supplier": row[0],
-                "apv": float(row[1] or 0),
-                "share": (float(row[1] or 0) / total_apv) * 100
-            }
-            for row in results[:10]  # 返回 Top 10 用于展示
-        ]
-        
-        return {
-            "cr3": cr3,
-            "cr5": cr5,
-            "total_suppliers": len(results),
-            "total_apv": total_apv,
-            "top_suppliers": top_suppliers
+            empty = {f"cr{n}": 0.0 for n in cr_levels}
+            empty.update({"hhi": 0.0, "total_suppliers": 0, "top_suppliers": []})
+            return empty
+
+        total_suppliers = int(results[0][3])
+        cumulative = {row[2]: float(row[5]) for row in results}
+
+        concentration = {
+            # n 超过供应商数量时 CRn 即为全部份额
+            f"cr{n}": cumulative[min(n, total_suppliers)] / total_apv * 100
+            for n in cr_levels
         }
+        concentration.update({
+            # HHI = Σ(份额%)²，取值 0 ~ 10000
+            "hhi": float(results[0][6]) / (total_apv ** 2) * 10000,
+            "total_suppliers": total_suppliers,
+            "total_apv": total_apv,
+            "top_suppliers": [
+                {
+                    "supplier": row[0],
+                    "apv": float(row[1] or 0),
+                    "share": (float(row[1] or 0) / total_apv) * 100
+                }
+                for row in results
+                if row[2] <= top_k
+            ]
+        })
+        return concentration
 
-    def get_matrix_stats(self, session_id: str, commodity: str = None) -> Dict[str, Any]:
+    @cached_query
+    def get_matrix_stats(self, session_id: str, commodity: str = None,
+                         apv_threshold: str = "median", gap_threshold: str = "median",
+                         approx: bool = False) -> Dict[str, Any]:
         """
         计算象限分布统计 (用于 LLM 分析)
-        """
-        matrix = self.get_opportunity_matrix(session_id, commodity)
-        if not matrix:
-            return {"high_value_high_gap": {"count": 0, "total_opportunity": 0}, "high_value_low_gap": {"count": 0, "total_opportunity": 0}, "low_value_high_gap": {"count": 0, "total_opportunity": 0}, "low_value_low_gap": {"count": 0, "total_opportunity": 0}}
 
-        # 计算中位数作为阈值
-        apv_values = [m['apv'] for m in matrix]
-        gap_values = [m['gap_percent'] for m in matrix]
-        
-        def median(lst):
-            n = len(lst)
-            s = sorted(lst)
-            return (s[n//2] if n % 2 == 1 else (s[n//2-1] + s[n//2])/2) if n > 0 else 0
+        阈值与象限汇总均在 DuckDB 内完成 (quantile_cont + CASE 分桶 GROUP BY)，只返回阈值和四个象限的聚合。
+
+        Args:
+            apv_threshold / gap_threshold: 阈值口径，支持 "median"、分位数 "p75" 或绝对值 "50000"
+            approx: 分位数改用 approx_quantile，结果附带 approximation 误差说明；
+                    象限计数本身仍是精确的，可据此得到阈值的实际排名
+        """
+        apv_expr, apv_param = _threshold_expression("apv", apv_threshold, approx)
+        gap_expr, gap_param = _threshold_expression("gap_percent", gap_threshold, approx)
 
-        apv_threshold = median(apv_values)
-        gap_threshold = median(gap_values)
+        query = f"""
+        WITH base AS (
+            SELECT 
+                CAST(apv AS DOUBLE) as apv,
+                CAST(gap_percent AS DOUBLE) as gap_percent,
+                CAST(opportunity AS DOUBLE) as opportunity
+            FROM procurement_facts
+            WHERE session_id = ? {COMMODITY_FILTER if commodity else ""}
+        ),
+        thresholds AS (
+            SELECT 
+                {apv_expr} as apv_threshold,
+                {gap_expr} as gap_threshold
+            FROM base
+        )
+        SELECT 
+            t.apv_threshold,
+            t.gap_threshold,
+            CASE 
+                WHEN b.apv >= t.apv_threshold AND b.gap_percent >= t.gap_threshold THEN 'high_value_high_gap'
+                WHEN b.apv >= t.apv_threshold THEN 'high_value_low_gap'
+                WHEN b.gap_percent >= t.gap_threshold THEN 'low_value_high_gap'
+                ELSE 'low_value_low_gap'
+            END as quadrant,
+            COUNT(b.apv) as count,
+            COALESCE(SUM(b.opportunity), 0) as total_opportunity
+        FROM thresholds t
+        LEFT JOIN base b ON TRUE
+        GROUP BY ALL
+        """
+        params = [session_id, commodity] if commodity else [session_id]
+        results = self.conn.execute(query, params + [apv_param, gap_param]).fetchall()
 
         stats = {
             "high_value_high_gap": {"count": 0, "total_opportunity": 0}, # Core Opportunity
@@ -341,26 +808,400 @@ class AnalyticsService:
             "low_value_high_gap": {"count": 0, "total_opportunity": 0},  # Potential
             "low_value_low_gap": {"count": 0, "total_opportunity": 0}    # Ignore
         }
+        thresholds = {"apv": 0.0, "gap": 0.0}
 
-        for item in matrix:
-            apv = item['apv']
-            gap = item['gap_percent']
-            opp = item['opportunity']
-            
-            if apv >= apv_threshold and gap >= gap_threshold:
-                key = "high_value_high_gap"
-            elif apv >= apv_threshold and gap < gap_threshold:
-                key = "high_value_low_gap"
-            elif apv < apv_threshold and gap >= gap_threshold:
-                key = "low_value_high_gap"
-            else:
-                key = "low_value_low_gap"
-            
-            stats[key]["count"] += 1
-            stats[key]["total_opportunity"] += opp
+        for row in results:
+            if row[3] == 0:
+                continue
+            thresholds = {"apv": float(row[0] or 0), "gap": float(row[1] or 0)}
+            stats[row[2]] = {"count": int(row[3]), "total_opportunity": float(row[4])}
 
-        return {
-            "thresholds": {"apv": apv_threshold, "gap": gap_threshold},
+        result = {
+            "thresholds": thresholds,
             "quadrants": stats
         }
 
+        if approx:
+            # 阈值以下的行占比即近似分位数的实际排名
+            total = sum(q["count"] for q in stats.values())
+            high_apv = stats["high_value_high_gap"]["count"] + stats["high_value_low_gap"]["count"]
+            high_gap = stats["high_value_high_gap"]["count"] + stats["low_value_high_gap"]["count"]
+            result["approximation"] = {
+                "method": "approx_quantile",
+                "rank_error": APPROX_QUANTILE_RANK_ERROR,
+                "realized_rank": {
+                    "apv": 1 - high_apv / total if total else 0.0,
+                    "gap": 1 - high_gap / total if total else 0.0
+                }
+            }
+
+        return result
+
+    @cached_query
+    def get_dashboard_bundle(self, session_id: str, commodity: str = None,
+                             supplier_limit: int = 20, project_limit: int = 20,
+                             approx: bool = False) -> Dict[str, Any]:
+        """
+        单次扫描返回整页数据 (KPI + 品类概览 + Top Suppliers + Top Projects + 集中度)
+
+        使用 GROUPING SETS 在一次扫描中同时完成 总计 / 按品类 / 按供应商 / 按 PN×供应商 四级聚合，
+        再用窗口函数在库内截取各级 Top-N，只有需要展示的行返回 Python。
+        指定 commodity 时为品类页范围（不含品类概览）。
+
+        approx=True 时 PN / 供应商去重计数改用 approx_count_distinct，
+        金额类指标仍为精确值，结果附带 approximation 误差区间。
+        """
+        # GROUPING(commodity_id, supplier_id, part_id) 的位掩码：未参与分组的列对应位为 1
+        total_level, commodity_level, supplier_level, part_level = 7, 3, 5, 4
+
+        query = f"""
+        WITH grouped AS (
+            SELECT 
+                GROUPING(commodity_id, supplier_id, part_id) as grouping_id,
+                commodity_id,
+                supplier_id,
+                part_id,
+                SUM(apv) as total_apv,
+                SUM(covered_apv) as covered_apv,
+                SUM(opportunity) as total_opportunity,
+                {_distinct_expression("part_id", approx)} as pns_count,
+                {_distinct_expression("CASE WHEN covered_apv > 0 THEN part_id END", approx)} as pns_covered,
+                {_distinct_expression("supplier_id", approx)} as supplier_count,
+                {_distinct_expression("CASE WHEN covered_apv > 0 THEN supplier_id END", approx)} as suppliers_covered,
+                arg_max(commodity_id, apv) as main_commodity_id,
+                MAX(gap_percent) as row_gap_percent,
+                ANY_VALUE(part_desc) as part_desc
+            FROM procurement_facts
+            WHERE session_id = ? {COMMODITY_FILTER if commodity else ""}
+            GROUP BY GROUPING SETS ((), (commodity_id), (supplier_id), (part_id, supplier_id))
+        ),
+        ranked AS (
+            SELECT 
+                *,
+                ROW_NUMBER() OVER (PARTITION BY grouping_id ORDER BY total_opportunity DESC) as opportunity_rank,
+                ROW_NUMBER() OVER (PARTITION BY grouping_id ORDER BY total_apv DESC) as apv_rank,
+                COUNT(*) OVER (PARTITION BY grouping_id) as group_count,
+                SUM(POWER(CAST(total_apv AS DOUBLE), 2)) OVER (PARTITION BY grouping_id) as apv_square_sum
+            FROM grouped
+        )
+        SELECT 
+            r.grouping_id,
+            c.commodity_name,
+            s.supplier_name,
+            p.pns,
+            CASE WHEN r.part_id IS NOT NULL THEN r.part_desc END as part_desc,
+            mc.commodity_name as main_commodity,
+            r.total_apv,
+            r.covered_apv,
+            r.total_opportunity,
+            r.pns_count,
+            r.pns_covered,
+            r.supplier_count,
+            r.suppliers_covered,
+            r.row_gap_percent,
+            r.opportunity_rank,
+            r.apv_rank,
+            r.group_count,
+            r.apv_square_sum
+        FROM ranked r
+        LEFT JOIN dim_commodity c ON c.commodity_id = r.commodity_id
+        LEFT JOIN dim_supplier s ON s.supplier_id = r.supplier_id
+        LEFT JOIN dim_part p ON p.part_id = r.part_id
+        LEFT JOIN dim_commodity mc ON mc.commodity_id = r.main_commodity_id
+        WHERE r.grouping_id IN ({total_level}, {commodity_level})
+           OR (r.grouping_id = {supplier_level} AND (r.opportunity_rank <= ? OR r.apv_rank <= 10))
+           OR (r.grouping_id = {part_level} AND r.opportunity_rank <= ?)
+        """
+        params = [session_id, commodity] if commodity else [session_id]
+        results = self.conn.execute(query, params + [supplier_limit, project_limit]).fetchall()
+
+        def gap_percent(apv, opportunity):
+            return (opportunity / apv) * 100 if apv > 0 else 0.0
+
+        total_row = None
+        commodity_rows, supplier_rows, part_rows = [], [], []
+        for row in results:
+            level = row[0]
+            if level == total_level:
+                total_row = row
+            elif level == commodity_level:
+                commodity_rows.append(row)
+            elif level == supplier_level:
+                supplier_rows.append(row)
+            else:
+                part_rows.append(row)
+
+        # KPI (与 get_kpi_summary / get_commodity_kpi 结构一致)
+        total_apv = float(total_row[6] or 0) if total_row else 0.0
+        total_opportunity = float(total_row[8] or 0) if total_row else 0.0
+        kpi = {
+            "total_spending": total_apv,
+            "spending_covered": float(total_row[7] or 0) if total_row else 0.0,
+            "pns_covered": int(total_row[10] or 0) if total_row else 0,
+            "suppliers_covered": int(total_row[12] or 0) if total_row else 0,
+            "total_opportunity": total_opportunity,
+            "gap_percent": gap_percent(total_apv, total_opportunity)
+        }
+
+        # Top Suppliers (按 Opportunity)
+        top_suppliers = []
+        for row in sorted(supplier_rows, key=lambda r: r[14]):
+            if row[14] > supplier_limit:
+                continue
+            item = {
+                "supplier": row[2],
+                "total_apv": float(row[6] or 0),
+                "total_opportunity": float(row[8] or 0),
+                "gap_percent": gap_percent(float(row[6] or 0), float(row[8] or 0))
+            }
+            if not commodity:
+                item["main_commodity"] = row[5]
+            top_suppliers.append(item)
+
+        # Top Projects (PN × Supplier，按 Opportunity)
+        top_projects = [
+            {
+                "pns": row[3],
+                "part_desc": row[4],
+                "supplier": row[2],
+                "apv": float(row[6] or 0),
+                "opportunity": float(row[8] or 0),
+                "gap_percent": float(row[13] or 0)
+            }
+            for row in sorted(part_rows, key=lambda r: r[14])
+        ]
+
+        # 供应商集中度 (按 APV 排名前 10)
+        by_apv = sorted((r for r in supplier_rows if r[15] <= 10), key=lambda r: r[15])
+        if total_apv == 0:
+            concentration = {"cr3": 0.0, "cr5": 0.0, "hhi": 0.0, "total_suppliers": 0, "top_suppliers": []}
+        else:
+            concentration = {
+                "cr3": sum(float(r[6] or 0) for r in by_apv[:3]) / total_apv * 100,
+                "cr5": sum(float(r[6] or 0) for r in by_apv[:5]) / total_apv * 100,
+                "hhi": float(by_apv[0][17]) / (total_apv ** 2) * 10000 if by_apv else 0.0,
+                "total_suppliers": int(by_apv[0][16]) if by_apv else 0,
+                "total_apv": total_apv,
+                "top_suppliers": [
+                    {
+                        "supplier": r[2],
+                        "apv": float(r[6] or 0),
+                        "share": float(r[6] or 0) / total_apv * 100
+                    }
+                    for r in by_apv
+                ]
+            }
+
+        bundle = {
+            "kpi": kpi,
+            "top_suppliers": top_suppliers,
+            "top_projects": top_projects,
+            "concentration": concentration
+        }
+
+        if not commodity:
+            bundle["commodities"] = [
+                {
+                    "commodity": row[1],
+                    "total_apv": float(row[6] or 0),
+                    "covered_apv": float(row[7] or 0),
+                    "total_opportunity": float(row[8] or 0),
+                    "covered_pns": int(row[9] or 0),
+                    "supplier_count": int(row[11] or 0),
+                    "gap_percent": gap_percent(float(row[6] or 0), float(row[8] or 0))
+                }
+                for row in sorted(commodity_rows, key=lambda r: r[15])
+            ]
+
+        if approx:
+            bundle["approximation"] = {
+                "method": "approx_count_distinct",
+                "relative_error": APPROX_DISTINCT_RELATIVE_ERROR,
+                "bounds": {
+                    "pns_covered": _distinct_bounds(kpi["pns_covered"]),
+                    "suppliers_covered": _distinct_bounds(kpi["suppliers_covered"])
+                }
+            }
+
+        return bundle
+
+    # ============ 跨期趋势 (Period Trends) ============
+
+    def _trend_source(self, level: str, periods: List[str] = None, session_ids: List[str] = None):
+        """
+        构造趋势查询的数据来源
+
+        - 指定 session_ids: 读取 agg_session{level}，period 取自 sessions 表
+        - 否则读取增量维护的 agg_period{level}（可按 periods 过滤，默认全部期间）
+
+        两种来源的输出列一致：period, session_id, upload_time + 汇总度量列
+        """
+        if session_ids:
+            placeholders = ",".join(["?"] * len(session_ids))
+            sql = f"""
+            SELECT s.period, s.upload_time, a.*
+            FROM agg_session{level} a
+            JOIN sessions s ON s.session_id = a.session_id
+            WHERE a.session_id IN ({placeholders})
+            """
+            return sql, list(session_ids)
+
+        sql = f"""
+        SELECT a.*, s.upload_time
+        FROM agg_period{level} a
+        JOIN sessions s ON s.session_id = a.session_id
+        """
+        if periods:
+            placeholders = ",".join(["?"] * len(periods))
+            sql += f" WHERE a.period IN ({placeholders})"
+            return sql, list(periods)
+        return sql, []
+
+    def get_kpi_trend(self, periods: List[str] = None, session_ids: List[str] = None) -> List[Dict[str, Any]]:
+        """
+        跨期 KPI 趋势 (每期一行：KPI + 供应商集中度)
+        """
+        kpi_source, kpi_params = self._trend_source("", periods, session_ids)
+        supplier_source, supplier_params = self._trend_source("_supplier", periods, session_ids)
+
+        query = f"""
+        WITH kpi AS ({kpi_source}),
+        suppliers AS (
+            SELECT 
+                session_id,
+                CAST(total_apv AS DOUBLE) as apv,
+                ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY total_apv DESC) as apv_rank
+            FROM ({supplier_source}) src
+        ),
+        concentration AS (
+            SELECT 
+                session_id,
+                SUM(POWER(apv, 2)) / NULLIF(POWER(SUM(apv), 2), 0) * 10000 as hhi,
+                SUM(CASE WHEN apv_rank <= 3 THEN apv ELSE 0 END) / NULLIF(SUM(apv), 0) * 100 as cr3,
+                SUM(CASE WHEN apv_rank <= 5 THEN apv ELSE 0 END) / NULLIF(SUM(apv), 0) * 100 as cr5
+            FROM suppliers
+            GROUP BY session_id
+        )
+        SELECT 
+            k.period,
+            k.session_id,
+            k.total_apv,
+            k.covered_apv,
+            k.pns_covered,
+            k.suppliers_covered,
+            k.total_opportunity,
+            CASE 
+                WHEN k.total_apv > 0 THEN (k.total_opportunity / k.total_apv) * 100 
+                ELSE 0 
+            END as gap_percent,
+            k.supplier_count,
+            c.hhi,
+            c.cr3,
+            c.cr5
+        FROM kpi k
+        LEFT JOIN concentration c ON c.session_id = k.session_id
+        ORDER BY k.period, k.upload_time
+        """
+        results = self.conn.execute(query, kpi_params + supplier_params).fetchall()
+
+        return [
+            {
+                "period": row[0],
+                "session_id": row[1],
+                "total_spending": float(row[2] or 0),
+                "spending_covered": float(row[3] or 0),
+                "pns_covered": int(row[4] or 0),
+                "suppliers_covered": int(row[5] or 0),
+                "total_opportunity": float(row[6] or 0),
+                "gap_percent": float(row[7] or 0),
+                "supplier_count": int(row[8] or 0),
+                "hhi": float(row[9] or 0),
+                "cr3": float(row[10] or 0),
+                "cr5": float(row[11] or 0)
+            }
+            for row in results
+        ]
+
+    def _dimension_trend(self, level: str, dim_table: str, id_column: str, name_column: str,
+                         periods: List[str] = None, session_ids: List[str] = None,
+                         names: List[str] = None, limit: int = 10) -> Dict[str, Any]:
+        """
+        按维度成员 (品类 / 供应商) 输出跨期序列
+
+        未指定 names 时取所选期间内累计 APV 最大的前 limit 个成员
+        """
+        source, params = self._trend_source(level, periods, session_ids)
+
+        if names:
+            placeholders = ",".join(["?"] * len(names))
+            member_filter = f"WHERE d.{name_column} IN ({placeholders})"
+            member_params = list(names)
+            member_limit = ""
+        else:
+            member_filter = ""
+            member_params = []
+            member_limit = "ORDER BY SUM(src.total_apv) DESC LIMIT ?"
+
+        query = f"""
+        WITH src AS ({source}),
+        members AS (
+            SELECT src.{id_column}
+            FROM src
+            JOIN {dim_table} d ON d.{id_column} = src.{id_column}
+            {member_filter}
+            GROUP BY src.{id_column}
+            {member_limit}
+        )
+        SELECT 
+            d.{name_column},
+            src.period,
+            src.session_id,
+            src.total_apv,
+            src.total_opportunity,
+            CASE 
+                WHEN src.total_apv > 0 THEN (src.total_opportunity / src.total_apv) * 100 
+                ELSE 0 
+            END as gap_percent,
+            src.pns_count
+        FROM src
+        JOIN members m ON m.{id_column} = src.{id_column}
+        JOIN {dim_table} d ON d.{id_column} = src.{id_column}
+        ORDER BY d.{name_column}, src.period, src.upload_time
+        """
+        query_params = params + member_params + ([] if names else [limit])
+        results = self.conn.execute(query, query_params).fetchall()
+
+        series: Dict[str, List[Dict[str, Any]]] = {}
+        for row in results:
+            series.setdefault(row[0], []).append({
+                "period": row[1],
+                "session_id": row[2],
+                "total_apv": float(row[3] or 0),
+                "total_opportunity": float(row[4] or 0),
+                "gap_percent": float(row[5] or 0),
+                "pns_count": int(row[6] or 0)
+            })
+
+        return series
+
+    def get_commodity_trend(self, periods: List[str] = None, session_ids: List[str] = None,
+                            commodities: List[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        跨期 Commodity 序列 (APV / Opportunity / Gap% / PN 数)
+        """
+        series = self._dimension_trend(
+            "_commodity", "dim_commodity", "commodity_id", "commodity_name",
+            periods, session_ids, commodities, limit
+        )
+        return [{"commodity": name, "series": points} for name, points in series.items()]
+
+    def get_supplier_trend(self, periods: List[str] = None, session_ids: List[str] = None,
+                           suppliers: List[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        跨期 Supplier 序列 (APV / Opportunity / Gap% / PN 数)
+        """
+        series = self._dimension_trend(
+            "_supplier", "dim_supplier", "supplier_id", "supplier_name",
+            periods, session_ids, suppliers, limit
+        )
+        return [{"supplier": name, "series": points} for name, points in series.items()]
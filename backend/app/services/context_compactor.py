@@ -0,0 +1,185 @@
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # 可选依赖，未安装时按字符规则估算
+    tiktoken = None
+
+# 默认上下文 Token 预算 (可由 LLMConfig.context_token_budget 覆盖)
+DEFAULT_CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "4000"))
+
+# 段落优先级：数字越大越先被裁掉，0 为必留
+SECTION_PRIORITIES = {
+    "scope": 0,
+    "kpi": 0,
+    "coverage": 1,
+    "ranking": 1,
+    "commodity_mix": 2,
+    "single_source_exposure": 2,
+    "matrix_quadrant_stats": 2,
+    "top_commodities": 2,
+    "top_suppliers": 2,
+    "top_suppliers_by_opportunity": 2,
+    "top_opportunities_pns": 3,
+    "supplier_concentration": 3,
+    "concentration": 3,
+    "supplier_concentration.top_suppliers": 5,
+    "concentration.top_suppliers": 5
+}
+DEFAULT_SECTION_PRIORITY = 4
+
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+_encodings: Dict[str, Any] = {}
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    统计文本 Token 数
+
+    已安装 tiktoken 时使用模型对应的编码 (未知模型用 cl100k_base)；
+    否则按 字母串 4 字符 / 数字串 3 字符 / 其余每字符 1 个 估算
+    """
+    if tiktoken is not None:
+        key = model or ""
+        encoding = _encodings.get(key)
+        if encoding is None:
+            try:
+                encoding = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+            _encodings[key] = encoding
+        return len(encoding.encode(text))
+
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        if piece[0].isascii() and piece[0].isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+def _fmt(value: Any) -> str:
+    """数值按量级保留精度：≥1000 取整，≥10 保留 1 位，其余 2 位，去掉末尾 0"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return ""
+        digits = 0 if abs(value) >= 1000 else 1 if abs(value) >= 10 else 2
+        text = f"{value:.{digits}f}"
+        if "." in text:
+            text = text.rstrip("0").rstrip(".")
+        return "0" if text in ("-0", "") else text
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def _is_scalar(value: Any) -> bool:
+    return not isinstance(value, (dict, list, tuple))
+
+
+def _table(rows: List[Dict[str, Any]]) -> List[str]:
+    """字典列表 → 竖线分隔表格，表头只出现一次"""
+    columns: List[str] = []
+    for row in rows:
+        for column in row:
+            if column not in columns:
+                columns.append(column)
+    lines = ["|".join(columns)]
+    lines.extend("|".join(_fmt(row.get(column)) for column in columns) for row in rows)
+    return lines
+
+
+def _sections(name: str, value: Any) -> List[Tuple[str, List[str]]]:
+    """
+    将一个上下文字段拆成若干可独立裁剪的段落
+
+    - 标量：单行 name: value
+    - 字典列表：表格
+    - 值全为字典的字典 (如象限统计)：以键为首列的表格
+    - 混合字典：标量合并为一行 k=v，嵌套字段递归为 name.key 子段落
+    """
+    if _is_scalar(value):
+        return [(name, [f"{name}: {_fmt(value)}"])]
+
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return [(name, [f"## {name}", "(none)"])]
+        if all(isinstance(item, dict) for item in value):
+            return [(name, [f"## {name}"] + _table(list(value)))]
+        return [(name, [f"{name}: " + ", ".join(_fmt(item) for item in value)])]
+
+    scalars = {k: v for k, v in value.items() if _is_scalar(v)}
+    nested = {k: v for k, v in value.items() if not _is_scalar(v)}
+
+    if nested and not scalars and all(isinstance(v, dict) and all(_is_scalar(x) for x in v.values())
+                                      for v in nested.values()):
+        rows = [{"name": key, **item} for key, item in nested.items()]
+        return [(name, [f"## {name}"] + _table(rows))]
+
+    sections = []
+    if scalars:
+        sections.append((name, [f"## {name}", " ".join(f"{k}={_fmt(v)}" for k, v in scalars.items())]))
+    for key, item in nested.items():
+        sections.extend(_sections(f"{name}.{key}", item))
+    return sections
+
+
+def compact_context(data: Dict[str, Any], budget: Optional[int] = None,
+                    model: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    将上下文数据渲染为紧凑文本，超出 Token 预算时按优先级从低到高整段裁掉
+
+    Args:
+        data: _fetch_context_data 返回的上下文字典
+        budget: Token 预算，默认 DEFAULT_CONTEXT_TOKEN_BUDGET
+        model: 用于选择 tiktoken 编码
+
+    Returns:
+        (文本, {"tokens", "budget", "omitted"})
+    """
+    budget = budget or DEFAULT_CONTEXT_TOKEN_BUDGET
+    sections: List[Tuple[str, List[str]]] = []
+    for name, value in data.items():
+        sections.extend(_sections(name, value))
+
+    def priority(section_name: str) -> int:
+        if section_name in SECTION_PRIORITIES:
+            return SECTION_PRIORITIES[section_name]
+        parent = section_name.split(".")[0]
+        return SECTION_PRIORITIES.get(parent, DEFAULT_SECTION_PRIORITY)
+
+    def render(kept: List[Tuple[str, List[str]]], omitted: List[str]) -> str:
+        lines = [line for _, section in kept for line in section]
+        if omitted:
+            lines.append(f"(omitted for length: {', '.join(omitted)})")
+        return "\n".join(lines)
+
+    kept = list(sections)
+    omitted: List[str] = []
+    text = render(kept, omitted)
+    tokens = count_tokens(text, model)
+
+    # 优先级相同时先裁后出现的段落
+    drop_order = sorted(
+        (s for s in sections if priority(s[0]) > 0),
+        key=lambda s: (-priority(s[0]), -sections.index(s))
+    )
+    for section in drop_order:
+        if tokens <= budget:
+            break
+        kept.remove(section)
+        omitted.append(section[0])
+        text = render(kept, omitted)
+        tokens = count_tokens(text, model)
+
+    return text, {"tokens": tokens, "budget": budget, "omitted": omitted}
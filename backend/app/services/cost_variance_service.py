@@ -1,17 +1,30 @@
 import hashlib
+import os
+import re
+import tempfile
 import uuid
 import json
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from io import BytesIO
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
 from app.database.init import get_connection
 from app.services.cost_sheet_parser import CostSheetParser
 from app.services.cost_tree_builder import CostTreeBuilder
+from app.services.search_service import search_index
 from app.schemas.cost_variance import (
     CostSheetData, CostTreeNode, UploadCostSheetResponse, 
     GetCostTreeResponse, SessionInfo, GetSessionsResponse
 )
 
+# Excel 导出格式
+EXCEL_MONEY_FORMAT = '#,##0.00'
+EXCEL_PCT_FORMAT = '0.00"%"'
+EXCEL_FETCH_SIZE = 1000
+
+
 class CostVarianceService:
     """
     成本差异分析服务
@@ -56,7 +69,10 @@ class CostVarianceService:
         # 6. 保存加工成本分解
         self._save_processing_breakdown(session_id, parsed_data)
         
-        # 7. 返回响应
+        # 7. 零件写入检索索引
+        search_index.refresh(self.conn)
+        
+        # 8. 返回响应
         total_variance = parsed_data.supplier_price - parsed_data.target_price
         variance_pct = (total_variance / parsed_data.target_price * 100) if parsed_data.target_price != 0 else 0
         
@@ -167,10 +183,196 @@ class CostVarianceService:
             self.conn.execute("DELETE FROM processing_breakdown WHERE session_id = ?", [session_id])
             # 删除会话
             self.conn.execute("DELETE FROM part_cost_sessions WHERE session_id = ?", [session_id])
+            # 从检索索引中移除
+            search_index.refresh(self.conn)
             return True
         except Exception:
             return False
     
+    def export_excel(self, session_ids: List[str], view: str = 'by_process') -> str:
+        """
+        导出成本树 Excel (openpyxl write_only 模式)
+        
+        - 每个会话一个成本树工作表，按层级设置分级显示 (outline)，名称按层级缩进
+        - 所有会话的加工成本分解汇总到一个工作表
+        - 行直接由 cost_items 的递归 CTE 先序遍历结果逐批写出，不构建 CostTreeNode，
+          多会话导出时内存占用与会话数无关
+        
+        Args:
+            session_ids: 会话ID列表 (按顺序生成工作表)
+            view: 视角 (by_process | by_type)
+        
+        Returns:
+            str: 临时文件路径 (调用方负责删除)
+        """
+        sessions = self.conn.execute("""
+            SELECT session_id, part_number, part_description, supplier_name, currency,
+                   target_price, supplier_price, total_variance, variance_pct
+            FROM part_cost_sessions
+            WHERE list_contains(?, session_id)
+            ORDER BY list_position(?, session_id)
+        """, [session_ids, session_ids]).fetchall()
+        
+        missing = set(session_ids) - {row[0] for row in sessions}
+        if missing:
+            raise ValueError(f"Session not found: {', '.join(sorted(missing))}")
+        
+        wb = Workbook(write_only=True)
+        titles = {'processing breakdown'}
+        for session in sessions:
+            self._write_cost_tree_sheet(wb, session, view, titles)
+        self._write_processing_sheet(wb, session_ids)
+        
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            wb.save(path)
+        except Exception:
+            os.remove(path)
+            raise
+        return path
+    
+    # ============ 私有方法：Excel 导出 ============
+    
+    def _write_cost_tree_sheet(self, wb: Workbook, session: tuple, view: str, titles: set):
+        """写入单个会话的成本树工作表 (父项在上，子项可折叠)"""
+        session_id, part_number, part_description, supplier_name, currency = session[:5]
+        ws = wb.create_sheet(self._sheet_title(part_number or session_id, titles))
+        ws.sheet_properties.outlinePr.summaryBelow = False
+        ws.column_dimensions['A'].width = 48
+        ws.column_dimensions['B'].width = 14
+        for column in 'CDEF':
+            ws.column_dimensions[column].width = 16
+        
+        bold = Font(bold=True)
+        ws.append([self._cell(ws, 'Part Number', font=bold), part_number])
+        ws.append([self._cell(ws, 'Description', font=bold), part_description])
+        ws.append([self._cell(ws, 'Supplier', font=bold), supplier_name])
+        ws.append([self._cell(ws, 'Currency', font=bold), currency])
+        ws.append([
+            self._cell(ws, 'Target / Supplier Price', font=bold),
+            self._cell(ws, float(session[5] or 0), number_format=EXCEL_MONEY_FORMAT),
+            self._cell(ws, float(session[6] or 0), number_format=EXCEL_MONEY_FORMAT),
+            self._cell(ws, float(session[7] or 0), number_format=EXCEL_MONEY_FORMAT),
+            self._cell(ws, float(session[8] or 0), number_format=EXCEL_PCT_FORMAT)
+        ])
+        ws.append([])
+        ws.append([self._cell(ws, header, font=bold) for header in
+                   ('Item', 'Category', 'Target Cost', 'Actual Cost', 'Variance', 'Variance %')])
+        row_idx = 7
+        
+        # 先序遍历：路径为自根节点起各级 (sort_order, item_id)，按路径排序即得父子相邻的展示顺序
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                WITH RECURSIVE tree AS (
+                    SELECT item_id, level, category, item_name,
+                           target_cost, actual_cost, variance, variance_pct,
+                           [{'sort_order': sort_order, 'item_id': item_id}] AS path
+                    FROM cost_items
+                    WHERE session_id = ? AND item_id LIKE ? AND parent_id IS NULL
+                    UNION ALL
+                    SELECT c.item_id, c.level, c.category, c.item_name,
+                           c.target_cost, c.actual_cost, c.variance, c.variance_pct,
+                           list_append(t.path, {'sort_order': c.sort_order, 'item_id': c.item_id})
+                    FROM cost_items c
+                    JOIN tree t ON c.parent_id = t.item_id
+                    WHERE c.session_id = ?
+                )
+                SELECT level, category, item_name, target_cost, actual_cost, variance, variance_pct
+                FROM tree
+                ORDER BY path
+            """, [session_id, f"{view}_%", session_id])
+            
+            root_level = None
+            while True:
+                rows = cursor.fetchmany(EXCEL_FETCH_SIZE)
+                if not rows:
+                    break
+                for level, category, item_name, target, actual, variance, variance_pct in rows:
+                    if root_level is None:
+                        root_level = level
+                    depth = max(level - root_level, 0)
+                    font = bold if depth <= 1 else None
+                    row_idx += 1
+                    # Excel 分级显示最多 7 级
+                    ws.row_dimensions[row_idx].outlineLevel = min(depth, 7)
+                    ws.append([
+                        self._cell(ws, item_name, font=font, alignment=Alignment(indent=depth)),
+                        category,
+                        self._cell(ws, float(target or 0), font=font, number_format=EXCEL_MONEY_FORMAT),
+                        self._cell(ws, float(actual or 0), font=font, number_format=EXCEL_MONEY_FORMAT),
+                        self._cell(ws, float(variance or 0), font=font, number_format=EXCEL_MONEY_FORMAT),
+                        self._cell(ws, float(variance_pct or 0), font=font, number_format=EXCEL_PCT_FORMAT)
+                    ])
+                    # 行属性在 append 时已写出，及时释放
+                    del ws.row_dimensions[row_idx]
+        finally:
+            cursor.close()
+    
+    def _write_processing_sheet(self, wb: Workbook, session_ids: List[str]):
+        """写入加工成本分解工作表 (所有导出会话汇总)"""
+        ws = wb.create_sheet('Processing Breakdown')
+        ws.column_dimensions['A'].width = 20
+        ws.column_dimensions['C'].width = 40
+        bold = Font(bold=True)
+        ws.append([self._cell(ws, header, font=bold) for header in (
+            'Part Number', 'Process ID', 'Process',
+            'Setup Target', 'Setup Actual', 'Labor Target', 'Labor Actual',
+            'Burden Target', 'Burden Actual', 'Total Target', 'Total Actual', 'Variance'
+        )])
+        
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT s.part_number, p.process_id, p.process_desc,
+                       p.setup_cost_target, p.setup_cost_actual,
+                       p.labor_cost_target, p.labor_cost_actual,
+                       p.burden_cost_target, p.burden_cost_actual
+                FROM processing_breakdown p
+                JOIN part_cost_sessions s ON s.session_id = p.session_id
+                WHERE list_contains(?, p.session_id)
+                ORDER BY list_position(?, p.session_id), p.process_id
+            """, [session_ids, session_ids])
+            while True:
+                rows = cursor.fetchmany(EXCEL_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    costs = [float(value or 0) for value in row[3:]]
+                    total_target = round(costs[0] + costs[2] + costs[4], 2)
+                    total_actual = round(costs[1] + costs[3] + costs[5], 2)
+                    ws.append(list(row[:3]) + [
+                        self._cell(ws, value, number_format=EXCEL_MONEY_FORMAT)
+                        for value in costs + [total_target, total_actual, round(total_actual - total_target, 2)]
+                    ])
+        finally:
+            cursor.close()
+    
+    @staticmethod
+    def _cell(ws, value, font: Font = None, alignment: Alignment = None, number_format: str = None):
+        """构造 write_only 模式下带样式的单元格"""
+        cell = WriteOnlyCell(ws, value=value)
+        if font:
+            cell.font = font
+        if alignment:
+            cell.alignment = alignment
+        if number_format:
+            cell.number_format = number_format
+        return cell
+    
+    @staticmethod
+    def _sheet_title(name: str, titles: set) -> str:
+        """生成合法且不重复的工作表名 (最长 31 字符，不含 []:*?/\\)"""
+        base = re.sub(r'[\[\]:*?/\\]', '_', str(name))[:31] or 'Sheet'
+        title, n = base, 1
+        while title.lower() in titles:
+            n += 1
+            suffix = f" ({n})"
+            title = base[:31 - len(suffix)] + suffix
+        titles.add(title.lower())
+        return title
+    
     # ============ 私有方法：数据库操作 ============
     
     def _save_session(self, session_id: str, data: CostSheetData, filename: str, file_hash: str):
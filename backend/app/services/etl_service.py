@@ -1,6 +1,14 @@
+import threading
 import pandas as pd
 from typing import List, Dict, Any
-from app.database.init import get_connection
+from app.database.init import get_connection, populate_dimensions
+from app.database.rollups import build_session_rollups, delete_session_rollups, refresh_period_rollups
+from app.services.result_cache import analytics_cache
+from app.services.search_service import search_index
+
+# 写事务串行化：入库在线程池中并发执行，并发补齐维度表会在名称唯一键上冲突
+# (解析与清洗仍可并行，只有写库部分排队)
+_write_lock = threading.Lock()
 
 class ETLService:
     def __init__(self):
@@ -147,17 +155,88 @@ class ETLService:
                 else:
                     df_final[db_col] = 0
         
-        # 批量插入
-        records = df_final.values.tolist()
-        placeholders = ",".join(["?"] * len(db_columns))
-        columns_str = ",".join(db_columns)
+        # 批量插入：注册 DataFrame 后先补齐维度表，再按代理键写入事实表
+        with _write_lock:
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                self.conn.register("staging_records", df_final)
+                populate_dimensions(self.conn, "staging_records")
+                self.conn.execute("""
+                    INSERT INTO procurement_facts (
+                        session_id, part_id, supplier_id, commodity_id, currency,
+                        quantity, price, apv, covered_apv,
+                        target_cost, target_spend, gap_to_target, opportunity, gap_percent, part_desc
+                    )
+                    SELECT
+                        r.session_id, p.part_id, s.supplier_id, c.commodity_id, r.currency,
+                        r.quantity, r.price, r.apv, r.covered_apv,
+                        r.target_cost, r.target_spend, r.gap_to_target, r.opportunity, r.gap_percent, r.part_desc
+                    FROM staging_records r
+                    JOIN dim_part p ON p.pns = r.pns
+                    JOIN dim_supplier s ON s.supplier_name = r.supplier
+                    JOIN dim_commodity c ON c.commodity_name = r.commodity
+                """)
+                # 同一事务内写入汇总表，Session 一经提交即可直接读取汇总
+                build_session_rollups(self.conn, session_id)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            finally:
+                self.conn.unregister("staging_records")
+        
+        # 重新入库时失效该 Session 的分析缓存
+        analytics_cache.invalidate_session(session_id)
+        
+        # 新增的零件 / 供应商增量写入检索索引
+        search_index.refresh(self.conn)
+        
+        return len(df_final)
+    
+    def refresh_period(self, period: str):
+        """
+        刷新指定 Period 的跨期汇总（Session 完成或删除后调用）
+        
+        只重写该 Period 的汇总行，历史期间无需重算
+        """
+        with _write_lock:
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                refresh_period_rollups(self.conn, period)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+    
+    def delete_session_records(self, session_id: str) -> int:
+        """
+        删除指定 Session 的采购明细、汇总与 LLM 报告缓存 / 批量任务，并失效分析缓存
         
-        self.conn.executemany(
-            f"INSERT INTO procurement_records ({columns_str}) VALUES ({placeholders})",
-            records
-        )
+        Returns:
+            删除的明细行数
+        """
+        with _write_lock:
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                deleted = self.conn.execute(
+                    "SELECT COUNT(*) FROM procurement_facts WHERE session_id = ?",
+                    [session_id]
+                ).fetchone()[0]
+                self.conn.execute("DELETE FROM procurement_facts WHERE session_id = ?", [session_id])
+                delete_session_rollups(self.conn, session_id)
+                self.conn.execute("DELETE FROM llm_report_cache WHERE session_id = ?", [session_id])
+                self.conn.execute("""
+                    DELETE FROM llm_report_job_items
+                    WHERE job_id IN (SELECT job_id FROM llm_report_jobs WHERE session_id = ?)
+                """, [session_id])
+                self.conn.execute("DELETE FROM llm_report_jobs WHERE session_id = ?", [session_id])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
         
-        return len(records)
+        analytics_cache.invalidate_session(session_id)
+        return deleted
     
     def get_records_by_session(self, session_id: str) -> List[Dict[str, Any]]:
         """查询指定 Session 的所有记录"""
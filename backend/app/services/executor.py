@@ -0,0 +1,140 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class BoundedExecutor:
+    """
+    有界线程池
+
+    路由中的 DuckDB / pandas 调用均为同步阻塞，直接在 async 路由中执行会卡住事件循环。
+    按任务类型拆分线程池，重任务（入库、解析、导出）排队时不占用交互式查询的线程。
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queued = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """在线程池中执行同步函数并等待结果"""
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self.total_wait += started - submitted
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self.total_run += time.perf_counter() - started
+
+        future = self._pool.submit(task)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 请求被取消 (如客户端断开) 时尚在排队的任务不会再执行，修正排队计数
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度与耗时统计"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "active": self.active,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": self.total_wait / self.completed * 1000 if self.completed else 0.0,
+                "avg_run_ms": self.total_run / self.completed * 1000 if self.completed else 0.0
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+# 重任务：文件解析、入库、删除、导出
+ingest_executor = BoundedExecutor("ingest", int(os.getenv("INGEST_WORKERS", "2")))
+# 交互式查询：Dashboard / 分析 / 检索
+analytics_executor = BoundedExecutor("analytics", int(os.getenv("ANALYTICS_WORKERS", "8")))
+
+
+async def run_ingest(func: Callable, *args, **kwargs) -> Any:
+    """在入库线程池中执行"""
+    return await ingest_executor.run(func, *args, **kwargs)
+
+
+async def run_analytics(func: Callable, *args, **kwargs) -> Any:
+    """在分析线程池中执行"""
+    return await analytics_executor.run(func, *args, **kwargs)
+
+
+def executor_stats() -> Dict[str, Any]:
+    return {
+        "ingest": ingest_executor.stats(),
+        "analytics": analytics_executor.stats()
+    }
+
+
+def shutdown_executors(wait: bool = True):
+    ingest_executor.shutdown(wait)
+    analytics_executor.shutdown(wait)
+
+
+async def iterate_in_ingest(iterator):
+    """逐块在入库线程池中推进同步迭代器 (流式导出)，块与块之间不占用工作线程"""
+    sentinel = object()
+    # 推进与关闭互斥：客户端断开时可能仍有一次 next 在工作线程中执行
+    lock = threading.Lock()
+
+    def advance():
+        with lock:
+            return next(iterator, sentinel)
+
+    try:
+        while True:
+            chunk = await ingest_executor.run(advance)
+            if chunk is sentinel:
+                break
+            yield chunk
+    finally:
+        # 客户端提前断开时关闭生成器，释放游标与临时文件；
+        # 关闭同样放到工作线程中，等在途的 next 结束后执行 (不阻塞事件循环，也不会在生成器执行中途关闭)
+        close = getattr(iterator, "close", None)
+        if close:
+            def close_locked():
+                with lock:
+                    close()
+
+            try:
+                await asyncio.shield(ingest_executor.run(close_locked))
+            except RuntimeError:
+                # 线程池已关闭 (服务停止)，此时不再有在途的 next
+                close_locked()
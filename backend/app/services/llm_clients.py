@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+from openai import AsyncOpenAI
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+class _PooledClient:
+    def __init__(self, client: AsyncOpenAI):
+        self.client = client
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.evicted = False
+
+
+class LLMClientRegistry:
+    """
+    LLM 客户端复用池
+
+    每个 AsyncOpenAI 客户端自带 HTTP 连接池，按请求新建会导致每次都重新建连与 TLS 握手。
+    按 (base_url, api_key 的 SHA-256) 复用客户端，最多保留 max_clients 个 (LRU)，
+    空闲超过 idle_ttl 秒的客户端被关闭；正在流式输出的客户端延迟到释放后再关闭。
+    """
+
+    def __init__(self, max_clients: int = 16, idle_ttl: float = 600):
+        self.max_clients = max_clients
+        self.idle_ttl = idle_ttl
+        self._clients: "OrderedDict[Tuple[str, str], _PooledClient]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(base_url: Optional[str], api_key: str) -> Tuple[str, str]:
+        # 不在内存中以明文作为键保存 api_key
+        return (base_url or DEFAULT_BASE_URL).rstrip("/"), hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    @asynccontextmanager
+    async def lease(self, api_key: str, base_url: Optional[str] = None):
+        """
+        借出一个客户端，退出上下文时归还
+
+        Yields:
+            AsyncOpenAI 客户端
+        """
+        key = self._key(base_url, api_key)
+        async with self._lock:
+            await self._evict_idle()
+            entry = self._clients.get(key)
+            if entry is None:
+                self.misses += 1
+                entry = _PooledClient(AsyncOpenAI(api_key=api_key, base_url=key[0]))
+                self._clients[key] = entry
+                while len(self._clients) > self.max_clients:
+                    _, oldest = self._clients.popitem(last=False)
+                    await self._evict(oldest)
+            else:
+                self.hits += 1
+                self._clients.move_to_end(key)
+            entry.in_use += 1
+
+        try:
+            yield entry.client
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+            if entry.evicted and entry.in_use == 0:
+                await entry.client.close()
+
+    async def _evict_idle(self):
+        now = time.monotonic()
+        for key in [k for k, e in self._clients.items() if e.in_use == 0 and now - e.last_used > self.idle_ttl]:
+            await self._evict(self._clients.pop(key))
+
+    async def _evict(self, entry: _PooledClient):
+        self.evictions += 1
+        entry.evicted = True
+        if entry.in_use == 0:
+            await entry.client.close()
+
+    async def close_all(self):
+        """关闭全部客户端 (应用退出时调用)"""
+        async with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+        for entry in entries:
+            entry.evicted = True
+            await entry.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._clients),
+            "in_use": sum(e.in_use for e in self._clients.values()),
+            "max_clients": self.max_clients,
+            "idle_ttl": self.idle_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+# 进程内共享的 LLM 客户端池
+llm_clients = LLMClientRegistry(
+    max_clients=int(os.getenv("LLM_MAX_CLIENTS", "16")),
+    idle_ttl=float(os.getenv("LLM_CLIENT_IDLE_SECONDS", "600"))
+)
@@ -0,0 +1,192 @@
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from app.database.init import get_connection
+from app.services.context_compactor import count_tokens
+
+# 模型单价 (美元 / 百万 Token)，如 {"gpt-4o": {"input": 2.5, "output": 10}}；未配置的模型不计算费用
+MODEL_PRICING: Dict[str, Dict[str, float]] = json.loads(os.getenv("LLM_PRICING_JSON", "{}") or "{}")
+
+
+class LLMCall:
+    """
+    单次报告生成的计量：上下文组装耗时、首 Token 延迟 (TTFT)、输出速率、Token 用量与错误
+
+    服务端在流末尾返回 usage 时使用其精确值，否则按 count_tokens 估算 (usage_reported=False)
+    """
+
+    def __init__(self, session_id: Optional[str], context_type: str, context_value: Optional[str],
+                 model: str, source: str = "report"):
+        self.call_id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.context_type = context_type
+        self.context_value = context_value
+        self.model = model
+        self.source = source
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.context_ms: Optional[float] = None
+        self.ttft_ms: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens = 0
+        self.usage_reported = False
+        self.finish_reason: Optional[str] = None
+        self._started = time.perf_counter()
+        self._request_at: Optional[float] = None
+        self._first_token_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def context_ready(self, messages: List[Dict[str, str]]):
+        """上下文组装完成 (Prompt Token 先按估算值记录)"""
+        self.context_ms = (time.perf_counter() - self._started) * 1000
+        self.prompt_tokens = sum(count_tokens(m["content"], self.model) for m in messages)
+
+    def request_sent(self):
+        self._request_at = time.perf_counter()
+
+    def chunk(self, text: str):
+        if self._first_token_at is None:
+            self._first_token_at = time.perf_counter()
+            self.ttft_ms = (self._first_token_at - (self._request_at or self._started)) * 1000
+        if not self.usage_reported:
+            self.completion_tokens += count_tokens(text, self.model)
+
+    def usage(self, prompt_tokens: int, completion_tokens: int):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.usage_reported = True
+
+    def finish(self, status: str = None, error: str = None):
+        self._finished_at = time.perf_counter()
+        if self._request_at is not None:
+            self.duration_ms = (self._finished_at - self._request_at) * 1000
+        if status:
+            self.status = status
+        if error:
+            self.status = "error"
+            self.error = error[:500]
+
+    @property
+    def truncated(self) -> bool:
+        """输出因 max_tokens / 上下文长度被截断 (finish_reason == "length")，不应写入报告缓存"""
+        return self.finish_reason == "length"
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """首 Token 之后的输出速率"""
+        if self._first_token_at is None or self._finished_at is None or not self.completion_tokens:
+            return None
+        elapsed = self._finished_at - self._first_token_at
+        return self.completion_tokens / elapsed if elapsed > 0 else None
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """按 LLM_PRICING_JSON 估算费用 (美元)，未配置单价时返回 None"""
+    price = MODEL_PRICING.get(model)
+    if not price:
+        return None
+    return ((prompt_tokens or 0) * price.get("input", 0) + (completion_tokens or 0) * price.get("output", 0)) / 1e6
+
+
+class LLMMetricsStore:
+    """LLM 调用计量的持久化与汇总 (llm_call_metrics 表)"""
+
+    def __init__(self):
+        self.conn = get_connection()
+
+    def record(self, call: LLMCall):
+        self.conn.execute("""
+            INSERT INTO llm_call_metrics (
+                call_id, session_id, context_type, context_value, source, model, status,
+                context_ms, ttft_ms, duration_ms, tokens_per_second,
+                prompt_tokens, completion_tokens, usage_reported, error
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [call.call_id, call.session_id, call.context_type, call.context_value, call.source, call.model,
+              call.status, call.context_ms, call.ttft_ms, call.duration_ms, call.tokens_per_second,
+              call.prompt_tokens, call.completion_tokens, call.usage_reported, call.error])
+
+    def summary(self, hours: Optional[float] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        按 (模型, 上下文类型) 汇总
+
+        延迟与速率分位数只统计实际调用 LLM 且成功的记录，缓存回放单独计数；
+        Token 与费用统计成功及中途断开 / 取消的调用 (出错的调用按未计费处理)
+        """
+        conditions, params = [], []
+        if hours:
+            conditions.append("created_at >= CURRENT_TIMESTAMP - to_microseconds(CAST(? * 3600e6 AS BIGINT))")
+            params.append(hours)
+        if session_id:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        rows = self.conn.execute(f"""
+            WITH calls AS (
+                SELECT *, status = 'ok' AS succeeded, status NOT IN ('cached', 'error') AS billed
+                FROM llm_call_metrics
+                {where}
+            )
+            SELECT
+                model,
+                context_type,
+                COUNT(*),
+                COUNT(*) FILTER (WHERE status = 'cached'),
+                COUNT(*) FILTER (WHERE status = 'error'),
+                quantile_cont(context_ms, 0.5),
+                quantile_cont(ttft_ms, 0.5) FILTER (WHERE succeeded),
+                quantile_cont(ttft_ms, 0.95) FILTER (WHERE succeeded),
+                quantile_cont(duration_ms, 0.5) FILTER (WHERE succeeded),
+                quantile_cont(duration_ms, 0.95) FILTER (WHERE succeeded),
+                MAX(duration_ms) FILTER (WHERE succeeded),
+                AVG(tokens_per_second) FILTER (WHERE succeeded),
+                COALESCE(SUM(prompt_tokens) FILTER (WHERE billed), 0),
+                COALESCE(SUM(completion_tokens) FILTER (WHERE billed), 0),
+                BOOL_AND(usage_reported) FILTER (WHERE billed)
+            FROM calls
+            GROUP BY model, context_type
+            ORDER BY COUNT(*) DESC
+        """, params).fetchall()
+
+        def ms(value):
+            return round(float(value), 1) if value is not None else None
+
+        groups = []
+        for row in rows:
+            llm_calls = int(row[2]) - int(row[3])
+            cost = estimate_cost(row[0], int(row[12]), int(row[13]))
+            groups.append({
+                "model": row[0],
+                "context_type": row[1],
+                "calls": int(row[2]),
+                "cached": int(row[3]),
+                "errors": int(row[4]),
+                "error_rate": int(row[4]) / llm_calls if llm_calls else 0,
+                "context_ms_p50": ms(row[5]),
+                "ttft_ms_p50": ms(row[6]),
+                "ttft_ms_p95": ms(row[7]),
+                "duration_ms_p50": ms(row[8]),
+                "duration_ms_p95": ms(row[9]),
+                "duration_ms_max": ms(row[10]),
+                "tokens_per_second": ms(row[11]),
+                "prompt_tokens": int(row[12]),
+                "completion_tokens": int(row[13]),
+                "tokens_estimated": row[14] is False,  # 部分调用未返回 usage，Token 为估算值
+                "estimated_cost": round(cost, 4) if cost is not None else None
+            })
+
+        costs = [g["estimated_cost"] for g in groups if g["estimated_cost"] is not None]
+        return {
+            "groups": groups,
+            "totals": {
+                "calls": sum(g["calls"] for g in groups),
+                "cached": sum(g["cached"] for g in groups),
+                "errors": sum(g["errors"] for g in groups),
+                "prompt_tokens": sum(g["prompt_tokens"] for g in groups),
+                "completion_tokens": sum(g["completion_tokens"] for g in groups),
+                "estimated_cost": round(sum(costs), 4) if costs else None
+            }
+        }
@@ -1,12 +1,31 @@
-import json
-from typing import AsyncGenerator, Any
-from openai import AsyncOpenAI
+import asyncio
+import os
+from typing import AsyncGenerator, Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from app.services.analytics_service import AnalyticsService
+from app.services.executor import run_analytics
+from app.services.llm_clients import llm_clients
+from app.services.report_cache import ReportCache, report_cache_key
+from app.services.context_compactor import compact_context
+from app.services.map_reduce_report import MapReduceReporter
+from app.services.llm_metrics import LLMCall, LLMMetricsStore
 from app.schemas.llm import LLMConfig
 
+# 品类报告中列出的高 Opportunity PN 数量
+CONTEXT_TOP_OPPORTUNITIES = 10
+
+# 缓存回放时每个片段的字符数 (不做延时，一次性尽快写出)
+REPLAY_CHUNK_SIZE = 512
+
+# 流式请求是否要求服务端在末尾返回 Token 用量 (stream_options.include_usage)；
+# 默认关闭，部分兼容接口会拒绝未知参数，未返回 usage 时按 count_tokens 估算
+STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "0") == "1"
+
 class LLMService:
     def __init__(self):
         self.analytics = AnalyticsService()
+        self.report_cache = ReportCache()
+        self.metrics = LLMMetricsStore()
+        self.map_reduce = MapReduceReporter(self)
 
     def _get_system_prompt(self) -> str:
         return """You are an expert Procurement Analyst for Nexteer Automotive. 
@@ -21,19 +40,24 @@ Format your response in Markdown. Use bolding for key metrics.
 Keep it concise, professional, and data-driven.
 """
 
-    async def _fetch_context_data(self, session_id: str, context_type: str, context_value: str = None) -> str:
+    async def _fetch_context_data(self, session_id: str, context_type: str, context_value: str = None) -> Dict[str, Any]:
         """
-        根据上下文类型获取结构化数据，并转换为 JSON 字符串供 LLM 分析
+        根据上下文类型获取结构化数据，由 compact_context 渲染为紧凑文本供 LLM 分析
+
+        各项查询互不依赖，在 analytics 线程池中并发执行，总耗时取决于最慢的一条；
+        象限统计与 Top PNs 均在库内完成，不再把整个 Opportunity Matrix 拉回 Python
         """
         data = {}
         
         if context_type == "dashboard":
             # 获取全局数据
-            kpi = self.analytics.get_kpi_summary(session_id)
-            commodities = self.analytics.get_commodity_overview(session_id)
-            top_suppliers = self.analytics.get_top_suppliers(session_id, limit=5)
-            concentration = self.analytics.get_supplier_concentration(session_id)
-            matrix_stats = self.analytics.get_matrix_stats(session_id)
+            kpi, commodities, top_suppliers, concentration, matrix_stats = await asyncio.gather(
+                run_analytics(self.analytics.get_kpi_summary, session_id),
+                run_analytics(self.analytics.get_commodity_overview, session_id),
+                run_analytics(self.analytics.get_top_suppliers, session_id, limit=5),
+                run_analytics(self.analytics.get_supplier_concentration, session_id),
+                run_analytics(self.analytics.get_matrix_stats, session_id)
+            )
             
             data = {
                 "scope": "Global Dashboard",
@@ -47,14 +71,28 @@ Keep it concise, professional, and data-driven.
         elif context_type == "commodity":
             # 获取品类数据
             commodity = context_value
-            kpi = self.analytics.get_commodity_kpi(session_id, commodity)
-            top_suppliers = self.analytics.get_commodity_top_suppliers(session_id, commodity, limit=5)
-            matrix = self.analytics.get_opportunity_matrix(session_id, commodity)
-            concentration = self.analytics.get_supplier_concentration(session_id, commodity)
-            matrix_stats = self.analytics.get_matrix_stats(session_id, commodity)
+            kpi, top_suppliers, top_projects, concentration, matrix_stats = await asyncio.gather(
+                run_analytics(self.analytics.get_commodity_kpi, session_id, commodity),
+                run_analytics(self.analytics.get_commodity_top_suppliers, session_id, commodity, limit=5),
+                run_analytics(self.analytics.get_top_projects, session_id,
+                              limit=CONTEXT_TOP_OPPORTUNITIES, commodity=commodity),
+                run_analytics(self.analytics.get_supplier_concentration, session_id, commodity),
+                run_analytics(self.analytics.get_matrix_stats, session_id, commodity)
+            )
             
-            # 简化 Matrix 数据，只取 Opportunity 最大的前 10 个点
-            top_opportunities = sorted(matrix, key=lambda x: x['opportunity'], reverse=True)[:10]
+            # Opportunity 最大的前 N 个 PN
+            top_opportunities = [
+                {
+                    "pns": item["pns"],
+                    "part_desc": item["part_desc"],
+                    "supplier": item["supplier"],
+                    "commodity": commodity,
+                    "apv": item["apv"],
+                    "gap_percent": item["gap_percent"],
+                    "opportunity": item["opportunity"]
+                }
+                for item in top_projects
+            ]
             
             data = {
                 "scope": f"Commodity: {commodity}",
@@ -70,41 +108,54 @@ Keep it concise, professional, and data-driven.
                 }
             }
 
-        return json.dumps(data, indent=2, ensure_ascii=False)
+        elif context_type == "supplier":
+            # 获取供应商数据 (单条查询，结果进入分析缓存)
+            supplier = context_value
+            profile = await run_analytics(self.analytics.get_supplier_profile, session_id, supplier,
+                                          top_n=CONTEXT_TOP_OPPORTUNITIES)
+            
+            data = {
+                "scope": f"Supplier: {supplier}",
+                "kpi": profile["kpi"],
+                "ranking": profile["ranking"],
+                "commodity_mix": profile["commodity_mix"],
+                "top_opportunities_pns": profile["top_pns"],
+                "single_source_exposure": profile["single_source"]
+            }
 
-    async def generate_report_stream(self, session_id: str, context_type: str, context_value: str, config: LLMConfig, prompt_template: str = None) -> AsyncGenerator[str, None]:
+        return data
+
+    async def _build_messages(self, session_id: str, context_type: str, context_value: str, config: LLMConfig,
+                              prompt_template: str = None, mode: str = "standard") -> List[Dict[str, str]]:
         """
-        生成流式报告
+        获取数据上下文并组装完整的对话消息
+
+        Args:
+            mode: dashboard 报告的上下文模式，hierarchical / auto 时由 MapReduceReporter 先分组摘要全部品类
         """
-        # 1. 获取数据上下文
-        context_data = await self._fetch_context_data(session_id, context_type, context_value)
-        
-        # 2. 初始化 OpenAI Client (支持兼容接口)
-        client = AsyncOpenAI(
-            api_key=config.api_key,
-            base_url=config.base_url if config.base_url else "https://api.openai.com/v1"
-        )
+        # 1. 获取数据上下文 (紧凑表格 + 取整数值，超出 Token 预算时按优先级裁剪)
+        if context_type == "dashboard" and await self._use_hierarchical(session_id, mode):
+            context_data, _ = await self.map_reduce.build_context(session_id, config)
+        else:
+            data = await self._fetch_context_data(session_id, context_type, context_value)
+            context_data, _ = compact_context(data, config.context_token_budget, config.model)
         
-        # 3. 构建 Prompt
+        # 2. 构建 Prompt
         if prompt_template:
             # 使用用户自定义 Prompt
             user_prompt = f"""
 {prompt_template}
 
-Data Context:
-```json
+Data Context (pipe-separated tables, first row is the header):
 {context_data}
-```
 """
         else:
             # 使用默认 Prompt
             user_prompt = f"""
 Please analyze the following procurement data and generate an executive summary:
 
-Data Context:
-```json
+Data Context (pipe-separated tables, first row is the header):
 {context_data}
-```
 
 Structure the report as follows:
 ## Executive Summary
@@ -121,21 +172,157 @@ Structure the report as follows:
 (3-4 bullet points on what to do next)
 """
 
-        # 4. 调用 LLM
+        return [
+            {"role": "system", "content": self._get_system_prompt()},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    async def _use_hierarchical(self, session_id: str, mode: str) -> bool:
+        if mode == "auto":
+            commodities = await run_analytics(self.analytics.get_commodity_overview, session_id)
+            return self.map_reduce.should_use(len(commodities))
+        return mode == "hierarchical"
+
+    async def generate_report_stream(self, session_id: str, context_type: str, context_value: str, config: LLMConfig,
+                                     prompt_template: str = None, force_refresh: bool = False,
+                                     mode: str = "standard") -> AsyncGenerator[str, None]:
+        """
+        生成流式报告
+
+        相同 Prompt + 模型参数的报告从 llm_report_cache 直接回放；
+        只有完整生成 (未出错、未中途断开、未因长度截断) 的报告才写入缓存
+
+        Args:
+            force_refresh: 跳过缓存重新生成，并覆盖缓存中的旧报告 (层级模式下只作用于最终报告，分组摘要仍取缓存)
+            mode: standard / hierarchical / auto，见 _build_messages
+        """
+        call = LLMCall(session_id, context_type, context_value, config.model)
+        try:
+            messages = await self._build_messages(session_id, context_type, context_value, config, prompt_template, mode)
+        except Exception as e:
+            call.finish(error=str(e))
+            await run_analytics(self.metrics.record, call)
+            raise
+        call.context_ready(messages)
+        cache_key = report_cache_key(messages, config)
+
+        if not force_refresh:
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                call.finish("cached")
+                await run_analytics(self.metrics.record, call)
+                for i in range(0, len(cached), REPLAY_CHUNK_SIZE):
+                    yield cached[i:i + REPLAY_CHUNK_SIZE]
+                return
+
+        parts = []
         try:
+            async for content in self._complete(messages, config, call):
+                parts.append(content)
+                yield content
+        except Exception as e:
+            yield f"\n\n**Error generating report:** {str(e)}"
+            return
+
+        if parts and not call.truncated:
+            await self._cache_put(cache_key, session_id, context_type, context_value, config, "".join(parts))
+
+    async def generate_report(self, session_id: str, context_type: str, context_value: str, config: LLMConfig,
+                              prompt_template: str = None, force_refresh: bool = False,
+                              before_call: Callable[[], Awaitable[None]] = None) -> Tuple[str, bool]:
+        """
+        生成完整报告 (非流式，供批量任务使用)，与流式接口共用报告缓存
+
+        Args:
+            before_call: 缓存未命中、即将调用 LLM 前等待的回调 (如限速)
+
+        Returns:
+            (报告全文, 是否来自缓存)
+
+        Raises:
+            调用 LLM 失败时抛出原始异常
+        """
+        call = LLMCall(session_id, context_type, context_value, config.model, source="batch")
+        messages = await self._build_messages(session_id, context_type, context_value, config, prompt_template)
+        call.context_ready(messages)
+        cache_key = report_cache_key(messages, config)
+
+        if not force_refresh:
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                call.finish("cached")
+                await run_analytics(self.metrics.record, call)
+                return cached, True
+
+        if before_call:
+            await before_call()
+        content = "".join([part async for part in self._complete(messages, config, call)])
+        if content and not call.truncated:
+            await self._cache_put(cache_key, session_id, context_type, context_value, config, content)
+        return content, False
+
+    async def _cache_get(self, cache_key: str) -> Optional[str]:
+        """读取报告缓存，出错时按未命中处理"""
+        try:
+            return await run_analytics(self.report_cache.get, cache_key)
+        except Exception as e:
+            print(f"Failed to read report cache: {e}")
+            return None
+
+    async def _cache_put(self, cache_key: str, session_id: str, context_type: str, context_value: Optional[str],
+                         config: LLMConfig, content: str):
+        """写入报告缓存，出错时只记录 (报告已生成并返回给调用方)"""
+        try:
+            await run_analytics(self.report_cache.put, cache_key, session_id, context_type, context_value,
+                                config, content)
+        except Exception as e:
+            print(f"Failed to cache {context_type} report: {e}")
+
+    async def _complete(self, messages: List[Dict[str, str]], config: LLMConfig,
+                        call: LLMCall) -> AsyncGenerator[str, None]:
+        """调用 LLM 并计量：结束、出错或被取消后把本次调用写入 llm_call_metrics"""
+        try:
+            async for content in self._stream_completion(messages, config, call):
+                yield content
+            call.finish()
+        except GeneratorExit:
+            # 调用方中途关闭生成器
+            call.finish("aborted")
+            raise
+        except asyncio.CancelledError:
+            call.finish("cancelled")
+            raise
+        except Exception as e:
+            call.finish(error=str(e))
+            raise
+        finally:
+            await run_analytics(self.metrics.record, call)
+
+    async def _stream_completion(self, messages: List[Dict[str, str]], config: LLMConfig,
+                                 call: LLMCall = None) -> AsyncGenerator[str, None]:
+        """调用 LLM 并逐段返回内容 (复用同一 base_url + api_key 的客户端及其 keep-alive 连接，支持兼容接口)"""
+        async with llm_clients.lease(config.api_key, config.base_url) as client:
+            if call:
+                call.request_sent()
             stream = await client.chat.completions.create(
                 model=config.model,
-                messages=[
-                    {"role": "system", "content": self._get_system_prompt()},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=messages,
                 temperature=config.temperature,
-                stream=True
+                stream=True,
+                # 流末尾附带 Token 用量 (LLM_STREAM_USAGE=1 时开启，需服务端支持该参数)
+                **({"stream_options": {"include_usage": True}} if STREAM_USAGE else {})
             )
 
-            async for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-
-        except Exception as e:
-            yield f"\n\n**Error generating report:** {str(e)}"
+            try:
+                async for chunk in stream:
+                    if call and getattr(chunk, "usage", None):
+                        call.usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+                    if call and chunk.choices and chunk.choices[0].finish_reason:
+                        call.finish_reason = chunk.choices[0].finish_reason
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if call:
+                            call.chunk(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                # 客户端中途断开时也要关闭响应，连接才能归还连接池
+                await stream.close()
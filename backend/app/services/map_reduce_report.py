@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.executor import run_analytics
+from app.services.context_compactor import DEFAULT_CONTEXT_TOKEN_BUDGET, compact_context, count_tokens
+from app.services.report_cache import report_cache_key
+from app.services.llm_metrics import LLMCall
+from app.schemas.llm import LLMConfig
+
+# 每个 Map 分组的平均品类数 (分组边界由品类名称哈希决定，单组最多 2 倍)
+MAP_GROUP_SIZE = int(os.getenv("LLM_MAP_GROUP_SIZE", "20"))
+# 同时进行的 Map / 中间 Reduce 调用数
+MAP_CONCURRENCY = int(os.getenv("LLM_MAP_CONCURRENCY", "4"))
+# 每个品类列出的 APV 最大供应商数
+MAP_LEADERS_PER_COMMODITY = 3
+# 摘要合并的最大层数，超过后不再合并 (由最终上下文的 Token 预算兜底)
+MAX_REDUCE_LEVELS = 3
+
+MAP_SYSTEM_PROMPT = """You are an expert Procurement Analyst for Nexteer Automotive.
+You summarize one group of commodities; your summary will be merged with summaries of the other groups
+into a single executive report, so be factual and compact.
+Output at most 8 Markdown bullet points, no headings. Cite commodity and supplier names with their key numbers:
+largest spend, largest cost-reduction opportunities (gap to target), poor target coverage and supplier concentration.
+"""
+
+REDUCE_SYSTEM_PROMPT = """You are an expert Procurement Analyst for Nexteer Automotive.
+Merge the following partial summaries of commodity groups into one summary of at most 10 Markdown bullet points,
+no headings. Keep the most material findings with their numbers and names; drop minor details.
+"""
+
+
+class MapReduceReporter:
+    """
+    层级 (Map-Reduce) 全局报告
+
+    Dashboard 标准上下文只能容纳前 5 个品类；品类很多时改为：
+    1. Map：全部品类按名称排序后以名称哈希决定分组边界 (见 _group_commodities)，
+       每组 (品类概览 + 主要供应商) 在 Token 预算内并发生成一段局部摘要
+    2. Reduce：局部摘要总长超出预算时分批合并为中间摘要，逐层进行直到放得下
+    3. 最终报告：全局 KPI / 集中度 / 象限统计 + 各组摘要，按标准报告结构流式生成
+
+    每一级摘要都以完整 Prompt 的哈希写入 llm_report_cache，重跑时只有数据或参数变化的分组需要重新调用 LLM；
+    新增 / 删除品类通常只改变其所在分组的 Prompt
+    """
+
+    def __init__(self, llm_service):
+        self.llm = llm_service
+        self.group_size = MAP_GROUP_SIZE
+        self.concurrency = MAP_CONCURRENCY
+
+    def should_use(self, commodity_count: int) -> bool:
+        """auto 模式下，品类数超过一个分组时启用层级报告"""
+        return commodity_count > self.group_size
+
+    async def build_context(self, session_id: str, config: LLMConfig) -> Tuple[str, Dict[str, Any]]:
+        """
+        Map + Reduce，返回最终报告的数据上下文文本
+
+        Returns:
+            (上下文文本, {"groups", "levels", "llm_calls", "cached"})
+        """
+        analytics = self.llm.analytics
+        kpi, commodities, leaders, concentration, matrix_stats = await asyncio.gather(
+            run_analytics(analytics.get_kpi_summary, session_id),
+            run_analytics(analytics.get_commodity_overview, session_id),
+            run_analytics(analytics.get_commodity_supplier_leaders, session_id, MAP_LEADERS_PER_COMMODITY),
+            run_analytics(analytics.get_supplier_concentration, session_id),
+            run_analytics(analytics.get_matrix_stats, session_id)
+        )
+
+        stats = {"groups": 0, "levels": 0, "llm_calls": 0, "cached": 0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        total_apv = kpi.get("total_spending") or sum(c["total_apv"] for c in commodities) or 1
+
+        # 1. Map
+        groups = self._group_commodities(commodities, self.group_size)
+        stats["groups"] = len(groups)
+
+        async def summarize_group(group: List[Dict[str, Any]]) -> str:
+            # Prompt 中不含分组序号，其他分组的增减不影响本组的缓存键
+            label = f"{group[0]['commodity']} .. {group[-1]['commodity']}"
+            data = {
+                "scope": f"Commodity group: {label} ({len(group)} commodities)",
+                "commodities": [
+                    {**c, "share_of_session_apv": c["total_apv"] * 100 / total_apv} for c in group
+                ],
+                "leading_suppliers": [
+                    {"commodity": c["commodity"], **leader}
+                    for c in group for leader in leaders.get(c["commodity"], [])
+                ]
+            }
+            context, _ = compact_context(data, config.context_token_budget, config.model)
+            return await self._summarize(session_id, "dashboard.map", label, MAP_SYSTEM_PROMPT,
+                                         f"Data Context (pipe-separated tables, first row is the header):\n{context}",
+                                         config, semaphore, stats)
+
+        summaries = list(await asyncio.gather(*(summarize_group(g) for g in groups)))
+
+        # 2. Reduce：摘要放不进预算时逐层合并
+        base = {
+            "scope": f"Global Dashboard ({len(commodities)} commodities, summarized in {len(groups)} groups)",
+            "kpi": kpi,
+            "supplier_concentration": concentration,
+            "matrix_quadrant_stats": matrix_stats
+        }
+        base_text, _ = compact_context(base, config.context_token_budget, config.model)
+        budget = config.context_token_budget or DEFAULT_CONTEXT_TOKEN_BUDGET
+        summary_budget = max(budget - count_tokens(base_text, config.model), 1)
+
+        while (len(summaries) > 1 and stats["levels"] < MAX_REDUCE_LEVELS
+               and count_tokens("\n\n".join(summaries), config.model) > summary_budget):
+            stats["levels"] += 1
+            batches = self._batches(summaries, summary_budget, config.model)
+            level = stats["levels"]
+            summaries = list(await asyncio.gather(*(
+                self._summarize(session_id, "dashboard.reduce", f"level {level} batch {i + 1}", REDUCE_SYSTEM_PROMPT,
+                                "\n\n".join(f"### Partial summary {j + 1}\n{s}" for j, s in enumerate(batch)),
+                                config, semaphore, stats)
+                for i, batch in enumerate(batches)
+            )))
+
+        sections = "\n\n".join(f"### Group {i + 1}\n{s}" for i, s in enumerate(summaries))
+        return f"{base_text}\n## commodity_group_summaries\n{sections}", stats
+
+    @staticmethod
+    def _group_commodities(commodities: List[Dict[str, Any]], group_size: int) -> List[List[Dict[str, Any]]]:
+        """
+        按名称排序后以内容定义的边界分组
+
+        组内满 group_size / 2 个后，名称的 MD5 对 group_size / 2 取模为 0 的品类结束当前分组 (平均每组约 group_size 个)，
+        满 2 × group_size 个时强制切分。边界只取决于品类自身的名称，新增 / 删除一个品类通常只改变它所在的分组
+        (强制切分处可能波及其后少数分组)，不会像定长切分那样使其后所有分组整体移位
+        """
+        def is_boundary(name: str) -> bool:
+            digest = hashlib.md5(name.encode("utf-8")).digest()
+            return int.from_bytes(digest[:4], "big") % min_size == 0
+
+        min_size = max(group_size // 2, 1)
+        groups: List[List[Dict[str, Any]]] = [[]]
+        for commodity in sorted(commodities, key=lambda c: c["commodity"] or ""):
+            groups[-1].append(commodity)
+            size = len(groups[-1])
+            if (size >= min_size and is_boundary(commodity["commodity"] or "")) or size >= 2 * group_size:
+                groups.append([])
+        return [group for group in groups if group]
+
+    @staticmethod
+    def _batches(summaries: List[str], budget: int, model: Optional[str]) -> List[List[str]]:
+        """按 Token 预算把摘要装箱 (每批至少两段，保证每层都在收敛)"""
+        batches: List[List[str]] = [[]]
+        used = 0
+        for summary in summaries:
+            tokens = count_tokens(summary, model)
+            if len(batches[-1]) >= 2 and used + tokens > budget:
+                batches.append([])
+                used = 0
+            batches[-1].append(summary)
+            used += tokens
+        if len(batches) > 1 and len(batches[-1]) == 1:
+            batches[-2].extend(batches.pop())
+        return batches
+
+    async def _summarize(self, session_id: str, context_type: str, context_value: str, system_prompt: str,
+                         user_prompt: str, config: LLMConfig, semaphore: asyncio.Semaphore,
+                         stats: Dict[str, Any]) -> str:
+        """生成一段摘要，相同 Prompt + 模型参数直接取缓存"""
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        call = LLMCall(session_id, context_type, context_value, config.model, source=context_type.split(".")[-1])
+        call.context_ready(messages)
+        cache_key = report_cache_key(messages, config)
+        cached = await self.llm._cache_get(cache_key)
+        if cached is not None:
+            stats["cached"] += 1
+            call.finish("cached")
+            await run_analytics(self.llm.metrics.record, call)
+            return cached
+
+        async with semaphore:
+            stats["llm_calls"] += 1
+            content = "".join([part async for part in self.llm._complete(messages, config, call)])
+        if content and not call.truncated:
+            # 缓存写入失败不影响本次报告，摘要照常参与合并 (下次运行重新生成)
+            await self.llm._cache_put(cache_key, session_id, context_type, context_value, config, content)
+        return content
+
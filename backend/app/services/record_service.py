@@ -0,0 +1,233 @@
+import base64
+import csv
+import datetime
+import decimal
+import io
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterator, List, Tuple
+from app.database.init import get_connection
+
+# 采购明细列 (与 procurement_records 视图一致)
+RECORD_COLUMNS = [
+    "session_id", "pns", "part_desc", "commodity", "supplier", "currency",
+    "quantity", "price", "apv", "covered_apv",
+    "target_cost", "target_spend", "gap_to_target", "opportunity", "gap_percent",
+    "created_at"
+]
+
+# 导出格式 → Content-Type
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+# 可排序字段 → 排序表达式 (数值列统一转 DOUBLE，保证游标值可无损往返 JSON)
+SORT_EXPRESSIONS = {
+    "apv": "COALESCE(CAST(apv AS DOUBLE), 0)",
+    "gap_percent": "COALESCE(CAST(gap_percent AS DOUBLE), 0)",
+    "opportunity": "COALESCE(CAST(opportunity AS DOUBLE), 0)",
+    "price": "COALESCE(CAST(price AS DOUBLE), 0)",
+    "quantity": "COALESCE(CAST(quantity AS DOUBLE), 0)",
+    "covered_apv": "COALESCE(CAST(covered_apv AS DOUBLE), 0)",
+    "target_cost": "COALESCE(CAST(target_cost AS DOUBLE), 0)",
+    "pns": "pns",
+    "supplier": "supplier",
+    "commodity": "commodity"
+}
+
+# (pns, supplier) 在 Session 内唯一，作为排序的最终决胜键
+TIEBREAK_FIELDS = ["pns", "supplier"]
+
+
+def _encode_cursor(sort: List[Tuple[str, str]], values: List[Any]) -> str:
+    payload = json.dumps({"sort": sort, "after": values}, default=_json_default)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str, sort: List[Tuple[str, str]]) -> List[Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        values = payload["after"]
+        cursor_sort = [tuple(item) for item in payload["sort"]]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort or len(values) != len(sort):
+        raise ValueError("Cursor does not match the requested sort order")
+    return values
+
+
+def _json_default(value: Any):
+    """DuckDB 返回的 Decimal / 时间类型转换为 JSON 可序列化值"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class RecordService:
+    """
+    采购明细查询与导出
+
+    导出按批从独立游标读取并逐批写出，内存占用与 Session 行数无关
+    """
+
+    def __init__(self, batch_size: int = 10000, chunk_size: int = 1024 * 1024):
+        self.conn = get_connection()
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+    def query_records(self, session_id: str, filters: Dict[str, Any] = None,
+                      sort: List[Tuple[str, str]] = None, limit: int = 100,
+                      cursor: str = None) -> Dict[str, Any]:
+        """
+        服务端过滤、排序的分页查询 (keyset 游标)
+
+        排序键末尾追加 (pns, supplier) 保证全序，下一页条件为"排在游标行之后"，
+        不使用 OFFSET，每页都是 Session 内的过滤扫描 + Top-N，耗时与翻页深度无关。
+
+        Args:
+            filters: commodities / suppliers (列表)，apv_min / apv_max / gap_min / gap_max (闭区间)
+            sort: [(字段, "asc" | "desc")]，默认按 APV 降序
+            cursor: 上一页返回的 next_cursor
+
+        Returns:
+            {records, next_cursor, has_more}
+        """
+        filters = filters or {}
+        sort = [(field, direction) for field, direction in (sort or [("apv", "desc")])]
+        for field, direction in sort:
+            if field not in SORT_EXPRESSIONS or direction not in ("asc", "desc"):
+                raise ValueError(f"Invalid sort: {field} {direction}")
+
+        keys = sort + [(field, "asc") for field in TIEBREAK_FIELDS
+                       if field not in [f for f, _ in sort]]
+        expressions = [SORT_EXPRESSIONS[field] for field, _ in keys]
+
+        conditions = ["session_id = ?"]
+        params: List[Any] = [session_id]
+        if filters.get("commodities"):
+            conditions.append("list_contains(?, commodity)")
+            params.append(list(filters["commodities"]))
+        if filters.get("suppliers"):
+            conditions.append("list_contains(?, supplier)")
+            params.append(list(filters["suppliers"]))
+        for key, column, op in (("apv_min", "apv", ">="), ("apv_max", "apv", "<="),
+                                ("gap_min", "gap_percent", ">="), ("gap_max", "gap_percent", "<=")):
+            if filters.get(key) is not None:
+                conditions.append(f"CAST({column} AS DOUBLE) {op} ?")
+                params.append(float(filters[key]))
+
+        if cursor:
+            # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...，方向逐列取 > 或 <
+            values = _decode_cursor(cursor, keys)
+            branches = []
+            for i, (_, direction) in enumerate(keys):
+                parts = [f"{expressions[j]} = ?" for j in range(i)]
+                parts.append(f"{expressions[i]} {'>' if direction == 'asc' else '<'} ?")
+                branches.append("(" + " AND ".join(parts) + ")")
+                params.extend(values[:i + 1])
+            conditions.append("(" + " OR ".join(branches) + ")")
+
+        order_by = ", ".join(f"{expr} {direction.upper()}" for expr, (_, direction) in zip(expressions, keys))
+        query = f"""
+        SELECT {', '.join(RECORD_COLUMNS)}, {', '.join(expressions)}
+        FROM procurement_records
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order_by}
+        LIMIT ?
+        """
+        rows = self.conn.execute(query, params + [limit + 1]).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        width = len(RECORD_COLUMNS)
+        return {
+            "records": [dict(zip(RECORD_COLUMNS, row[:width])) for row in rows],
+            "next_cursor": _encode_cursor(keys, list(rows[-1][width:])) if has_more else None,
+            "has_more": has_more
+        }
+
+    def export_records(self, session_id: str, fmt: str) -> Iterator[bytes]:
+        """
+        流式导出指定 Session 的采购明细
+
+        Args:
+            fmt: ndjson / csv / parquet
+
+        Yields:
+            响应体字节块
+        """
+        if fmt == "ndjson":
+            return self._export_ndjson(session_id)
+        if fmt == "csv":
+            return self._export_csv(session_id)
+        if fmt == "parquet":
+            return self._export_parquet(session_id)
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    def _iter_batches(self, session_id: str) -> Iterator[list]:
+        """使用独立游标按批读取明细，避免与共享连接上的其他查询互相干扰"""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(
+                f"SELECT {', '.join(RECORD_COLUMNS)} FROM procurement_records WHERE session_id = ?",
+                [session_id]
+            )
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def _export_ndjson(self, session_id: str) -> Iterator[bytes]:
+        """每行一个 JSON 对象"""
+        for rows in self._iter_batches(session_id):
+            yield "".join(
+                json.dumps(dict(zip(RECORD_COLUMNS, row)), default=_json_default, ensure_ascii=False) + "\n"
+                for row in rows
+            ).encode("utf-8")
+
+    def _export_csv(self, session_id: str) -> Iterator[bytes]:
+        """首行为表头的 CSV"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(RECORD_COLUMNS)
+        for rows in self._iter_batches(session_id):
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    def _export_parquet(self, session_id: str) -> Iterator[bytes]:
+        """
+        Parquet 需要写完文件尾部元数据后才能读取，
+        由 DuckDB COPY 直接写入临时文件，再分块读出
+        """
+        fd, path = tempfile.mkstemp(suffix=".parquet")
+        os.close(fd)
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+                COPY (
+                    SELECT {', '.join(RECORD_COLUMNS)}
+                    FROM procurement_records
+                    WHERE session_id = ?
+                ) TO '{path}' (FORMAT PARQUET)
+            """, [session_id])
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            cursor.close()
+            os.remove(path)
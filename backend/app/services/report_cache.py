@@ -0,0 +1,64 @@
+import hashlib
+import json
+import duckdb
+from typing import Dict, List, Optional
+from app.database.init import get_connection
+from app.services.llm_clients import DEFAULT_BASE_URL
+from app.schemas.llm import LLMConfig
+
+
+def report_cache_key(messages: List[Dict[str, str]], config: LLMConfig) -> str:
+    """
+    报告缓存键：完整 Prompt (含数据上下文) + 模型参数的 SHA-256
+
+    Session 入库后数据不再变化，相同键的请求等价于向 LLM 重复提问；
+    api_key 不参与计算，同一服务端的不同用户可共享结果
+    """
+    payload = json.dumps({
+        "base_url": (config.base_url or DEFAULT_BASE_URL).rstrip("/"),
+        "model": config.model,
+        "temperature": config.temperature,
+        "messages": messages
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """LLM 报告持久化缓存 (llm_report_cache 表)"""
+
+    def __init__(self):
+        self.conn = get_connection()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """命中时返回报告全文并记录命中次数 (计数尽力而为，并发命中同一行冲突时不计)"""
+        row = self.conn.execute(
+            "SELECT content FROM llm_report_cache WHERE cache_key = ?", [cache_key]
+        ).fetchone()
+        if not row:
+            return None
+        try:
+            self.conn.execute("""
+                UPDATE llm_report_cache
+                SET hit_count = hit_count + 1, last_hit_at = CURRENT_TIMESTAMP
+                WHERE cache_key = ?
+            """, [cache_key])
+        except duckdb.TransactionException:
+            pass
+        return row[0]
+
+    def put(self, cache_key: str, session_id: str, context_type: str, context_value: Optional[str],
+            config: LLMConfig, content: str):
+        """
+        写入一份完整生成的报告 (同键覆盖)
+
+        同键并发写入时 DuckDB 报主键或事务冲突，此时另一方已写入等价的报告，按成功处理
+        """
+        try:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO llm_report_cache (
+                    cache_key, session_id, context_type, context_value,
+                    model, temperature, content, hit_count, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, 0, CURRENT_TIMESTAMP)
+            """, [cache_key, session_id, context_type, context_value, config.model, config.temperature, content])
+        except (duckdb.ConstraintException, duckdb.TransactionException):
+            pass
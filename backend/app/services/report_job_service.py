@@ -0,0 +1,272 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from app.database.init import get_connection
+from app.services.executor import run_analytics
+from app.services.llm_service import LLMService
+from app.schemas.llm import BatchReportRequest
+
+# 供应商批量报告默认覆盖的供应商数 (按 APV)
+DEFAULT_SUPPLIER_TOP_N = 10
+
+# 运行中的批量任务 (job_id → asyncio.Task)，api_key 只保存在任务闭包中，不落库
+_running_jobs: Dict[str, asyncio.Task] = {}
+# 运行中任务所属的 Session (job_id → session_id)
+_job_sessions: Dict[str, str] = {}
+
+
+async def _cancel_and_wait(tasks: List[asyncio.Task]):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def cancel_running_jobs():
+    """取消全部运行中的任务并等待其记录取消状态 (应用退出时调用，需在关闭线程池之前)"""
+    await _cancel_and_wait(list(_running_jobs.values()))
+
+
+async def cancel_session_jobs(session_id: str):
+    """取消指定 Session 的运行中任务并等待其结束 (删除 Session 前调用，避免任务继续调用 LLM 并写入缓存)"""
+    await _cancel_and_wait([
+        task for job_id, task in list(_running_jobs.items()) if _job_sessions.get(job_id) == session_id
+    ])
+
+
+class RateLimiter:
+    """按固定间隔放行 LLM 调用 (每分钟 per_minute 次)，任务内各协程共享"""
+
+    def __init__(self, per_minute: Optional[int]):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class ReportJobService:
+    """
+    批量报告任务
+
+    对 Session 内全部品类 (或 APV 前 N 的供应商) 逐个生成报告：
+    信号量限制同时进行的 LLM 调用数，RateLimiter 限制调用发起速率，
+    每份报告完成即写入 llm_report_job_items，进度由各条目状态汇总得到。
+    命中报告缓存的条目不占用速率配额。
+    """
+
+    def __init__(self):
+        self.conn = get_connection()
+        self.llm = LLMService()
+
+    # ============ 任务管理 ============
+
+    async def create_job(self, request: BatchReportRequest) -> Dict[str, Any]:
+        """创建任务并在后台开始执行"""
+        targets = await run_analytics(self._targets, request.session_id, request.scope, request.top_n)
+        if not targets:
+            raise ValueError(f"No {request.scope} found for session {request.session_id}")
+
+        job_id = str(uuid.uuid4())
+        await run_analytics(self._insert_job, job_id, request, targets)
+
+        task = asyncio.create_task(self._run(job_id, request, targets))
+        _running_jobs[job_id] = task
+        _job_sessions[job_id] = request.session_id
+
+        def forget(_):
+            _running_jobs.pop(job_id, None)
+            _job_sessions.pop(job_id, None)
+
+        task.add_done_callback(forget)
+        return await run_analytics(self.get_job, job_id)
+
+    def cancel_job(self, job_id: str) -> bool:
+        """取消运行中的任务，已完成的报告保留"""
+        task = _running_jobs.get(job_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    def _targets(self, session_id: str, scope: str, top_n: Optional[int]) -> List[str]:
+        """按 APV 降序取品类 / 供应商名称"""
+        if scope == "commodity":
+            query = """
+            SELECT c.commodity_name
+            FROM agg_session_commodity a
+            JOIN dim_commodity c ON c.commodity_id = a.commodity_id
+            WHERE a.session_id = ?
+            ORDER BY a.total_apv DESC
+            """
+        else:
+            query = """
+            SELECT s.supplier_name
+            FROM agg_session_supplier a
+            JOIN dim_supplier s ON s.supplier_id = a.supplier_id
+            WHERE a.session_id = ?
+            ORDER BY a.total_apv DESC
+            """
+            top_n = top_n or DEFAULT_SUPPLIER_TOP_N
+        rows = self.conn.execute(query, [session_id]).fetchall()
+        names = [row[0] for row in rows]
+        return names[:top_n] if top_n else names
+
+    def _insert_job(self, job_id: str, request: BatchReportRequest, targets: List[str]):
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            self.conn.execute("""
+                INSERT INTO llm_report_jobs (job_id, session_id, scope, status, model, concurrency, requests_per_minute)
+                VALUES (?, ?, ?, 'pending', ?, ?, ?)
+            """, [job_id, request.session_id, request.scope, request.config.model,
+                  request.concurrency, request.requests_per_minute])
+            self.conn.executemany("""
+                INSERT INTO llm_report_job_items (job_id, context_value, sort_order, status)
+                VALUES (?, ?, ?, 'pending')
+            """, [[job_id, value, i] for i, value in enumerate(targets)])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _set_job_status(self, job_id: str, status: str, finished: bool = False):
+        self.conn.execute(f"""
+            UPDATE llm_report_jobs
+            SET status = ? {", finished_at = CURRENT_TIMESTAMP" if finished else ""}
+            WHERE job_id = ?
+        """, [status, job_id])
+
+    def _update_item(self, job_id: str, context_value: str, status: str, content: str = None,
+                     error: str = None, cached: bool = False):
+        if status == "running":
+            self.conn.execute("""
+                UPDATE llm_report_job_items SET status = ?, started_at = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND context_value = ?
+            """, [status, job_id, context_value])
+        else:
+            self.conn.execute("""
+                UPDATE llm_report_job_items
+                SET status = ?, content = ?, error = ?, cached = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND context_value = ?
+            """, [status, content, error, cached, job_id, context_value])
+
+    def _cancel_pending_items(self, job_id: str):
+        self.conn.execute("""
+            UPDATE llm_report_job_items SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+            WHERE job_id = ? AND status IN ('pending', 'running')
+        """, [job_id])
+
+    # ============ 执行 ============
+
+    async def _run(self, job_id: str, request: BatchReportRequest, targets: List[str]):
+        semaphore = asyncio.Semaphore(request.concurrency)
+        limiter = RateLimiter(request.requests_per_minute)
+        await run_analytics(self._set_job_status, job_id, "running")
+
+        async def generate(context_value: str) -> bool:
+            async with semaphore:
+                await run_analytics(self._update_item, job_id, context_value, "running")
+                try:
+                    content, cached = await self.llm.generate_report(
+                        request.session_id, request.scope, context_value, request.config,
+                        request.prompt_template, request.force_refresh, before_call=limiter.acquire
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await run_analytics(self._update_item, job_id, context_value, "failed", error=str(e))
+                    return False
+                await run_analytics(self._update_item, job_id, context_value, "completed",
+                                    content=content, cached=cached)
+                return True
+
+        try:
+            results = await asyncio.gather(*(generate(value) for value in targets))
+        except asyncio.CancelledError:
+            await run_analytics(self._cancel_pending_items, job_id)
+            await run_analytics(self._set_job_status, job_id, "cancelled", True)
+            raise
+        except Exception:
+            await run_analytics(self._set_job_status, job_id, "failed", True)
+            raise
+
+        succeeded = sum(results)
+        status = "completed" if succeeded == len(results) else "failed" if succeeded == 0 else "partial"
+        await run_analytics(self._set_job_status, job_id, status, True)
+
+    # ============ 查询 ============
+
+    def get_job(self, job_id: str, include_content: bool = False) -> Optional[Dict[str, Any]]:
+        """任务状态与各条目进度 (include_content=True 时附报告全文)"""
+        jobs = self._load_jobs("j.job_id = ?", [job_id])
+        if not jobs:
+            return None
+        job = jobs[0]
+        rows = self.conn.execute(f"""
+            SELECT context_value, status, cached, error, {"content" if include_content else "NULL"},
+                   CAST(started_at AS VARCHAR), CAST(finished_at AS VARCHAR)
+            FROM llm_report_job_items
+            WHERE job_id = ?
+            ORDER BY sort_order
+        """, [job_id]).fetchall()
+        job["items"] = [
+            {
+                "context_value": row[0],
+                "status": row[1],
+                "cached": bool(row[2]),
+                "error": row[3],
+                "content": row[4],
+                "started_at": row[5],
+                "finished_at": row[6]
+            }
+            for row in rows
+        ]
+        return job
+
+    def list_jobs(self, session_id: str = None) -> List[Dict[str, Any]]:
+        """任务列表 (不含条目)，按创建时间倒序"""
+        if session_id:
+            return self._load_jobs("j.session_id = ?", [session_id])
+        return self._load_jobs("TRUE", [])
+
+    def _load_jobs(self, condition: str, params: List[Any]) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(f"""
+            SELECT
+                j.job_id, j.session_id, j.scope, j.status, j.model, j.concurrency, j.requests_per_minute,
+                CAST(j.created_at AS VARCHAR), CAST(j.finished_at AS VARCHAR),
+                COUNT(i.context_value),
+                COUNT(*) FILTER (WHERE i.status = 'completed'),
+                COUNT(*) FILTER (WHERE i.status = 'failed')
+            FROM llm_report_jobs j
+            LEFT JOIN llm_report_job_items i ON i.job_id = j.job_id
+            WHERE {condition}
+            GROUP BY j.job_id, j.session_id, j.scope, j.status, j.model, j.concurrency,
+                     j.requests_per_minute, j.created_at, j.finished_at
+            ORDER BY j.created_at DESC
+        """, params).fetchall()
+        return [
+            {
+                "job_id": row[0],
+                "session_id": row[1],
+                "scope": row[2],
+                "status": row[3],
+                "model": row[4],
+                "concurrency": row[5],
+                "requests_per_minute": row[6],
+                "created_at": row[7],
+                "finished_at": row[8],
+                "total": int(row[9]),
+                "completed": int(row[10]),
+                "failed": int(row[11]),
+                "items": []
+            }
+            for row in rows
+        ]
@@ -0,0 +1,189 @@
+import asyncio
+import itertools
+import json
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, Optional
+from app.services.admission import AdmissionRejected
+
+# 浏览器 EventSource 断线后的重连间隔 (毫秒)
+SSE_RETRY_MS = 3000
+
+
+def format_event(data: str, event_id: int = None, event: str = None) -> str:
+    """
+    按 SSE 格式编码一个事件 (多行数据拆成多个 data: 行，客户端按 \\n 拼回)
+
+    SSE 把 \\r\\n、\\r、\\n 都视为行结束，三种换行都要拆成 data: 行，否则 \\r 之后的内容会被客户端当成新的字段行丢弃
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in re.split(r"\r\n|\r|\n", data))
+    return "\n".join(lines) + "\n\n"
+
+
+class ReportStream:
+    """
+    一次报告生成的输出缓冲
+
+    生成协程独立于 HTTP 连接运行，每个片段编号 (从 1 开始连续递增) 后写入定长环形缓冲；
+    订阅者按 Last-Event-ID 从缓冲中续传，断线重连不会再次调用 LLM
+    """
+
+    def __init__(self, stream_id: str, buffer_events: int, heartbeat: float):
+        self.stream_id = stream_id
+        self.heartbeat = heartbeat
+        self.events: "deque[tuple]" = deque(maxlen=buffer_events)
+        self.last_id = 0
+        self.done = False
+        self.subscribers = 0
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._signal = asyncio.Event()
+
+    def _notify(self):
+        # 唤醒当前全部等待者，后续等待者使用新的 Event
+        self._signal.set()
+        self._signal = asyncio.Event()
+
+    def append(self, data: str):
+        self.last_id += 1
+        self.events.append((self.last_id, data))
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    async def subscribe(self, last_event_id: int = 0) -> AsyncIterator[str]:
+        """
+        输出 last_event_id 之后的全部事件，生成结束时发送 done 事件
+
+        等待新片段期间每 heartbeat 秒发送一行注释，防止代理因空闲断开连接；
+        续传点已被环形缓冲覆盖时发送 reset 事件，由客户端重新发起请求
+        """
+        sent = max(last_event_id or 0, 0)
+        self.subscribers += 1
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                if self.events and self.events[0][0] > sent + 1:
+                    yield format_event(json.dumps({"reason": "resume point no longer buffered"}), event="reset")
+                    return
+
+                start = sent - self.events[0][0] + 1 if self.events else 0
+                for event_id, data in list(itertools.islice(self.events, max(start, 0), None)):
+                    yield format_event(data, event_id)
+                    sent = event_id
+
+                if self.done and sent >= self.last_id:
+                    yield format_event("{}", event="done")
+                    return
+
+                signal = self._signal
+                if sent >= self.last_id:
+                    try:
+                        await asyncio.wait_for(signal.wait(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+        finally:
+            self.subscribers -= 1
+
+
+class ReportStreamRegistry:
+    """
+    进程内可续传报告流
+
+    - 每个流最多缓冲 buffer_events 个片段，续传只需保留客户端可能尚未收到的部分
+    - 结束后保留 ttl 秒供断线重连，超时或超过 max_streams 时淘汰最早结束的流
+    - 全部流都在生成中且已达上限时返回 429
+    """
+
+    def __init__(self, max_streams: int = 256, buffer_events: int = 2048,
+                 ttl: float = 300, heartbeat: float = 15):
+        self.max_streams = max_streams
+        self.buffer_events = buffer_events
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self._streams: "OrderedDict[str, ReportStream]" = OrderedDict()
+        self.created = 0
+        self.resumed = 0
+        self.evictions = 0
+
+    def create(self, source: AsyncIterator[str]) -> ReportStream:
+        """登记新流并在后台开始消费 source (文本片段的异步迭代器)"""
+        self._evict()
+        if len(self._streams) >= self.max_streams:
+            raise AdmissionRejected(429, "Too many report streams in progress", retry_after=30)
+
+        stream = ReportStream(str(uuid.uuid4()), self.buffer_events, self.heartbeat)
+        stream.task = asyncio.create_task(self._produce(stream, source))
+        self._streams[stream.stream_id] = stream
+        self.created += 1
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ReportStream]:
+        """按 ID 取流 (用于续传)，不存在或已过期时返回 None"""
+        self._evict()
+        stream = self._streams.get(stream_id)
+        if stream is not None:
+            self.resumed += 1
+        return stream
+
+    @staticmethod
+    async def _produce(stream: ReportStream, source: AsyncIterator[str]):
+        try:
+            async for data in source:
+                stream.append(data)
+        except Exception as e:
+            # 组装上下文阶段的错误也以文本形式告知客户端
+            stream.append(f"\n\n**Error generating report:** {str(e)}")
+        finally:
+            stream.finish()
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [sid for sid, s in self._streams.items() if s.done and now - s.finished_at > self.ttl]
+        finished = [sid for sid, s in self._streams.items() if s.done and sid not in expired]
+        overflow = len(self._streams) - len(expired) - self.max_streams + 1
+        for sid in expired + sorted(finished, key=lambda k: self._streams[k].finished_at)[:max(overflow, 0)]:
+            del self._streams[sid]
+            self.evictions += 1
+
+    async def close_all(self):
+        """取消全部生成中的流 (应用退出时调用，需在关闭线程池之前)"""
+        tasks = [s.task for s in self._streams.values() if s.task and not s.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._streams.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streams": len(self._streams),
+            "generating": sum(1 for s in self._streams.values() if not s.done),
+            "subscribers": sum(s.subscribers for s in self._streams.values()),
+            "max_streams": self.max_streams,
+            "buffer_events": self.buffer_events,
+            "ttl": self.ttl,
+            "created": self.created,
+            "resumed": self.resumed,
+            "evictions": self.evictions
+        }
+
+
+# 进程内共享的报告流登记表
+report_streams = ReportStreamRegistry(
+    max_streams=int(os.getenv("LLM_MAX_STREAMS", "256")),
+    buffer_events=int(os.getenv("LLM_STREAM_BUFFER_EVENTS", "2048")),
+    ttl=float(os.getenv("LLM_STREAM_TTL_SECONDS", "300")),
+    heartbeat=float(os.getenv("LLM_STREAM_HEARTBEAT_SECONDS", "15"))
+)
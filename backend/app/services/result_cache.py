@@ -0,0 +1,143 @@
+import copy
+import functools
+import inspect
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class ResultCache:
+    """
+    分析结果 LRU 缓存
+
+    - 键为 (方法名, session_id, 其余参数)，Session 数据入库后不变，因此条目无需过期
+    - 按估算内存占用和条目数双重限容，超限时淘汰最久未使用的条目
+    - Session 删除或重新入库时通过 invalidate_session() 显式失效
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Tuple) -> Tuple[bool, Any]:
+        """查询缓存，返回 (是否命中, 结果副本)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[0]
+        return True, copy.deepcopy(value)
+
+    def put(self, key: Tuple, value: Any):
+        """写入缓存（超过单条上限的结果不缓存）"""
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate_session(self, session_id: str) -> int:
+        """失效指定 Session 的全部条目，返回失效数量"""
+        with self._lock:
+            keys = [k for k in self._entries if k[1] == session_id]
+            for key in keys:
+                self._bytes -= self._entries.pop(key)[1]
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计（用于监控）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+def _estimate_size(obj: Any) -> int:
+    """递归估算结果对象的内存占用（字节）"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_estimate_size(k) + _estimate_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_estimate_size(item) for item in obj)
+    return size
+
+
+def _freeze(value: Any) -> Hashable:
+    """将参数转换为可哈希形式，用于构造缓存键"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def cached_query(func: Callable) -> Callable:
+    """
+    AnalyticsService 方法装饰器：按 (方法名, session_id, 其余参数) 缓存返回值
+
+    被装饰方法的第一个参数必须是 session_id，默认参数会被展开，
+    保证 f(sid) 与 f(sid, limit=20) 命中同一条目
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        arguments.pop("self")
+        session_id = arguments.pop("session_id")
+        key = (func.__name__, session_id, _freeze(arguments))
+
+        hit, value = analytics_cache.get(key)
+        if hit:
+            return value
+        value = func(self, *args, **kwargs)
+        analytics_cache.put(key, value)
+        return value
+
+    return wrapper
+
+
+# 进程内共享的分析结果缓存（Dashboard 与 LLM 上下文构建共用）
+analytics_cache = ResultCache(
+    max_bytes=int(os.getenv("ANALYTICS_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    max_entries=int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "2048"))
+)
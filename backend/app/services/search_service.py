@@ -0,0 +1,258 @@
+import bisect
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from Levenshtein import ratio
+from app.database.init import get_connection
+
+# 检索对象类型
+SEARCH_KINDS = ("part", "supplier", "cost_part")
+
+# 模糊匹配参数
+FUZZY_MIN_RATIO = 0.7        # Levenshtein 相似度下限
+FUZZY_SEED_TRIGRAMS = 4      # 取最稀有的 N 个三元组生成候选 (单处错字最多破坏 3 个)
+FUZZY_MAX_CANDIDATES = 5000  # 进入重排的候选上限
+PREFIX_MAX_MATCHES = 2000    # 前缀匹配最多展开的词条数
+
+_TOKEN_SPLIT = re.compile(r"[^0-9a-z一-鿿]+")
+
+
+def _normalize(text: Any) -> str:
+    return " ".join(str(text or "").lower().split())
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    进程内词条索引 (前缀 + 三元组)
+
+    - 文档：零件 (dim_part: pns / part_desc)、供应商 (dim_supplier)、成本表零件 (part_cost_sessions)
+    - 词条：每个字段的整段文本及其中的单词，词条 → 文档号倒排 (array 存储)
+    - 前缀：词条排序存放，二分查找；子串 / 模糊：词条三元组倒排，候选词条再用 Levenshtein 重排
+    - 匹配在词条表上完成 (远小于文档数)，再按得分顺序展开文档，凑满 limit 即停止
+    - 入库后调用 refresh() 只增量加载新行，维度表代理键单调递增，以此为水位
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._kinds: List[str] = []
+        self._payloads: List[Dict[str, Any]] = []
+        self._deleted: set = set()
+        self._doc_ids: Dict[Tuple[str, Any], int] = {}
+        self._token_ids: Dict[str, int] = {}
+        self._token_list: List[str] = []
+        self._token_docs: List[array] = []
+        self._token_trigrams: Dict[str, array] = {}
+        self._sorted_tokens: List[str] = []
+        self._cost_sessions: set = set()
+        self._part_watermark = 0
+        self._supplier_watermark = 0
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._payloads) - len(self._deleted)
+
+    # ============ 构建 ============
+
+    def refresh(self, conn):
+        """从数据库增量加载新增的零件 / 供应商 / 成本表，并移除已删除的成本表"""
+        with self._lock:
+            parts = conn.execute("""
+                SELECT part_id, pns, part_desc FROM dim_part WHERE part_id > ? ORDER BY part_id
+            """, [self._part_watermark]).fetchall()
+            suppliers = conn.execute("""
+                SELECT supplier_id, supplier_name FROM dim_supplier WHERE supplier_id > ? ORDER BY supplier_id
+            """, [self._supplier_watermark]).fetchall()
+            cost_sessions = conn.execute("""
+                SELECT session_id, part_number, part_description, supplier_name FROM part_cost_sessions
+            """).fetchall()
+
+            first_new_token = len(self._token_list)
+            for part_id, pns, part_desc in parts:
+                self.add("part", {"id": part_id, "pns": pns, "part_desc": part_desc}, (pns, part_desc))
+            for supplier_id, supplier_name in suppliers:
+                self.add("supplier", {"id": supplier_id, "supplier": supplier_name}, (supplier_name,))
+
+            current = {row[0] for row in cost_sessions}
+            for session_id in self._cost_sessions - current:
+                self._deleted.add(self._doc_ids.pop(("cost_part", session_id)))
+                self._cost_sessions.discard(session_id)
+            for session_id, part_number, part_description, supplier_name in cost_sessions:
+                if session_id in self._cost_sessions:
+                    continue
+                self.add(
+                    "cost_part",
+                    {"id": session_id, "pns": part_number, "part_desc": part_description, "supplier": supplier_name},
+                    (part_number, part_description, supplier_name)
+                )
+                self._cost_sessions.add(session_id)
+
+            self.commit(first_new_token)
+            if parts:
+                self._part_watermark = parts[-1][0]
+            if suppliers:
+                self._supplier_watermark = suppliers[-1][0]
+            self.loaded = True
+
+    def add(self, kind: str, payload: Dict[str, Any], fields: Tuple[Any, ...]):
+        """登记一个文档 (新词条需调用 commit() 后才参与前缀匹配)"""
+        with self._lock:
+            doc_id = len(self._payloads)
+            self._kinds.append(kind)
+            self._payloads.append(payload)
+            self._doc_ids[(kind, payload["id"])] = doc_id
+
+            tokens = set()
+            for text in (_normalize(f) for f in fields):
+                if text:
+                    tokens.add(text)
+                    tokens.update(t for t in _TOKEN_SPLIT.split(text) if t)
+
+            for token in tokens:
+                token_id = self._token_ids.get(token)
+                if token_id is None:
+                    token_id = self._token_ids[token] = len(self._token_list)
+                    self._token_list.append(token)
+                    self._token_docs.append(array("I"))
+                    for trigram in _trigrams(token):
+                        self._token_trigrams.setdefault(trigram, array("I")).append(token_id)
+                self._token_docs[token_id].append(doc_id)
+
+    def commit(self, first_new_token: int = 0):
+        """将 first_new_token 之后新增的词条并入前缀表 (Timsort 对近似有序序列接近线性)"""
+        with self._lock:
+            if first_new_token == 0:
+                self._sorted_tokens = sorted(self._token_list)
+            elif first_new_token < len(self._token_list):
+                self._sorted_tokens.extend(self._token_list[first_new_token:])
+                self._sorted_tokens.sort()
+
+    # ============ 查询 ============
+
+    def search(self, query: str, kinds: Optional[List[str]] = None,
+               limit: int = 20, candidates: Optional[set] = None) -> List[Dict[str, Any]]:
+        """
+        完全 / 前缀 → 子串 → 模糊 依次匹配，前一层已凑满 limit 时不再进入下一层
+
+        得分按层严格分段：完全匹配 3，前缀 2~3，子串 1~2，模糊为 Levenshtein 相似度 (0.7~1)；
+        同层内词条越短 (与查询越接近) 得分越高
+
+        Args:
+            kinds: 限定文档类型
+            candidates: 限定文档号集合 (例如某个 Session 内出现过的零件)
+        """
+        q = _normalize(query)
+        if not q:
+            return []
+        kinds = set(SEARCH_KINDS if kinds is None else kinds)
+        if not kinds:
+            return []
+
+        with self._lock:
+            results: Dict[int, Dict[str, Any]] = {}
+            seen_tokens = set()
+
+            def expand(matches: List[Tuple[float, str, int]]) -> bool:
+                """按得分顺序展开词条对应的文档，凑满 limit 返回 True"""
+                matches.sort(key=lambda m: (-m[0], len(self._token_list[m[2]])))
+                for score, match, token_id in matches:
+                    seen_tokens.add(token_id)
+                    for doc_id in self._token_docs[token_id]:
+                        if (doc_id in results or doc_id in self._deleted or self._kinds[doc_id] not in kinds
+                                or (candidates is not None and doc_id not in candidates)):
+                            continue
+                        results[doc_id] = {"kind": self._kinds[doc_id], **self._payloads[doc_id],
+                                           "score": round(score, 4), "match": match}
+                        if len(results) >= limit:
+                            return True
+                return False
+
+            # 1. 完全 / 前缀
+            matches = []
+            start = bisect.bisect_left(self._sorted_tokens, q)
+            for token in self._sorted_tokens[start:start + PREFIX_MAX_MATCHES]:
+                if not token.startswith(q):
+                    break
+                score, match = (3.0, "exact") if token == q else (2.0 + len(q) / len(token), "prefix")
+                matches.append((score, match, self._token_ids[token]))
+            done = expand(matches)
+
+            query_trigrams = sorted(
+                (t for t in _trigrams(q) if t in self._token_trigrams),
+                key=lambda t: len(self._token_trigrams[t])
+            )
+            if not done and len(query_trigrams) == len(_trigrams(q)) and query_trigrams:
+                # 2. 子串：从最稀有的三元组开始求交集，倒排远大于当前候选时直接核对原文
+                matched = set(self._token_trigrams[query_trigrams[0]])
+                for trigram in query_trigrams[1:]:
+                    postings = self._token_trigrams[trigram]
+                    if not matched or len(postings) > 8 * len(matched):
+                        break
+                    matched.intersection_update(postings)
+                done = expand([
+                    (1.0 + len(q) / len(self._token_list[token_id]), "substring", token_id)
+                    for token_id in matched
+                    if token_id not in seen_tokens and q in self._token_list[token_id]
+                ])
+
+            if not done and query_trigrams:
+                # 3. 模糊：最稀有的若干三元组命中次数最多的词条作为候选，用 Levenshtein 重排
+                seeds = Counter()
+                for trigram in query_trigrams[:FUZZY_SEED_TRIGRAMS]:
+                    seeds.update(self._token_trigrams[trigram])
+                matches = []
+                for token_id, _ in seeds.most_common(FUZZY_MAX_CANDIDATES):
+                    if token_id in seen_tokens:
+                        continue
+                    similarity = ratio(q, self._token_list[token_id])
+                    if similarity >= FUZZY_MIN_RATIO:
+                        matches.append((similarity, "fuzzy", token_id))
+                expand(matches)
+
+            return sorted(results.values(), key=lambda r: -r["score"])
+
+    def documents_for(self, kind: str, keys: set) -> set:
+        """将 (类型, 主键) 映射为文档号集合"""
+        with self._lock:
+            return {self._doc_ids[(kind, key)] for key in keys if (kind, key) in self._doc_ids}
+
+
+# 进程内共享的检索索引 (入库 / 成本表上传后增量刷新)
+search_index = SearchIndex()
+
+
+class SearchService:
+    def __init__(self):
+        self.conn = get_connection()
+
+    def search(self, query: str, kinds: Optional[List[str]] = None, limit: int = 20,
+               session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        检索零件 / 供应商 / 成本表零件
+
+        Args:
+            session_id: 仅返回该采购 Session 中出现的零件与供应商
+        """
+        if not search_index.loaded:
+            search_index.refresh(self.conn)
+
+        candidates = None
+        if session_id:
+            kinds = [k for k in (kinds or SEARCH_KINDS) if k != "cost_part"]
+            if not kinds:
+                # 成本表零件不属于任何 Session，只查它时必然为空
+                return []
+            part_ids, supplier_ids = self.conn.execute("""
+                SELECT list(DISTINCT part_id), list(DISTINCT supplier_id)
+                FROM procurement_facts
+                WHERE session_id = ?
+            """, [session_id]).fetchone()
+            candidates = (search_index.documents_for("part", set(part_ids or []))
+                          | search_index.documents_for("supplier", set(supplier_ids or [])))
+
+        return search_index.search(query, kinds, limit, candidates)
@@ -0,0 +1,222 @@
+from typing import Dict, List, Any, Optional
+from app.database.init import get_connection
+
+# 参与变更判断的字段
+DIFF_FIELDS = ["price", "apv", "target_cost", "gap_percent", "opportunity"]
+CHANGE_TYPES = ["added", "removed", "changed"]
+
+class SessionDiffService:
+    """
+    采购 Session 行级差异服务
+    
+    以 (pns, supplier) 的代理键 (part_id, supplier_id) 做一次哈希全外连接，
+    识别新增 / 移除 / 变更的零件-供应商组合。结果按 Session 对物化到
+    session_diff_rows，之后的分页请求只读缓存表。
+    """
+    
+    def __init__(self):
+        self.conn = get_connection()
+    
+    def get_diff(self, base_session_id: str, compare_session_id: str,
+                 change_types: Optional[List[str]] = None,
+                 page: int = 1, page_size: int = 50) -> Dict[str, Any]:
+        """
+        获取两次 Session 的差异（分页，按 Opportunity 变化绝对值降序）
+        
+        Args:
+            base_session_id: 基准 Session
+            compare_session_id: 对比 Session（通常为新上传的文件）
+            change_types: 过滤变更类型 (added / removed / changed)，默认全部
+            page / page_size: 分页参数
+        """
+        change_types = change_types or CHANGE_TYPES
+        invalid = [t for t in change_types if t not in CHANGE_TYPES]
+        if invalid:
+            raise ValueError(f"Invalid change_type: {', '.join(invalid)}")
+        
+        summary = self._ensure_diff(base_session_id, compare_session_id)
+        
+        placeholders = ",".join(["?"] * len(change_types))
+        filter_params = [base_session_id, compare_session_id] + change_types
+        
+        total = self.conn.execute(f"""
+            SELECT COUNT(*)
+            FROM session_diff_rows
+            WHERE base_session_id = ? AND compare_session_id = ? AND change_type IN ({placeholders})
+        """, filter_params).fetchone()[0]
+        
+        results = self.conn.execute(f"""
+            SELECT 
+                p.pns,
+                COALESCE(d.compare_part_desc, d.base_part_desc),
+                s.supplier_name,
+                c.commodity_name,
+                d.change_type,
+                d.changed_fields,
+                d.base_price, d.compare_price,
+                d.base_apv, d.compare_apv,
+                d.base_target_cost, d.compare_target_cost,
+                d.base_gap_percent, d.compare_gap_percent,
+                d.base_opportunity, d.compare_opportunity,
+                d.opportunity_delta
+            FROM session_diff_rows d
+            JOIN dim_part p ON p.part_id = d.part_id
+            JOIN dim_supplier s ON s.supplier_id = d.supplier_id
+            LEFT JOIN dim_commodity c ON c.commodity_id = d.commodity_id
+            WHERE d.base_session_id = ? AND d.compare_session_id = ? AND d.change_type IN ({placeholders})
+            ORDER BY ABS(d.opportunity_delta) DESC, d.part_id, d.supplier_id
+            LIMIT ? OFFSET ?
+        """, filter_params + [page_size, (page - 1) * page_size]).fetchall()
+        
+        def to_float(value):
+            return float(value) if value is not None else None
+        
+        items = []
+        for row in results:
+            item = {
+                "pns": row[0],
+                "part_desc": row[1],
+                "supplier": row[2],
+                "commodity": row[3],
+                "change_type": row[4],
+                "changed_fields": list(row[5] or [])
+            }
+            for idx, field in enumerate(DIFF_FIELDS):
+                base_value = to_float(row[6 + idx * 2])
+                compare_value = to_float(row[7 + idx * 2])
+                item[field] = {
+                    "base": base_value,
+                    "compare": compare_value,
+                    "delta": (compare_value or 0) - (base_value or 0)
+                }
+            items.append(item)
+        
+        return {
+            "base_session_id": base_session_id,
+            "compare_session_id": compare_session_id,
+            "summary": summary,
+            "page": page,
+            "page_size": page_size,
+            "total": int(total),
+            "items": items
+        }
+    
+    def invalidate_session(self, session_id: str):
+        """删除涉及指定 Session 的差异缓存"""
+        for table in ("session_diff_rows", "session_diffs"):
+            self.conn.execute(
+                f"DELETE FROM {table} WHERE base_session_id = ? OR compare_session_id = ?",
+                [session_id, session_id]
+            )
+    
+    # ============ 私有方法 ============
+    
+    def _ensure_diff(self, base_session_id: str, compare_session_id: str) -> Dict[str, Any]:
+        """差异已缓存时直接返回汇总，否则计算并物化"""
+        summary = self._load_summary(base_session_id, compare_session_id)
+        if summary:
+            return summary
+        
+        found = self.conn.execute(
+            "SELECT COUNT(*) FROM sessions WHERE session_id IN (?, ?)",
+            [base_session_id, compare_session_id]
+        ).fetchone()[0]
+        expected = 1 if base_session_id == compare_session_id else 2
+        if found < expected:
+            raise ValueError("Session not found")
+        
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            self._compute_diff(base_session_id, compare_session_id)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            # 并发请求可能已完成同一对 Session 的计算
+            summary = self._load_summary(base_session_id, compare_session_id)
+            if summary:
+                return summary
+            raise
+        
+        return self._load_summary(base_session_id, compare_session_id)
+    
+    def _compute_diff(self, base_session_id: str, compare_session_id: str):
+        """一次全外连接计算差异并写入缓存表（unchanged 只计数不落行）"""
+        changed_checks = ", ".join(
+            f"CASE WHEN a.{f} IS DISTINCT FROM b.{f} THEN '{f}' END" for f in DIFF_FIELDS
+        )
+        
+        self.conn.execute(f"""
+            CREATE TEMP TABLE diff_staging AS
+            SELECT 
+                COALESCE(a.part_id, b.part_id) as part_id,
+                COALESCE(a.supplier_id, b.supplier_id) as supplier_id,
+                COALESCE(b.commodity_id, a.commodity_id) as commodity_id,
+                CASE 
+                    WHEN a.part_id IS NULL THEN 'added'
+                    WHEN b.part_id IS NULL THEN 'removed'
+                    ELSE 'matched'
+                END as change_type,
+                list_filter([{changed_checks}], x -> x IS NOT NULL) as changed_fields,
+                a.price as base_price, b.price as compare_price,
+                a.apv as base_apv, b.apv as compare_apv,
+                a.target_cost as base_target_cost, b.target_cost as compare_target_cost,
+                a.gap_percent as base_gap_percent, b.gap_percent as compare_gap_percent,
+                a.opportunity as base_opportunity, b.opportunity as compare_opportunity,
+                COALESCE(b.opportunity, 0) - COALESCE(a.opportunity, 0) as opportunity_delta,
+                a.part_desc as base_part_desc, b.part_desc as compare_part_desc
+            FROM (SELECT * FROM procurement_facts WHERE session_id = ?) a
+            FULL OUTER JOIN (SELECT * FROM procurement_facts WHERE session_id = ?) b
+                ON a.part_id = b.part_id AND a.supplier_id = b.supplier_id
+        """, [base_session_id, compare_session_id])
+        
+        try:
+            self.conn.execute("""
+                INSERT INTO session_diff_rows
+                SELECT 
+                    ?, ?, part_id, supplier_id, commodity_id,
+                    CASE WHEN change_type = 'matched' THEN 'changed' ELSE change_type END,
+                    CASE WHEN change_type = 'matched' THEN changed_fields ELSE [] END,
+                    base_price, compare_price, base_apv, compare_apv,
+                    base_target_cost, compare_target_cost, base_gap_percent, compare_gap_percent,
+                    base_opportunity, compare_opportunity, opportunity_delta,
+                    base_part_desc, compare_part_desc
+                FROM diff_staging
+                WHERE change_type <> 'matched' OR len(changed_fields) > 0
+            """, [base_session_id, compare_session_id])
+            
+            self.conn.execute("""
+                INSERT INTO session_diffs (
+                    base_session_id, compare_session_id,
+                    added_count, removed_count, changed_count, unchanged_count, opportunity_delta
+                )
+                SELECT 
+                    ?, ?,
+                    COUNT(*) FILTER (WHERE change_type = 'added'),
+                    COUNT(*) FILTER (WHERE change_type = 'removed'),
+                    COUNT(*) FILTER (WHERE change_type = 'matched' AND len(changed_fields) > 0),
+                    COUNT(*) FILTER (WHERE change_type = 'matched' AND len(changed_fields) = 0),
+                    COALESCE(SUM(opportunity_delta), 0)
+                FROM diff_staging
+            """, [base_session_id, compare_session_id])
+        finally:
+            self.conn.execute("DROP TABLE IF EXISTS diff_staging")
+    
+    def _load_summary(self, base_session_id: str, compare_session_id: str) -> Optional[Dict[str, Any]]:
+        """读取差异汇总"""
+        result = self.conn.execute("""
+            SELECT added_count, removed_count, changed_count, unchanged_count, opportunity_delta, created_at
+            FROM session_diffs
+            WHERE base_session_id = ? AND compare_session_id = ?
+        """, [base_session_id, compare_session_id]).fetchone()
+        
+        if not result:
+            return None
+        
+        return {
+            "added": int(result[0]),
+            "removed": int(result[1]),
+            "changed": int(result[2]),
+            "unchanged": int(result[3]),
+            "opportunity_delta": float(result[4] or 0),
+            "computed_at": result[5]
+        }
@@ -59,6 +59,14 @@ class SessionManager:
             [status, session_id]
         )
     
+    def delete_session(self, session_id: str) -> bool:
+        """删除 Session 元数据，返回是否存在"""
+        result = self.conn.execute(
+            "DELETE FROM sessions WHERE session_id = ? RETURNING session_id",
+            [session_id]
+        ).fetchone()
+        return result is not None
+    
     def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """获取 Session 信息"""
         result = self.conn.execute(
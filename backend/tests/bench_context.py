@@ -0,0 +1,67 @@
+"""
+报告上下文 Token 基准：对比原 JSON (indent=2) 与紧凑表格渲染的 Token 数
+
+对指定 Session (默认最近一个已完成的 Session) 的 dashboard 上下文，
+以及 APV 最大的若干品类的 commodity 上下文，分别统计两种渲染的 Token 数与降幅；
+--budget 给定时同时展示按优先级裁剪后的结果。
+未安装 tiktoken 时使用字符规则估算 (输出中注明)。
+
+用法: python tests/bench_context.py [--session-id ID] [--commodities 3] [--budget 600] [--model gpt-4o]
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database.init import get_connection
+from app.services import context_compactor
+from app.services.context_compactor import compact_context, count_tokens
+from app.services.llm_service import LLMService
+
+
+async def main(args):
+    conn = get_connection()
+    session_id = args.session_id or conn.execute("""
+        SELECT session_id FROM sessions WHERE status = 'completed' ORDER BY upload_time DESC LIMIT 1
+    """).fetchone()[0]
+    commodities = [row[0] for row in conn.execute("""
+        SELECT c.commodity_name
+        FROM agg_session_commodity a
+        JOIN dim_commodity c ON c.commodity_id = a.commodity_id
+        WHERE a.session_id = ?
+        ORDER BY a.total_apv DESC
+        LIMIT ?
+    """, [session_id, args.commodities]).fetchall()]
+
+    counter = "tiktoken" if context_compactor.tiktoken is not None else "heuristic (tiktoken not installed)"
+    print(f"Session {session_id}, token counter: {counter}")
+    print(f"{'context':32} {'json':>7} {'compact':>8} {'saved':>7}" + (f" {'budgeted':>9}  omitted" if args.budget else ""))
+
+    service = LLMService()
+    contexts = [("dashboard", None)] + [("commodity", c) for c in commodities]
+    for context_type, context_value in contexts:
+        data = await service._fetch_context_data(session_id, context_type, context_value)
+        original = count_tokens(json.dumps(data, indent=2, ensure_ascii=False), args.model)
+        text, info = compact_context(data, budget=10 ** 9, model=args.model)
+        line = (f"{(context_type + ':' + (context_value or ''))[:32]:32} {original:7} {info['tokens']:8} "
+                f"{1 - info['tokens'] / original:7.1%}")
+        if args.budget:
+            _, budgeted = compact_context(data, budget=args.budget, model=args.model)
+            line += f" {budgeted['tokens']:9}  {', '.join(budgeted['omitted']) or '-'}"
+        print(line)
+
+    if args.show:
+        print("\n" + compact_context(data, budget=args.budget, model=args.model)[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--session-id")
+    parser.add_argument("--commodities", type=int, default=3, help="统计 APV 最大的前 N 个品类")
+    parser.add_argument("--budget", type=int, help="Token 预算")
+    parser.add_argument("--model", help="用于选择 tiktoken 编码")
+    parser.add_argument("--show", action="store_true", help="打印最后一个上下文的渲染结果")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,41 @@
+"""
+检索索引基准：构造 N 个零件文档，测量建索引耗时与典型查询延迟
+
+用法: python tests/bench_search.py [N]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.search_service import SearchIndex
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+WORDS = ["bracket", "housing", "gear", "shaft", "bearing", "motor", "sensor", "seal",
+         "bolt", "clamp", "column", "rack", "pinion", "ecu", "harness", "cover"]
+
+random.seed(42)
+index = SearchIndex()
+start = time.perf_counter()
+for i in range(N):
+    pns = f"PN{i:08d}"
+    desc = " ".join(random.sample(WORDS, 3)) + f" {random.randint(1, 999)}"
+    index.add("part", {"id": i + 1, "pns": pns, "part_desc": desc}, (pns, desc))
+for i in range(N // 100):
+    name = f"Supplier {i:05d} {random.choice(WORDS).title()} Co"
+    index.add("supplier", {"id": i + 1, "supplier": name}, (name,))
+index.commit()
+print(f"Indexed {len(index)} documents in {time.perf_counter() - start:.1f}s")
+
+queries = ["PN0012345", "pn00999", "12345", "bracket", "brakcet", "supplier 0042", "suplier 00421", "harness clamp"]
+for q in queries:
+    index.search(q)
+    runs = 20
+    start = time.perf_counter()
+    for _ in range(runs):
+        results = index.search(q)
+    elapsed = (time.perf_counter() - start) / runs * 1000
+    top = results[0] if results else {}
+    print(f"{q!r:20} {elapsed:7.2f} ms  hits={len(results):3}  top={top.get('pns') or top.get('supplier')} ({top.get('match')})")
@@ -0,0 +1,77 @@
+"""
+象限统计一致性检查：各象限计数之和必须等于 Session (或品类) 的行数
+
+对指定 Session (默认最近一个已完成的 Session) 及其 APV 最大的品类，
+分别以绝对值、median、分位数及混合阈值 (精确 / 近似) 调用 get_matrix_stats 并核对总数；
+同时确认 nan / inf 等非有限阈值被拒绝。任一检查失败时以非零状态退出。
+
+用法: python tests/check_matrix_stats.py [--session-id ID]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database.init import get_connection
+from app.services.analytics_service import AnalyticsService
+
+THRESHOLDS = [
+    ("5000", "20"),
+    ("median", "median"),
+    ("p75", "p90"),
+    ("5000", "median"),
+    ("p25", "10"),
+    ("1e12", "-5")
+]
+
+
+def main(args) -> int:
+    conn = get_connection()
+    session_id = args.session_id or conn.execute("""
+        SELECT session_id FROM sessions WHERE status = 'completed' ORDER BY upload_time DESC LIMIT 1
+    """).fetchone()[0]
+    commodity = conn.execute("""
+        SELECT c.commodity_name
+        FROM agg_session_commodity a
+        JOIN dim_commodity c ON c.commodity_id = a.commodity_id
+        WHERE a.session_id = ?
+        ORDER BY a.total_apv DESC
+        LIMIT 1
+    """, [session_id]).fetchone()[0]
+    scopes = [
+        (None, conn.execute("SELECT COUNT(*) FROM procurement_facts WHERE session_id = ?",
+                            [session_id]).fetchone()[0]),
+        (commodity, conn.execute("SELECT COUNT(*) FROM procurement_records WHERE session_id = ? AND commodity = ?",
+                                 [session_id, commodity]).fetchone()[0])
+    ]
+
+    service = AnalyticsService()
+    failures = 0
+    print(f"Session {session_id}")
+    for scope, expected in scopes:
+        for apv_threshold, gap_threshold in THRESHOLDS:
+            for approx in (False, True):
+                stats = service.get_matrix_stats(session_id, scope, apv_threshold, gap_threshold, approx=approx)
+                total = sum(q["count"] for q in stats["quadrants"].values())
+                ok = total == expected
+                failures += not ok
+                print(f"{'OK  ' if ok else 'FAIL'} {scope or 'all':20} apv={apv_threshold:7} gap={gap_threshold:7} "
+                      f"approx={approx!s:5} total={total} expected={expected}")
+
+    for bad in ("nan", "inf", "-inf"):
+        try:
+            service.get_matrix_stats(session_id, apv_threshold=bad)
+        except ValueError:
+            print(f"OK   threshold {bad!r} rejected")
+        else:
+            failures += 1
+            print(f"FAIL threshold {bad!r} accepted")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--session-id")
+    sys.exit(main(parser.parse_args()))
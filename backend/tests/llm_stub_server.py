@@ -0,0 +1,106 @@
+"""
+本地 OpenAI 兼容接口桩服务 (用于联调与验证 LLM 客户端连接复用)
+
+- POST /v1/chat/completions：按固定节奏流式返回 tokens 个片段 (stream=false 时一次性返回)；
+  请求 stream_options.include_usage 时在流末尾返回 usage (prompt_tokens 按字符数 / 4 估算)；
+  --finish-reason length 可模拟输出被截断的回复
+- GET  /stats：收到的请求数、按客户端 (地址, 端口) 区分的 TCP 连接数，以及同时进行的最大请求数；
+  连接复用生效时，连续多次生成报告只会占用一条连接；批量任务的并发上限可由 max_active 验证
+- POST /stats/reset：清零统计
+
+用法:
+    python tests/llm_stub_server.py --port 9000 --tokens 50 --delay 0.02
+    报告配置中填写 base_url = http://localhost:9000/v1，api_key / model 任意
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="LLM Stub Server")
+settings = {"tokens": 50, "delay": 0.02, "finish_reason": "stop"}
+stats = {"requests": 0, "connections": set(), "active": 0, "max_active": 0}
+
+
+def _chunk(completion_id: str, model: str, content: str = None, finish_reason: str = None) -> str:
+    delta = {"content": content} if content is not None else {}
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    stats["connections"].add((request.client.host, request.client.port))
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    model = body.get("model", "stub")
+    prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+    words = [f"token{i} " for i in range(settings["tokens"])]
+
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)},
+                         "finish_reason": settings["finish_reason"]}],
+            "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(words),
+                      "total_tokens": prompt_chars // 4 + len(words)}
+        })
+
+    async def stream():
+        stats["active"] += 1
+        stats["max_active"] = max(stats["max_active"], stats["active"])
+        try:
+            for word in words:
+                yield _chunk(completion_id, model, word)
+                await asyncio.sleep(settings["delay"])
+            yield _chunk(completion_id, model, finish_reason=settings["finish_reason"])
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(words),
+                         "total_tokens": prompt_chars // 4 + len(words)}
+                yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model, 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["active"] -= 1
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def get_stats():
+    return {"requests": stats["requests"], "connections": len(stats["connections"]),
+            "active": stats["active"], "max_active": stats["max_active"]}
+
+
+@app.post("/stats/reset")
+async def reset_stats():
+    stats["requests"] = 0
+    stats["connections"].clear()
+    stats["max_active"] = stats["active"]
+    return {"status": "ok"}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--tokens", type=int, default=50, help="每次回复的片段数")
+    parser.add_argument("--delay", type=float, default=0.02, help="片段间隔 (秒)")
+    parser.add_argument("--finish-reason", default="stop", help="回复的 finish_reason (如 length)")
+    args = parser.parse_args()
+    settings.update(tokens=args.tokens, delay=args.delay, finish_reason=args.finish_reason)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
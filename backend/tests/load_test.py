@@ -0,0 +1,138 @@
+"""
+并发上传下的接口延迟压测
+
+在若干个并发"上传 + 确认入库"循环运行期间，持续请求 /health 与分析接口，
+统计各接口 p50 / p95 / p99 延迟，结束时打印 /metrics 线程池统计。
+
+用法 (先启动服务: uvicorn app.main:app):
+    python tests/load_test.py --base-url http://localhost:8000 --uploads 4 --rows 20000 --duration 30
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import random
+import statistics
+import time
+import httpx
+import pandas as pd
+
+FIELDS = [
+    ("PNs", "PNs"), ("Part Description", "PartDescription"), ("Commodity", "Commodity"),
+    ("Supplier", "Supplier"), ("Currency", "Currency"), ("Quantity", "Quantity"), ("Price", "Price"),
+    ("APV", "APV"), ("Covered APV", "CoveredAPV"), ("Target Cost", "TargetCost"),
+    ("Target Spend", "TargetSpend"), ("Gap to Target", "GapToTarget"),
+    ("Opportunity", "Opportunity"), ("Gap %", "GapPercent")
+]
+MAPPING = [{"original_header": h, "mapped_field": f, "is_mapped": True} for h, f in FIELDS]
+
+
+def make_workbook(rows: int, seed: int) -> bytes:
+    """生成采购明细 Excel"""
+    rng = random.Random(seed)
+    data = []
+    for _ in range(rows):
+        pns = f"PN{rng.randint(0, rows // 2):06d}"
+        qty = float(rng.randint(1, 1000))
+        price = round(rng.uniform(1, 100), 2)
+        target = round(price * rng.uniform(0.7, 1.05), 2)
+        apv = round(qty * price, 2)
+        opportunity = round(max(apv - qty * target, 0), 2)
+        data.append([
+            pns, f"Desc {pns}", f"Commodity {rng.randint(0, 11)}", f"Supplier {rng.randint(0, 199)}", "USD",
+            qty, price, apv, apv if rng.random() < 0.8 else 0, target, round(qty * target, 2),
+            round(price - target, 2), opportunity, round(opportunity / apv * 100, 2) if apv else 0
+        ])
+    buffer = io.BytesIO()
+    pd.DataFrame(data, columns=[h for h, _ in FIELDS]).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+async def confirm(client: httpx.AsyncClient, content: bytes, name: str) -> str:
+    response = await client.post("/api/data/confirm", json={
+        "file_hash": hashlib.sha256(content).hexdigest(),
+        "file_name": name,
+        "mapping": MAPPING,
+        "file_content_base64": base64.b64encode(content).decode()
+    })
+    response.raise_for_status()
+    return response.json()["session_id"]
+
+
+async def upload_loop(client, content: bytes, name: str, stop: asyncio.Event, counter: list):
+    """持续上传：解析预览 + 确认入库"""
+    while not stop.is_set():
+        await client.post("/api/upload/", files={"file": (name, content)})
+        await confirm(client, content, name)
+        counter[0] += 1
+
+
+async def probe_loop(client, path: str, stop: asyncio.Event, latencies: list, interval: float):
+    """按固定间隔请求接口并记录延迟"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 500:
+            print(f"{path} -> {response.status_code}")
+        await asyncio.sleep(interval)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def main(args):
+    timeout = httpx.Timeout(600.0)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client:
+        print(f"Generating {args.rows}-row workbook ...")
+        content = make_workbook(args.rows, seed=1)
+        session_id = await confirm(client, make_workbook(2000, seed=2), "load_test_base_2024.xlsx")
+
+        endpoints = [
+            "/health",
+            f"/api/analytics/summary/{session_id}",
+            f"/api/analytics/bundle/{session_id}",
+            f"/api/analytics/matrix-stats/{session_id}",
+            f"/api/analytics/top/projects/{session_id}"
+        ]
+        latencies = {path: [] for path in endpoints}
+        stop = asyncio.Event()
+        uploads = [0]
+
+        tasks = [
+            asyncio.create_task(upload_loop(client, content, f"load_test_{i}_2024.xlsx", stop, uploads))
+            for i in range(args.uploads)
+        ]
+        tasks += [
+            asyncio.create_task(probe_loop(client, path, stop, latencies[path], args.interval))
+            for path in endpoints
+            for _ in range(args.probes)
+        ]
+
+        print(f"Running {args.uploads} concurrent uploads for {args.duration}s ...")
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        print(f"\nCompleted uploads: {uploads[0]}")
+        print(f"{'endpoint':55} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9}  (ms)")
+        for path, values in latencies.items():
+            if values:
+                print(f"{path:55} {len(values):6} {statistics.median(values):9.1f} "
+                      f"{percentile(values, 95):9.1f} {percentile(values, 99):9.1f}")
+
+        print("\n/metrics:", (await client.get("/metrics")).json())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--uploads", type=int, default=4, help="并发上传数")
+    parser.add_argument("--rows", type=int, default=20000, help="每个上传文件的行数")
+    parser.add_argument("--duration", type=float, default=30, help="压测时长 (秒)")
+    parser.add_argument("--probes", type=int, default=2, help="每个接口的并发探测数")
+    parser.add_argument("--interval", type=float, default=0.05, help="探测间隔 (秒)")
+    asyncio.run(main(parser.parse_args()))
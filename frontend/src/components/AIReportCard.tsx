@@ -47,7 +47,20 @@ const SYSTEM_PROMPTS = {
 (Do specific suppliers have significantly higher gaps than others?)
 
 ### 4. Negotiation Prep
-(For the top supplier: Generate a negotiation script based on their total spend and gap.)`
+(For the top supplier: Generate a negotiation script based on their total spend and gap.)`,
+
+    supplier: `## Supplier Review
+### 1. Relationship Overview
+(Total spend, ranking and share of our spend. How important is this supplier to us, and we to them?)
+
+### 2. Commodity Position
+(In which commodities is this supplier dominant? Check share of commodity spend and rank.)
+
+### 3. Single-Source Exposure
+(How much spend has no alternative supplier? Assess the risk.)
+
+### 4. Negotiation Prep
+(Top PNs by opportunity and a negotiation approach based on the gap.)`
 };
 
 export const AIReportCard: React.FC<Props> = ({ sessionId, contextType, contextValue }) => {
@@ -97,7 +110,7 @@ export const AIReportCard: React.FC<Props> = ({ sessionId, contextType, contextV
         setCurrentPrompt(defaultPrompt);
     };
 
-    const handleGenerate = async () => {
+    const handleGenerate = async (forceRefresh: boolean = false) => {
         if (!config.api_key) {
             setIsSettingsOpen(true);
             return;
@@ -114,7 +127,9 @@ export const AIReportCard: React.FC<Props> = ({ sessionId, contextType, contextV
                 context_type: contextType,
                 context_value: contextValue,
                 config: config,
-                prompt_template: currentPrompt
+                prompt_template: currentPrompt,
+                force_refresh: forceRefresh,
+                mode: contextType === 'dashboard' ? 'auto' : undefined
             },
             (chunk) => {
                 setReport(prev => prev + chunk);
@@ -159,7 +174,7 @@ export const AIReportCard: React.FC<Props> = ({ sessionId, contextType, contextV
                         <Button
                             type="text"
                             icon={<ReloadOutlined />}
-                            onClick={handleGenerate}
+                            onClick={() => handleGenerate(true)}
                         >
                             Regenerate
                         </Button>
@@ -190,7 +205,7 @@ export const AIReportCard: React.FC<Props> = ({ sessionId, contextType, contextV
             {!report && !generating && !error && !showPromptEditor && (
                 <div style={{ textAlign: 'center', padding: '20px 0', color: '#999' }}>
                     <p>Click the button below to generate an AI-powered analysis of this data.</p>
-                    <Button type="primary" onClick={handleGenerate} icon={<RobotOutlined />}>
+                    <Button type="primary" onClick={() => handleGenerate()} icon={<RobotOutlined />}>
                         Generate Report
                     </Button>
                 </div>
@@ -2,6 +2,7 @@ import React, { useEffect, useRef, useState } from 'react';
 import * as echarts from 'echarts';
 import { InputNumber, Space, Typography, Tooltip } from 'antd';
 import { InfoCircleOutlined } from '@ant-design/icons';
+import type { MatrixGrid } from '../types/analytics';
 
 const { Text } = Typography;
 
@@ -17,6 +18,9 @@ interface MatrixData {
 
 interface Props {
     data: MatrixData[];
+    // 降采样模式：data 只含 Opportunity 最大的 Top-N，其余 PN 以密度网格给出
+    grid?: MatrixGrid;
+    totalPoints?: number;
 }
 
 // 计算中位数
@@ -27,7 +31,22 @@ const calculateMedian = (values: number[]) => {
     return sorted.length % 2 !== 0 ? sorted[mid] : (sorted[mid - 1] + sorted[mid]) / 2;
 };
 
-export const OpportunityMatrix: React.FC<Props> = ({ data }) => {
+// 加权中位数 (网格单元按中心值、以 PN 数为权重参与计算)
+const calculateWeightedMedian = (items: { value: number; weight: number }[]) => {
+    const total = items.reduce((sum, item) => sum + item.weight, 0);
+    if (total === 0) return 0;
+    const sorted = [...items].sort((a, b) => a.value - b.value);
+    let acc = 0;
+    for (const item of sorted) {
+        acc += item.weight;
+        if (acc >= total / 2) return item.value;
+    }
+    return sorted[sorted.length - 1].value;
+};
+
+const cellCenter = (edges: number[], index: number) => (edges[index] + edges[index + 1]) / 2;
+
+export const OpportunityMatrix: React.FC<Props> = ({ data, grid, totalPoints }) => {
     const chartRef = useRef<HTMLDivElement>(null);
     const chartInstance = useRef<echarts.ECharts | null>(null);
 
@@ -35,16 +54,29 @@ export const OpportunityMatrix: React.FC<Props> = ({ data }) => {
     const [apvThreshold, setApvThreshold] = useState<number>(0);
     const [gapThreshold, setGapThreshold] = useState<number>(0);
 
+    const cells = grid?.cells || [];
+
     // 初始化默认阈值（中位数）
     useEffect(() => {
         if (data.length > 0) {
-            const apvMedian = calculateMedian(data.map(d => d.apv));
-            const gapMedian = calculateMedian(data.map(d => d.gap_percent));
+            let apvMedian = calculateMedian(data.map(d => d.apv));
+            let gapMedian = calculateMedian(data.map(d => d.gap_percent));
+            if (grid && cells.length) {
+                // 降采样时 Top-N 偏向大额 PN，用 Top-N + 网格的全体分布估算中位数
+                apvMedian = calculateWeightedMedian([
+                    ...data.map(d => ({ value: d.apv, weight: 1 })),
+                    ...cells.map(c => ({ value: cellCenter(grid.apv_edges, c.x), weight: c.count }))
+                ]);
+                gapMedian = calculateWeightedMedian([
+                    ...data.map(d => ({ value: d.gap_percent, weight: 1 })),
+                    ...cells.map(c => ({ value: cellCenter(grid.gap_edges, c.y), weight: c.count }))
+                ]);
+            }
             // 如果从未设置过（初始加载），则设置默认值
             if (apvThreshold === 0) setApvThreshold(Math.round(apvMedian));
             if (gapThreshold === 0) setGapThreshold(Number(gapMedian.toFixed(1)));
         }
-    }, [data]);
+    }, [data, grid]);
 
     useEffect(() => {
         if (!chartRef.current || !data.length) return;
@@ -78,9 +110,15 @@ export const OpportunityMatrix: React.FC<Props> = ({ data }) => {
             };
         });
 
+        // 其余 PN 的密度网格：以单元中心绘制方块，大小按 PN 数对数缩放
+        const densityData = grid ? cells.map(cell => ({
+            value: [cellCenter(grid.apv_edges, cell.x), cellCenter(grid.gap_edges, cell.y), cell.count],
+            cell
+        })) : [];
+
         // 计算坐标轴范围 (增加一点 padding)
-        const apvValues = data.map(d => d.apv);
-        const gapValues = data.map(d => d.gap_percent);
+        const apvValues = data.map(d => d.apv).concat(grid && cells.length ? [grid.apv_edges[grid.apv_edges.length - 1]] : []);
+        const gapValues = data.map(d => d.gap_percent).concat(grid && cells.length ? [grid.gap_edges[grid.gap_edges.length - 1]] : []);
         const maxApv = Math.max(...apvValues) * 1.1;
         const maxGap = Math.max(...gapValues) * 1.1;
 
@@ -91,6 +129,14 @@ export const OpportunityMatrix: React.FC<Props> = ({ data }) => {
                 borderWidth: 0,
                 textStyle: { color: '#FFFFFF' },
                 formatter: (params: any) => {
+                    if (params.data.cell) {
+                        const cell = params.data.cell;
+                        return `
+            <strong>${cell.count.toLocaleString()} other PNs</strong><br/>
+            APV: $${cell.total_apv.toLocaleString()}<br/>
+            Opportunity: $${cell.total_opportunity.toLocaleString()}
+          `;
+                    }
                     const item = params.data.metadata;
                     return `
             <strong>PN: ${item.pns}</strong><br/>
@@ -145,8 +191,18 @@ export const OpportunityMatrix: React.FC<Props> = ({ data }) => {
                 axisLabel: { formatter: '{value}%' }
             },
             series: [
+                {
+                    name: 'Other PNs',
+                    type: 'scatter',
+                    symbol: 'rect',
+                    symbolSize: (value: number[]) => Math.min(4 + Math.log2(value[2] + 1) * 2, 16),
+                    data: densityData,
+                    itemStyle: { color: '#B0B0B0', opacity: 0.35 },
+                    z: 1
+                },
                 {
                     type: 'scatter',
+                    z: 2,
                     symbolSize: (data: number[]) => {
                         const opportunity = data[2]; // Index 2 is Opportunity Amount
                         if (opportunity <= 0) return 6;
@@ -206,7 +262,7 @@ export const OpportunityMatrix: React.FC<Props> = ({ data }) => {
             chart.dispose();
             chartInstance.current = null;
         };
-    }, [data, apvThreshold, gapThreshold]);
+    }, [data, grid, apvThreshold, gapThreshold]);
 
     return (
         <div>
@@ -245,6 +301,11 @@ export const OpportunityMatrix: React.FC<Props> = ({ data }) => {
 
                 {/* 图例说明 */}
                 <Space size="large">
+                    {grid && totalPoints !== undefined && totalPoints > data.length && (
+                        <Text type="secondary" style={{ fontSize: 12 }}>
+                            Top {data.length.toLocaleString()} of {totalPoints.toLocaleString()} PNs, others as density
+                        </Text>
+                    )}
                     <Space size={4}><div style={{ width: 8, height: 8, borderRadius: '50%', background: '#E31837' }}></div><Text style={{ fontSize: 12 }}>Core Opp</Text></Space>
                     <Space size={4}><div style={{ width: 8, height: 8, borderRadius: '50%', background: '#FF7F50' }}></div><Text style={{ fontSize: 12 }}>Potential</Text></Space>
                     <Space size={4}><div style={{ width: 8, height: 8, borderRadius: '50%', background: '#2196F3' }}></div><Text style={{ fontSize: 12 }}>Stable</Text></Space>
@@ -50,18 +50,16 @@ export const CommodityDetail: React.FC = () => {
         const fetchData = async () => {
             setLoading(true);
             try {
-                const [kpiData, suppliersResponse, matrix, concentration] = await Promise.all([
-                    analyticsService.getCommodityKPI(sessionId, commodityName),
-                    analyticsService.getCommodityTopSuppliers(sessionId, commodityName, 5),
-                    analyticsService.getOpportunityMatrix(sessionId, commodityName),
-                    analyticsService.getSupplierConcentration(sessionId, commodityName)
+                const [bundle, matrix] = await Promise.all([
+                    analyticsService.getCommodityBundle(sessionId, commodityName, 5),
+                    analyticsService.getOpportunityMatrix(sessionId, commodityName)
                 ]);
 
-                setKpi(kpiData);
-                const suppliers = suppliersResponse as unknown as SupplierData[];
+                setKpi(bundle.kpi);
+                const suppliers = bundle.top_suppliers as unknown as SupplierData[];
                 setTopSuppliers(suppliers);
                 setMatrixData(matrix as any);
-                setConcentrationData(concentration);
+                setConcentrationData(bundle.concentration);
 
                 // 加载每个 Supplier 的 Top 10 PNs
                 const pnsPromises = suppliers.map((s: SupplierData) =>
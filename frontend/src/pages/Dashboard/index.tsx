@@ -6,7 +6,7 @@ import { OpportunityMatrix } from '../../components/OpportunityMatrix';
 import { ConcentrationChart } from '../../components/ConcentrationChart';
 import { AIReportCard } from '../../components/AIReportCard';
 import { analyticsService } from '../../services/analyticsService';
-import type { KPISummary, CommodityData, SupplierRank, ProjectRank } from '../../types/analytics';
+import type { KPISummary, CommodityData, SupplierRank, ProjectRank, MatrixGrid } from '../../types/analytics';
 import { useSearchParams, useNavigate } from 'react-router-dom';
 import { Button, message, Space } from 'antd';
 import { DownloadOutlined, DollarOutlined } from '@ant-design/icons';
@@ -28,6 +28,8 @@ export const Dashboard: React.FC = () => {
     const [topSuppliers, setTopSuppliers] = useState<SupplierRank[]>([]);
     const [topProjects, setTopProjects] = useState<ProjectRank[]>([]);
     const [matrixData, setMatrixData] = useState<any[]>([]);
+    const [matrixGrid, setMatrixGrid] = useState<MatrixGrid | undefined>();
+    const [matrixTotal, setMatrixTotal] = useState<number | undefined>();
     const [concentrationData, setConcentrationData] = useState<any>(null);
 
     useEffect(() => {
@@ -37,20 +39,20 @@ export const Dashboard: React.FC = () => {
         const fetchData = async () => {
             setLoading(true);
             try {
-                const [sum, com, sup, proj, matrix, concentration] = await Promise.all([
-                    analyticsService.getSummary(sessionId),
-                    analyticsService.getCommodityOverview(sessionId),
-                    analyticsService.getTopSuppliers(sessionId),
-                    analyticsService.getTopProjects(sessionId),
-                    analyticsService.getOpportunityMatrix(sessionId),
-                    analyticsService.getSupplierConcentration(sessionId)
+                // KPI / 品类 / Top 榜单 / 集中度由 bundle 接口单次扫描返回；
+                // 全局象限图使用降采样模式 (Top-N 气泡 + 密度网格)，返回体与 Session 行数无关
+                const [bundle, matrix] = await Promise.all([
+                    analyticsService.getDashboardBundle(sessionId),
+                    analyticsService.getOpportunityMatrixBinned(sessionId)
                 ]);
-                setSummary(sum);
-                setCommodityData(com);
-                setTopSuppliers(sup);
-                setTopProjects(proj);
-                setMatrixData(matrix as any);
-                setConcentrationData(concentration);
+                setSummary(bundle.kpi);
+                setCommodityData(bundle.commodities || []);
+                setTopSuppliers(bundle.top_suppliers);
+                setTopProjects(bundle.top_projects);
+                setMatrixData(matrix.points);
+                setMatrixGrid(matrix.grid);
+                setMatrixTotal(matrix.total_points);
+                setConcentrationData(bundle.concentration);
             } catch (error) {
                 console.error("Failed to fetch dashboard data", error);
             } finally {
@@ -190,7 +192,7 @@ export const Dashboard: React.FC = () => {
                         <Row gutter={24} style={{ marginTop: 24 }}>
                             <Col span={12}>
                                 <Card title="Opportunity Matrix">
-                                    <OpportunityMatrix data={matrixData} />
+                                    <OpportunityMatrix data={matrixData} grid={matrixGrid} totalPoints={matrixTotal} />
                                 </Card>
                             </Col>
                             <Col span={12}>
@@ -1,7 +1,19 @@
 import api from './api';
-import type { KPISummary, CommodityData, SupplierRank, ProjectRank } from '../types/analytics';
+import type { KPISummary, CommodityData, SupplierRank, ProjectRank, DashboardBundle, BinnedMatrix } from '../types/analytics';
 
 export const analyticsService = {
+    getDashboardBundle: async (sessionId: string, supplierLimit: number = 20, projectLimit: number = 20): Promise<DashboardBundle> => {
+        return api.get(`/analytics/bundle/${sessionId}`, {
+            params: { supplier_limit: supplierLimit, project_limit: projectLimit }
+        });
+    },
+
+    getCommodityBundle: async (sessionId: string, commodity: string, supplierLimit: number = 5, projectLimit: number = 20): Promise<DashboardBundle> => {
+        return api.get(`/analytics/commodity/${sessionId}/${encodeURIComponent(commodity)}/bundle`, {
+            params: { supplier_limit: supplierLimit, project_limit: projectLimit }
+        });
+    },
+
     getSummary: async (sessionId: string): Promise<KPISummary> => {
         return api.get(`/analytics/summary/${sessionId}`);
     },
@@ -36,6 +48,13 @@ export const analyticsService = {
         });
     },
 
+    getOpportunityMatrixBinned: async (sessionId: string, commodity?: string, topN: number = 500, bins: number = 40): Promise<BinnedMatrix> => {
+        // 气泡图 X 轴为线性轴，分箱也按线性 APV
+        return api.get(`/analytics/opportunity-matrix/${sessionId}`, {
+            params: { mode: 'binned', top_n: topN, bins, apv_scale: 'linear', ...(commodity ? { commodity } : {}) }
+        });
+    },
+
     getSupplierConcentration: async (sessionId: string, commodity?: string) => {
         return api.get(`/analytics/concentration/${sessionId}`, {
             params: commodity ? { commodity } : {}
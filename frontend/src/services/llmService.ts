@@ -2,43 +2,129 @@ import type { ReportRequest } from '../types/llm';
 
 const API_BASE_URL = '/api'; // Vite proxy handles the rest
 
+// 断线续传的最大重试次数与基础间隔 (毫秒)
+const MAX_RESUME_ATTEMPTS = 5;
+const RESUME_BASE_DELAY = 1000;
+
+interface SSEEvent {
+    id?: string;
+    event?: string;
+    data: string;
+}
+
+/**
+ * 读取 SSE 响应体，逐个回调事件；注释行 (心跳) 忽略。
+ * 多行 data 按 \n 拼回。
+ */
+const readEvents = async (body: ReadableStream<Uint8Array>, onEvent: (event: SSEEvent) => void) => {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    const dispatch = (block: string) => {
+        const event: SSEEvent = { data: '' };
+        const data: string[] = [];
+        for (const line of block.split('\n')) {
+            if (!line || line.startsWith(':')) continue;
+            const index = line.indexOf(':');
+            const field = index === -1 ? line : line.slice(0, index);
+            let value = index === -1 ? '' : line.slice(index + 1);
+            if (value.startsWith(' ')) value = value.slice(1);
+            if (field === 'data') data.push(value);
+            else if (field === 'id') event.id = value;
+            else if (field === 'event') event.event = value;
+        }
+        if (data.length || event.event) {
+            event.data = data.join('\n');
+            onEvent(event);
+        }
+    };
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true }).replace(/\r\n?/g, '\n');
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary !== -1) {
+            dispatch(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+            boundary = buffer.indexOf('\n\n');
+        }
+    }
+};
+
 export const llmService = {
+    /**
+     * 生成流式报告。连接中断时携带 Last-Event-ID 续传 (服务端从缓冲补发，不会重新调用模型)。
+     */
     generateReportStream: async (request: ReportRequest, onChunk: (chunk: string) => void, onError: (error: string) => void, onComplete: () => void) => {
-        try {
-            const response = await fetch(`${API_BASE_URL}/llm/generate-report`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(request),
-            });
-
-            if (!response.ok) {
-                const errorText = await response.text();
-                throw new Error(errorText || response.statusText);
-            }
+        let streamId: string | null = null;
+        let lastEventId = '';
+        let finished = false;
+        let expired = false;
+        let attempts = 0;
 
-            if (!response.body) {
-                throw new Error("No response body");
+        const handleEvent = (event: SSEEvent) => {
+            if (event.event === 'done') {
+                finished = true;
+            } else if (event.event === 'reset') {
+                expired = true;
+            } else if (!event.event) {
+                if (event.id) lastEventId = event.id;
+                onChunk(event.data);
+                attempts = 0;
             }
+        };
 
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder();
+        while (!finished) {
+            try {
+                const response = streamId
+                    ? await fetch(`${API_BASE_URL}/llm/streams/${streamId}`, {
+                        headers: lastEventId ? { 'Last-Event-ID': lastEventId } : {},
+                    })
+                    : await fetch(`${API_BASE_URL}/llm/generate-report`, {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json',
+                        },
+                        body: JSON.stringify(request),
+                    });
 
-            while (true) {
-                const { done, value } = await reader.read();
-                if (done) {
-                    break;
+                if (!response.ok) {
+                    const errorText = await response.text();
+                    onError(errorText || response.statusText);
+                    return;
                 }
-                const chunk = decoder.decode(value, { stream: true });
-                onChunk(chunk);
-            }
 
-            onComplete();
+                if (!response.body) {
+                    throw new Error("No response body");
+                }
+
+                streamId = streamId || response.headers.get('X-Report-Stream-Id');
+                await readEvents(response.body, handleEvent);
+            } catch (error: any) {
+                console.error("LLM Generation Error:", error);
+                // 尚未拿到流 ID 时无法续传
+                if (!streamId) {
+                    onError(error.message || "Failed to generate report");
+                    return;
+                }
+            }
 
-        } catch (error: any) {
-            console.error("LLM Generation Error:", error);
-            onError(error.message || "Failed to generate report");
+            if (expired) {
+                onError('Connection lost for too long, please regenerate the report');
+                return;
+            }
+            if (!finished) {
+                attempts += 1;
+                if (!streamId || attempts > MAX_RESUME_ATTEMPTS) {
+                    onError('Report stream interrupted');
+                    return;
+                }
+                await new Promise(resolve => setTimeout(resolve, RESUME_BASE_DELAY * attempts));
+            }
         }
+
+        onComplete();
     }
 };
@@ -33,3 +33,53 @@ export interface ProjectRank {
     opportunity: number;
     gap_percent: number;
 }
+
+export interface ConcentrationData {
+    cr3: number;
+    cr5: number;
+    hhi: number;
+    total_suppliers: number;
+    total_apv?: number;
+    top_suppliers: { supplier: string; apv: number; share: number }[];
+}
+
+export interface DashboardBundle {
+    kpi: KPISummary;
+    commodities?: CommodityData[];
+    top_suppliers: SupplierRank[];
+    top_projects: ProjectRank[];
+    concentration: ConcentrationData;
+}
+
+export interface MatrixPoint {
+    pns: string;
+    part_desc: string;
+    supplier: string;
+    commodity: string;
+    apv: number;
+    gap_percent: number;
+    opportunity: number;
+}
+
+export interface MatrixGridCell {
+    x: number;
+    y: number;
+    count: number;
+    total_apv: number;
+    total_opportunity: number;
+}
+
+export interface MatrixGrid {
+    bins: number;
+    apv_scale: 'log' | 'linear';
+    apv_edges: number[];
+    gap_edges: number[];
+    cells: MatrixGridCell[];
+}
+
+export interface BinnedMatrix {
+    mode: 'binned';
+    total_points: number;
+    points: MatrixPoint[];
+    grid: MatrixGrid;
+}
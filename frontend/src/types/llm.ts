@@ -12,4 +12,6 @@ export interface ReportRequest {
     context_value?: string;
     prompt_template?: string;
     config: LLMConfig;
+    force_refresh?: boolean; // 跳过报告缓存，重新调用 LLM
+    mode?: 'standard' | 'hierarchical' | 'auto'; // dashboard 报告：auto 在品类很多时分组摘要后汇总
 }